@@ -0,0 +1,83 @@
+import os
+import time
+import asyncio
+import hashlib
+import threading
+from collections import OrderedDict
+from fastapi.concurrency import run_in_threadpool
+import firebase_admin
+from firebase_admin import auth
+
+class FirebaseTokenVerifier:
+    """Verifies Firebase ID tokens off the event loop and caches the results until each token expires"""
+
+    def __init__(self, max_entries=None, max_ttl=None, cert_refresh_interval=None):
+        self.max_entries = int(max_entries or os.getenv('AUTH_CACHE_SIZE', 10000))
+        self.max_ttl = int(max_ttl or os.getenv('AUTH_CACHE_TTL', 3600))
+        self.cert_refresh_interval = int(cert_refresh_interval or os.getenv('FIREBASE_CERT_REFRESH_INTERVAL', 1800))
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self._refresher = None
+        self.hits = 0
+        self.misses = 0
+
+    async def verify(self, token):
+        """Return the decoded token, verifying it in the thread pool only on a cache miss"""
+        key = hashlib.sha256(token.encode('utf-8')).hexdigest()
+        now = time.time()
+
+        with self._lock:
+            entry = self._cache.get(key)
+            if entry is not None:
+                decoded, expires_at = entry
+                if expires_at > now:
+                    self._cache.move_to_end(key)
+                    self.hits += 1
+                    return decoded
+                del self._cache[key]
+            self.misses += 1
+
+        decoded = await run_in_threadpool(auth.verify_id_token, token)
+
+        # Never trust a cached token past its own expiry
+        expires_at = min(decoded.get('exp', now), now + self.max_ttl)
+        with self._lock:
+            self._cache[key] = (decoded, expires_at)
+            while len(self._cache) > self.max_entries:
+                self._cache.popitem(last=False)
+        return decoded
+
+    def prefetch_certs(self):
+        """
+        Fetch Google's token signing certs through the SDK's own caching HTTP request,
+        so verification never waits on a cert download (relies on SDK internals - best effort)
+        """
+        client = auth._get_client(firebase_admin.get_app())
+        verifier = client._token_verifier
+        verifier.request(verifier.id_token_verifier.cert_url, method='GET')
+
+    async def start(self):
+        """Prefetch signing certs now and keep refreshing them in the background"""
+        self._refresher = asyncio.create_task(self._refresh_certs_periodically())
+
+    async def stop(self):
+        if self._refresher is not None:
+            self._refresher.cancel()
+            await asyncio.gather(self._refresher, return_exceptions=True)
+            self._refresher = None
+
+    async def _refresh_certs_periodically(self):
+        while True:
+            try:
+                await run_in_threadpool(self.prefetch_certs)
+            except Exception as e:
+                print(f"⚠️  Could not prefetch Firebase signing certs: {e}")
+            await asyncio.sleep(self.cert_refresh_interval)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "entries": len(self._cache)
+            }
@@ -0,0 +1,300 @@
+"""
+Gemini client benchmarks against a local stub of the generateContent REST API
+
+    python bench_gemini.py summarize [--requests 200] [--concurrency 20]
+    python bench_gemini.py bulk --corpus tests/fixtures/classifier_corpus.json [--repeat 10]
+
+The stub answers every request after a fixed latency and charges a one-off setup delay per new
+connection (standing in for the TLS handshake to Google), so connection reuse shows up in the numbers.
+"""
+import argparse
+import asyncio
+import json
+import os
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import httpx
+import requests
+from fastapi import FastAPI
+from pydantic import BaseModel
+
+STUB_ANALYSIS = {
+    "summary": "Stub summary.",
+    "key_points": ["point"],
+    "action_items": [],
+    "urgency": "low",
+    "category": "work",
+    "sentiment": "neutral"
+}
+
+BULK_LABEL_RE = re.compile(r'^--- EMAIL (E\d+) ---$', re.MULTILINE)
+
+
+class StubGemini:
+    """Local stand-in for Gemini's generateContent endpoint that counts requests and connections"""
+
+    def __init__(self, latency=0.05, connect_latency=0.03):
+        self.latency = latency
+        self.connect_latency = connect_latency
+        self.requests = 0
+        self.connections = 0
+        self._lock = threading.Lock()
+        self._server = None
+
+    @property
+    def api_base(self):
+        host, port = self._server.server_address
+        return f"http://{host}:{port}/v1beta"
+
+    def respond(self, body):
+        """Build the response text for a request body (one analysis, or one per packed email)"""
+        prompt = body['contents'][0]['parts'][0]['text']
+        schema = body.get('generationConfig', {}).get('responseSchema', {})
+        if schema.get('type') == 'ARRAY':
+            return json.dumps([dict(STUB_ANALYSIS, id=label) for label in BULK_LABEL_RE.findall(prompt)])
+        return json.dumps(STUB_ANALYSIS)
+
+    def start(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def setup(self):
+                with stub._lock:
+                    stub.connections += 1
+                time.sleep(stub.connect_latency)
+                super().setup()
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+                with stub._lock:
+                    stub.requests += 1
+                time.sleep(stub.latency)
+
+                payload = json.dumps({
+                    'candidates': [{'content': {'parts': [{'text': stub.respond(body)}]}}],
+                    'usageMetadata': {'totalTokenCount': 100}
+                }).encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, *args):
+                pass
+
+        class Server(ThreadingHTTPServer):
+            request_queue_size = 128  # The default backlog of 5 drops bursts of concurrent connects
+
+        self._server = Server(('127.0.0.1', 0), Handler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, name="stub-gemini", daemon=True).start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def make_agent(api_base):
+    """EmailAgent pointed at the stub, with rate limits out of the way"""
+    os.environ.setdefault('GOOGLE_API_KEY', 'bench-key')
+    os.environ['GEMINI_API_BASE'] = api_base
+    os.environ['GEMINI_RPM'] = '1000000'
+    os.environ['GEMINI_TPM'] = '1000000000'
+    os.environ.pop('SUMMARY_CACHE_PATH', None)
+
+    from email_agent import EmailAgent
+    return EmailAgent()
+
+
+def legacy_summarize(agent, email_data):
+    """The previous per-call path: a fresh requests.post (no session) per model attempt, on the caller's thread"""
+    data = {"contents": [{"parts": [{"text": agent._summary_prompt(email_data)}]}]}
+    for model in agent.models:
+        response = requests.post(
+            f"{agent.api_base}/models/{model}:generateContent?key={agent.api_key}",
+            headers={'Content-Type': 'application/json'},
+            json=data,
+            timeout=30
+        )
+        if response.status_code == 200:
+            text = response.json()['candidates'][0]['content']['parts'][0]['text']
+            return agent.parser.parse_analysis(text)
+    return agent._error_analysis()
+
+
+class SummarizeRequest(BaseModel):
+    email_sender: str
+    email_subject: str
+    email_body: str
+
+
+def make_app(agent):
+    """Minimal /api/summarize app (no auth or Firestore) with the old and new Gemini paths side by side"""
+    app = FastAPI()
+
+    def email_data(request):
+        return {
+            'sender': request.email_sender,
+            'subject': request.email_subject,
+            'body': request.email_body,
+            'date': '2024-01-01T00:00:00'
+        }
+
+    @app.post("/api/summarize")
+    async def summarize(request: SummarizeRequest):
+        return await agent.summarize_email_async(email_data(request))
+
+    @app.post("/api/summarize-legacy")
+    async def summarize_legacy(request: SummarizeRequest):
+        # Like the old handler: a blocking call straight from the async endpoint
+        return legacy_summarize(agent, email_data(request))
+
+    return app
+
+
+async def drive(app, path, total, concurrency):
+    """Send `total` distinct summarize requests with `concurrency` in flight - returns (seconds, failures)"""
+    counter = iter(range(total))
+    failures = 0
+
+    async def worker(client):
+        nonlocal failures
+        for idx in counter:
+            response = await client.post(path, json={
+                'email_sender': 'alice@example.com',
+                'email_subject': f'Status update {idx}',
+                'email_body': f'Update number {idx} for the weekly sync.'
+            })
+            if response.status_code != 200 or response.json().get('summary') != STUB_ANALYSIS['summary']:
+                failures += 1
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url='http://bench', timeout=None) as client:
+        started = time.perf_counter()
+        await asyncio.gather(*(worker(client) for _ in range(concurrency)))
+        return time.perf_counter() - started, failures
+
+
+def bench_summarize(total=200, concurrency=20, latency=0.05, connect_latency=0.03):
+    """Requests/sec through /api/summarize for the pooled async client and the old per-call path"""
+    results = {}
+    with StubGemini(latency, connect_latency) as stub:
+        agent = make_agent(stub.api_base)
+        app = make_app(agent)
+
+        async def run():
+            for name, path in (('per-call', '/api/summarize-legacy'), ('pooled', '/api/summarize')):
+                before = (stub.requests, stub.connections)
+                seconds, failures = await drive(app, path, total, concurrency)
+                results[name] = {
+                    'seconds': seconds,
+                    'rps': total / seconds,
+                    'failures': failures,
+                    'gemini_requests': stub.requests - before[0],
+                    'connections': stub.connections - before[1]
+                }
+            await agent.aclose()
+
+        asyncio.run(run())
+    return results
+
+
+def load_emails(path, repeat=1):
+    """Corpus emails (sender, subject, body) repeated with distinct IDs and subjects so none hit the cache"""
+    with open(path, 'r') as corpus_file:
+        corpus = json.load(corpus_file)
+    return [
+        {
+            'id': f"{email['id']}-{copy}",
+            'sender': email['sender'],
+            'subject': f"{email['subject']} #{copy}",
+            'body': email['body'],
+            'date': '2024-01-01T00:00:00'
+        }
+        for copy in range(repeat)
+        for email in corpus
+    ]
+
+
+def bench_bulk(emails, token_budget=None, latency=0.05, connect_latency=0.03):
+    """Wall-clock time and Gemini request count for packed bulk summarization vs one request per email"""
+    results = {}
+    with StubGemini(latency, connect_latency) as stub:
+        async def per_email(agent):
+            analyses = await asyncio.gather(*(agent.summarize_email_async(email) for email in emails))
+            return dict(zip((email['id'] for email in emails), analyses))
+
+        async def bulk(agent):
+            return await agent.summarize_emails_bulk_async(emails, token_budget)
+
+        for name, run in (('per-email', per_email), ('bulk', bulk)):
+            # A fresh agent per mode so the second run can't be served from the first one's cache
+            agent = make_agent(stub.api_base)
+
+            async def timed():
+                started = time.perf_counter()
+                analyses = await run(agent)
+                seconds = time.perf_counter() - started
+                await agent.aclose()
+                return seconds, analyses
+
+            before = (stub.requests, stub.connections)
+            seconds, analyses = asyncio.run(timed())
+            results[name] = {
+                'seconds': seconds,
+                'rps': len(emails) / seconds,
+                'failures': sum(
+                    1 for email in emails
+                    if analyses.get(email['id'], {}).get('summary') != STUB_ANALYSIS['summary']
+                ),
+                'gemini_requests': stub.requests - before[0],
+                'connections': stub.connections - before[1]
+            }
+    return results
+
+
+def print_results(title, results):
+    print(f"\n📈 {title}")
+    for name, result in results.items():
+        print(f"  {name:>9}: {result['rps']:7.1f} req/s  ({result['seconds']:.2f}s, "
+              f"{result['gemini_requests']} Gemini requests, {result['connections']} connections, "
+              f"{result['failures']} failures)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the Gemini client against a local stub API")
+    parser.add_argument('benchmark', choices=['summarize', 'bulk'])
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--concurrency', type=int, default=20)
+    parser.add_argument('--corpus', help="JSON list of emails (id, sender, subject, body) for the bulk benchmark")
+    parser.add_argument('--repeat', type=int, default=10, help="Copies of the corpus to summarize")
+    parser.add_argument('--token-budget', type=int, help="Packed prompt budget (defaults to GEMINI_BULK_TOKEN_BUDGET)")
+    parser.add_argument('--latency', type=float, default=0.05, help="Stub response latency (seconds)")
+    parser.add_argument('--connect-latency', type=float, default=0.03, help="Stub per-connection setup delay (seconds)")
+    args = parser.parse_args()
+
+    if args.benchmark == 'summarize':
+        results = bench_summarize(args.requests, args.concurrency, args.latency, args.connect_latency)
+        print_results(f"/api/summarize, {args.requests} requests, concurrency {args.concurrency}", results)
+        print(f"  Speedup: {results['pooled']['rps'] / results['per-call']['rps']:.1f}x")
+    else:
+        if not args.corpus:
+            parser.error("bulk needs --corpus")
+        emails = load_emails(args.corpus, args.repeat)
+        results = bench_bulk(emails, args.token_budget, args.latency, args.connect_latency)
+        print_results(f"Bulk summarization, {len(emails)} emails", results)
+        print(f"  Speedup: {results['per-email']['seconds'] / results['bulk']['seconds']:.1f}x, "
+              f"{results['per-email']['gemini_requests'] / results['bulk']['gemini_requests']:.1f}x fewer requests")
@@ -0,0 +1,50 @@
+import os
+import asyncio
+from fastapi.concurrency import run_in_threadpool
+
+# Bulk deletion: pages of document keys, each split into 500-delete batches committed in parallel
+DELETE_PAGE_SIZE = int(os.getenv('DELETE_PAGE_SIZE', 2000))
+DELETE_BATCH_SIZE = 500
+
+def fetch_key_page(query, start_after=None, page_size=None):
+    """Fetch one page of matching documents with no field payload (document names only)"""
+    page = query.select(['__name__']).limit(page_size or DELETE_PAGE_SIZE)
+    if start_after is not None:
+        page = page.start_after(start_after)
+    return list(page.stream())
+
+async def delete_query_results(db, query, first_page, job=None, page_size=None) -> int:
+    """Delete every document matched by query, page by page, committing each page's batches in parallel"""
+    page_size = page_size or DELETE_PAGE_SIZE
+    deleted_count = 0
+    page = first_page
+    
+    while page:
+        next_page = None
+        if len(page) == page_size:
+            # Read the next page of keys while this page's deletes are committing
+            next_page = asyncio.ensure_future(run_in_threadpool(fetch_key_page, query, page[-1], page_size))
+        
+        count = await delete_snapshots(db, page)
+        deleted_count += count
+        if job is not None:
+            job.advance(count)
+        
+        page = await next_page if next_page is not None else []
+    
+    return deleted_count
+
+async def delete_snapshots(db, snapshots) -> int:
+    """Delete documents using parallel WriteBatch commits of up to 500 deletes each"""
+    async def commit_chunk(chunk):
+        batch = db.batch()
+        for snapshot in chunk:
+            batch.delete(snapshot.reference)
+        await run_in_threadpool(batch.commit)
+        return len(chunk)
+    
+    counts = await asyncio.gather(*(
+        commit_chunk(snapshots[start:start + DELETE_BATCH_SIZE])
+        for start in range(0, len(snapshots), DELETE_BATCH_SIZE)
+    ))
+    return sum(counts)
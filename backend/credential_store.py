@@ -0,0 +1,262 @@
+import os
+import re
+import sys
+import json
+import pickle
+import tempfile
+import threading
+from datetime import datetime, timedelta
+from google.oauth2.credentials import Credentials
+from google.auth.transport.requests import Request
+from google.auth.exceptions import RefreshError
+from firebase_admin import firestore
+
+SCOPES = ['https://www.googleapis.com/auth/gmail.modify']
+
+# Where the single-user versions of the app kept their token
+LEGACY_TOKEN_PATH = 'token.pickle'
+
+class GmailNotAuthorized(Exception):
+    """The user has no usable Gmail credentials - consent must be granted through the setup step"""
+    error_code = 'gmail_not_authorized'
+
+class CredentialStore:
+    """Per-user Gmail OAuth credentials, cached in memory and refreshed ahead of expiry"""
+
+    def __init__(self, refresh_margin=None, refresh_interval=None):
+        self.refresh_margin = int(refresh_margin or os.getenv('GMAIL_TOKEN_REFRESH_MARGIN', 600))
+        self.refresh_interval = int(refresh_interval or os.getenv('GMAIL_TOKEN_REFRESH_INTERVAL', 60))
+        self._cache = {}
+        self._lock = threading.Lock()
+        self._user_locks = {}
+        self._stop = threading.Event()
+        self._refresher = None
+
+    # Storage backend - implemented by subclasses
+
+    def _read(self, user_id):
+        """Return the stored credentials JSON for a user, or None"""
+        raise NotImplementedError
+
+    def _write(self, user_id, data):
+        """Persist the credentials JSON for a user"""
+        raise NotImplementedError
+
+    def _remove(self, user_id):
+        """Delete the stored credentials for a user"""
+        raise NotImplementedError
+
+    # Public API
+
+    def load(self, user_id):
+        """Get a user's credentials (the same object is shared, so refreshes are seen by all holders)"""
+        with self._lock:
+            creds = self._cache.get(user_id)
+        if creds is not None:
+            return creds
+
+        data = self._read(user_id)
+        if not data:
+            return None
+
+        creds = Credentials.from_authorized_user_info(json.loads(data), SCOPES)
+        with self._lock:
+            return self._cache.setdefault(user_id, creds)
+
+    def save(self, user_id, creds):
+        """Store a user's credentials"""
+        self._write(user_id, creds.to_json())
+        with self._lock:
+            self._cache[user_id] = creds
+
+    def delete(self, user_id):
+        """Forget a user's credentials"""
+        with self._lock:
+            self._cache.pop(user_id, None)
+        self._remove(user_id)
+
+    def evict(self, user_id):
+        """Drop a user's cached credentials (reloaded from storage on next use), so they stop being refreshed"""
+        with self._lock:
+            self._cache.pop(user_id, None)
+            lock = self._user_locks.get(user_id)
+            if lock is not None and not lock.locked():
+                del self._user_locks[user_id]
+
+    def refresh(self, user_id, force=False):
+        """Refresh a user's access token if it has expired (or unconditionally with force)"""
+        with self._user_lock(user_id):
+            creds = self.load(user_id)
+            if creds is None or not creds.refresh_token:
+                return creds
+            if force or not creds.valid:
+                try:
+                    creds.refresh(Request())
+                except RefreshError as e:
+                    raise GmailNotAuthorized(f"Gmail access was revoked or expired: {e}") from e
+                self.save(user_id, creds)
+                print(f"🔄 Refreshed Gmail token for user {user_id}")
+            return creds
+
+    def _user_lock(self, user_id):
+        with self._lock:
+            return self._user_locks.setdefault(user_id, threading.Lock())
+
+    # Background refresh
+
+    def start_background_refresh(self):
+        """Refresh cached tokens shortly before they expire, so requests never wait on a refresh"""
+        if self._refresher is not None:
+            return
+        self._stop.clear()
+        self._refresher = threading.Thread(
+            target=self._refresh_loop,
+            name="gmail-token-refresher",
+            daemon=True
+        )
+        self._refresher.start()
+
+    def stop_background_refresh(self):
+        """Stop the background refresh thread"""
+        self._stop.set()
+        if self._refresher is not None:
+            self._refresher.join(timeout=5)
+            self._refresher = None
+
+    def _refresh_loop(self):
+        while not self._stop.wait(self.refresh_interval):
+            self.refresh_due()
+
+    def refresh_due(self):
+        """Refresh every cached token that expires within the refresh margin - returns the user IDs refreshed"""
+        # Credentials.expiry is a naive UTC datetime
+        deadline = datetime.utcnow() + timedelta(seconds=self.refresh_margin)
+        with self._lock:
+            due = [user_id for user_id, creds in self._cache.items()
+                   if creds.refresh_token and creds.expiry and creds.expiry <= deadline]
+
+        for user_id in due:
+            try:
+                self.refresh(user_id, force=True)
+            except Exception as e:
+                print(f"⚠️  Could not refresh Gmail token for user {user_id}: {e}")
+        return due
+
+class FileCredentialStore(CredentialStore):
+    """One JSON file per user, written atomically"""
+
+    def __init__(self, directory=None, **kwargs):
+        super().__init__(**kwargs)
+        self.directory = directory or os.getenv('GMAIL_TOKEN_DIR', 'tokens')
+        os.makedirs(self.directory, exist_ok=True)
+
+    def _path(self, user_id):
+        safe_id = re.sub(r'[^A-Za-z0-9_-]', '_', user_id)
+        return os.path.join(self.directory, f"{safe_id}.json")
+
+    def _read(self, user_id):
+        try:
+            with open(self._path(user_id), 'r') as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def _write(self, user_id, data):
+        # Write to a temp file in the same directory, then atomically swap it in
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, prefix='.token-', suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w') as f:
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+            os.chmod(tmp_path, 0o600)
+            os.replace(tmp_path, self._path(user_id))
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def _remove(self, user_id):
+        try:
+            os.remove(self._path(user_id))
+        except FileNotFoundError:
+            pass
+
+class FirestoreCredentialStore(CredentialStore):
+    """Credentials stored as documents in a Firestore collection"""
+
+    def __init__(self, db, collection='gmail_credentials', **kwargs):
+        super().__init__(**kwargs)
+        self.collection = db.collection(collection)
+
+    def _read(self, user_id):
+        doc = self.collection.document(user_id).get()
+        return doc.to_dict().get('token') if doc.exists else None
+
+    def _write(self, user_id, data):
+        self.collection.document(user_id).set({
+            'token': data,
+            'updated_at': firestore.SERVER_TIMESTAMP
+        })
+
+    def _remove(self, user_id):
+        self.collection.document(user_id).delete()
+
+def create_credential_store(db=None):
+    """Build the credential store selected by GMAIL_CREDENTIAL_STORE (file or firestore)"""
+    backend = os.getenv('GMAIL_CREDENTIAL_STORE', 'file').lower()
+    if backend == 'firestore':
+        return FirestoreCredentialStore(db)
+    return FileCredentialStore()
+
+def authorize_interactively(store, user_id, client_secrets='credentials.json'):
+    """Run the browser OAuth consent flow for a user and store the result (setup only, never on a request path)"""
+    from google_auth_oauthlib.flow import InstalledAppFlow
+
+    flow = InstalledAppFlow.from_client_secrets_file(client_secrets, SCOPES)
+    creds = flow.run_local_server(port=0)
+    store.save(user_id, creds)
+    return creds
+
+def migrate_legacy_token(store, user_id, path=LEGACY_TOKEN_PATH):
+    """Move a pre-multi-user token.pickle into the store under user_id - returns True if one was migrated"""
+    if not os.path.exists(path):
+        return False
+
+    with open(path, 'rb') as token:
+        creds = pickle.load(token)
+    store.save(user_id, creds)
+
+    # Keep the old file around, renamed so it's never picked up (or migrated) twice
+    os.replace(path, f"{path}.migrated")
+    return True
+
+if __name__ == "__main__":
+    # Usage: python credential_store.py authorize <user_id>
+    #        python credential_store.py migrate <user_id> [token.pickle]
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    if len(sys.argv) < 3 or sys.argv[1] not in ('authorize', 'migrate'):
+        sys.exit("Usage: python credential_store.py authorize|migrate <user_id> [token.pickle]")
+    command, uid = sys.argv[1], sys.argv[2]
+
+    client = None
+    if os.getenv('GMAIL_CREDENTIAL_STORE', 'file').lower() == 'firestore':
+        import firebase_admin
+        from firebase_admin import credentials
+
+        firebase_admin.initialize_app(credentials.Certificate(os.getenv('FIREBASE_SERVICE_ACCOUNT_KEY_PATH')))
+        client = firestore.client()
+    store = create_credential_store(client)
+
+    if command == 'authorize':
+        print(f"🔐 Opening a browser to authorize Gmail for user {uid}...")
+        authorize_interactively(store, uid)
+        print(f"✅ Saved Gmail credentials for user {uid}")
+    else:
+        path = sys.argv[3] if len(sys.argv) > 3 else LEGACY_TOKEN_PATH
+        if migrate_legacy_token(store, uid, path):
+            print(f"✅ Migrated {path} to user {uid} (old file renamed to {path}.migrated)")
+        else:
+            sys.exit(f"❌ No legacy token found at {path}")
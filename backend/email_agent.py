@@ -1,10 +1,37 @@
 import os
 import json
 import re
-import requests
+import asyncio
+import threading
+import httpx
+from summary_cache import SummaryCache
+from email_preprocess import estimate_tokens
+from model_router import ModelRouter, ModelUnavailable, ModelThrottled
+from rate_limiter import RateLimiter
+from response_parser import ResponseParser, SUMMARY_SCHEMA, COMBINED_SCHEMA, BULK_SCHEMA
+
+GEMINI_API_BASE = "https://generativelanguage.googleapis.com/v1beta"
+
+# Bump these whenever a prompt changes so cached results are not reused
+SUMMARY_PROMPT_VERSION = 1
+REPLY_PROMPT_VERSION = 1
+COMBINED_PROMPT_VERSION = 1
+
+# Approximate prompt size limit for packed bulk summarization requests
+BULK_TOKEN_BUDGET = int(os.getenv('GEMINI_BULK_TOKEN_BUDGET', 8000))
+
+# Statuses retried on the same model (with backoff) before the router moves on
+RETRYABLE_STATUSES = {429, 500, 502, 503, 504}
+GEMINI_MAX_RETRIES = int(os.getenv('GEMINI_MAX_RETRIES', 2))
+
+# A 400 mentioning one of these means the model can't do JSON mode (any other 400 is a real error)
+JSON_MODE_ERROR_RE = re.compile(r'response_?schema|response_?mime_?type', re.IGNORECASE)
+
+# Tokens reserved for the response when charging a request against the tokens-per-minute budget
+OUTPUT_TOKEN_RESERVE = int(os.getenv('GEMINI_OUTPUT_TOKEN_RESERVE', 512))
 
 class EmailAgent:
-    def __init__(self):
+    def __init__(self, max_connections=None, max_concurrency=None):
         self.api_key = os.getenv('GOOGLE_API_KEY')
         if not self.api_key:
             raise ValueError("GOOGLE_API_KEY not found in environment variables")
@@ -16,15 +43,155 @@ class EmailAgent:
             "gemini-1.5-flash",
             "gemini-pro"
         ]
-        self.model = self.models[0]
+        
+        # Shared per-model RPM/TPM budgets, served fairly across users
+        self.rate_limiter = RateLimiter()
+        
+        # Circuit breaking, latency-aware ordering and optional hedging across the models
+        # (models the rate limiter has paused are tried last)
+        self.router = ModelRouter(self.models, paused_for=self.rate_limiter.paused_for)
+        
+        # JSON-mode responses are validated (and near-valid JSON repaired) here
+        self.parser = ResponseParser()
+        self._plain_text_models = set()  # Models that rejected responseSchema
+        
+        # Connection pool and concurrency limits (shared by all requests)
+        self.api_base = os.getenv('GEMINI_API_BASE', GEMINI_API_BASE)
+        self.max_connections = int(max_connections or os.getenv('GEMINI_MAX_CONNECTIONS', 20))
+        self.max_concurrency = int(max_concurrency or os.getenv('GEMINI_MAX_CONCURRENCY', 10))
+        
+        # One pooled client per event loop (uvicorn's loop + the sync wrapper loop)
+        self._loop_resources = {}
+        self._resources_lock = threading.Lock()
+        self._sync_loop = None
+        
+        # Results are keyed on email content, prompt version and preferred model
+        self.cache = SummaryCache()
         
         print(f"✅ Connected to Google Gemini AI (Model: {self.model})")
     
-    def _call_gemini(self, prompt):
-        """Call Gemini API directly via REST"""
-        headers = {
-            'Content-Type': 'application/json',
+    @property
+    def model(self):
+        """The model requests are currently routed to first"""
+        return self.router.preferred
+    
+    def _get_resources(self):
+        """Get the pooled HTTP client and concurrency gate for the running event loop"""
+        loop = asyncio.get_running_loop()
+        with self._resources_lock:
+            resources = self._loop_resources.get(loop)
+            if resources is None:
+                client = httpx.AsyncClient(
+                    timeout=httpx.Timeout(30.0, connect=10.0),
+                    limits=httpx.Limits(
+                        max_connections=self.max_connections,
+                        max_keepalive_connections=self.max_connections
+                    )
+                )
+                resources = (client, asyncio.Semaphore(self.max_concurrency))
+                self._loop_resources[loop] = resources
+        return resources
+    
+    def _run_sync(self, coro):
+        """Run a coroutine on the agent's background event loop and wait for the result"""
+        with self._resources_lock:
+            if self._sync_loop is None:
+                self._sync_loop = asyncio.new_event_loop()
+                threading.Thread(
+                    target=self._sync_loop.run_forever,
+                    name="email-agent-loop",
+                    daemon=True
+                ).start()
+        return asyncio.run_coroutine_threadsafe(coro, self._sync_loop).result()
+    
+    async def aclose(self):
+        """Close the pooled HTTP client owned by the running event loop"""
+        loop = asyncio.get_running_loop()
+        with self._resources_lock:
+            resources = self._loop_resources.pop(loop, None)
+        if resources:
+            await resources[0].aclose()
+    
+    async def _call_gemini_async(self, prompt, schema=None):
+        """
+        Call Gemini API via REST, routing across models (shared keep-alive connection pool)
+        With a schema, asks for JSON output (responseMimeType/responseSchema) matching it
+        """
+        data = {
+            "contents": [{
+                "parts": [{
+                    "text": prompt
+                }]
+            }]
         }
+        if schema is not None:
+            data["generationConfig"] = {
+                "responseMimeType": "application/json",
+                "responseSchema": schema
+            }
+        
+        tokens = self._estimate_tokens(prompt) + OUTPUT_TOKEN_RESERVE
+        text = await self.router.call(lambda model: self._generate_content(model, data, tokens))
+        if text is None:
+            print(f"⚠️  Could not reach any Gemini model")
+        return text
+    
+    async def _generate_content(self, model, data, tokens):
+        """
+        One generateContent request to a single model, within its rate limits - raises on failure
+        Throttled and server errors are retried with short backoffs; a longer wait (e.g. a large
+        Retry-After) raises ModelThrottled so the router tries the next model instead
+        """
+        client, semaphore = self._get_resources()
+        api_url = f"{self.api_base}/models/{model}:generateContent"
+        
+        attempt = 0
+        while True:
+            if model in self._plain_text_models and 'generationConfig' in data:
+                data = {key: value for key, value in data.items() if key != 'generationConfig'}
+            
+            await self.rate_limiter.acquire(model, tokens)
+            async with semaphore:
+                response = await client.post(
+                    api_url,
+                    params={'key': self.api_key},
+                    headers={'Content-Type': 'application/json'},
+                    json=data
+                )
+            
+            if response.status_code == 404:
+                raise ModelUnavailable(f"{model} is not available")
+            if response.status_code == 400 and 'generationConfig' in data and JSON_MODE_ERROR_RE.search(response.text):
+                # Older models don't support structured output - ask them for plain text instead
+                print(f"  {model} rejected JSON mode, retrying without a response schema...")
+                self._plain_text_models.add(model)
+                continue
+            if response.status_code in RETRYABLE_STATUSES and attempt < GEMINI_MAX_RETRIES:
+                delay = self.rate_limiter.backoff(
+                    model, attempt, response.headers.get('Retry-After'), throttled=response.status_code == 429
+                )
+                if delay > self.rate_limiter.max_retry_wait:
+                    # Not worth waiting out here - the router moves straight on to the next model
+                    raise ModelThrottled(f"{model} returned {response.status_code}, retry in {delay:.1f}s")
+                print(f"  ⏳ {model} returned {response.status_code}, retrying in {delay:.1f}s...")
+                await asyncio.sleep(delay)
+                attempt += 1
+                continue
+            if response.status_code == 429:
+                self.rate_limiter.backoff(model, attempt, response.headers.get('Retry-After'), throttled=True)
+            response.raise_for_status()
+            break
+        
+        # Extract text from response
+        result = response.json()
+        self.rate_limiter.settle(model, tokens, result.get('usageMetadata', {}).get('totalTokenCount'))
+        if 'candidates' in result and len(result['candidates']) > 0:
+            return result['candidates'][0]['content']['parts'][0]['text']
+        return None
+    
+    async def _stream_gemini_async(self, prompt):
+        """Stream response text chunks from Gemini via streamGenerateContent (server-sent events)"""
+        client, semaphore = self._get_resources()
         
         data = {
             "contents": [{
@@ -34,45 +201,67 @@ class EmailAgent:
             }]
         }
         
-        for model in self.models:
-            api_url = f"https://generativelanguage.googleapis.com/v1beta/models/{model}:generateContent"
+        tokens = self._estimate_tokens(prompt) + OUTPUT_TOKEN_RESERVE
+        streamed = False
+        for model in self.router.ordered():
+            api_url = f"{self.api_base}/models/{model}:streamGenerateContent"
             
             try:
-                print(f"  Trying model: {model}...")
-                response = requests.post(
-                    f"{api_url}?key={self.api_key}",
-                    headers=headers,
-                    json=data,
-                    timeout=30
-                )
-                
-                if response.status_code == 200:
-                    result = response.json()
-                    self.model = model
-                    
-                    # Extract text from response
-                    if 'candidates' in result and len(result['candidates']) > 0:
-                        return result['candidates'][0]['content']['parts'][0]['text']
-                    else:
-                        return None
-                elif response.status_code == 404:
-                    continue  # Try next model
-                else:
-                    response.raise_for_status()
+                print(f"  Streaming from model: {model}...")
+                self.router.begin(model)
+                await self.rate_limiter.acquire(model, tokens)
+                async with semaphore:
+                    async with client.stream(
+                        'POST',
+                        api_url,
+                        params={'key': self.api_key, 'alt': 'sse'},
+                        json=data
+                    ) as response:
+                        if response.status_code == 404:
+                            self.router.record_failure(model, unavailable=True)
+                            continue  # Try next model
+                        if response.status_code == 429:
+                            # Pause this model for every caller, then stream from the next one
+                            self.rate_limiter.backoff(model, 0, response.headers.get('Retry-After'), throttled=True)
+                        response.raise_for_status()
+                        
+                        usage = None
+                        async for line in response.aiter_lines():
+                            if not line.startswith('data:'):
+                                continue
+                            chunk = json.loads(line[len('data:'):])
+                            usage = chunk.get('usageMetadata', {}).get('totalTokenCount', usage)
+                            for candidate in chunk.get('candidates', [])[:1]:
+                                for part in candidate.get('content', {}).get('parts', []):
+                                    if part.get('text'):
+                                        streamed = True
+                                        yield part['text']
+                        self.rate_limiter.settle(model, tokens, usage)
+                        self.router.record_success(model)
+                        return
             
-            except requests.exceptions.Timeout:
-                print(f"  Timeout with {model}, trying next...")
-                continue
-            except Exception as e:
-                print(f"  Error with {model}: {str(e)[:50]}")
+            except httpx.HTTPError as e:
+                self.router.record_failure(model)
+                # Once text has been sent we can't restart on another model without duplicating it
+                if streamed:
+                    print(f"  Stream from {model} interrupted: {str(e)[:50]}")
+                    return
+                print(f"  Error with {model}: {str(e)[:50]}, trying next...")
                 continue
+            except BaseException:
+                # Client went away (or another error) mid-stream - don't hold the half-open probe
+                self.router.release(model)
+                raise
         
         print(f"⚠️  Could not reach any Gemini model")
-        return None
     
-    def summarize_email(self, email_data):
-        """Generate summary and analysis of email"""
-        prompt = f"""Analyze this email and provide a structured response.
+    def _call_gemini(self, prompt):
+        """Call Gemini API from synchronous code"""
+        return self._run_sync(self._call_gemini_async(prompt))
+    
+    def _summary_prompt(self, email_data):
+        """Build the analysis prompt for a single email"""
+        return f"""Analyze this email and provide a structured response.
 
 Email Details:
 From: {email_data['sender']}
@@ -93,42 +282,10 @@ Provide your analysis in the following JSON format:
 }}
 
 Respond ONLY with the JSON, no additional text."""
-
-        try:
-            response_text = self._call_gemini(prompt)
-            
-            if response_text:
-                # Extract JSON from response (handle markdown code blocks)
-                response_text = re.sub(r'```json\s*', '', response_text)
-                response_text = re.sub(r'```\s*', '', response_text)
-                
-                # Find JSON object
-                start = response_text.find('{')
-                end = response_text.rfind('}') + 1
-                
-                if start != -1 and end > start:
-                    json_str = response_text[start:end]
-                    analysis = json.loads(json_str)
-                    return analysis
-                else:
-                    raise ValueError("No JSON found in response")
-            else:
-                raise ValueError("No response from API")
-        
-        except Exception as e:
-            print(f"⚠️  Error in summarization: {e}")
-            return {
-                "summary": "Error generating summary. Please try again.",
-                "key_points": [],
-                "action_items": [],
-                "urgency": "unknown",
-                "category": "unknown",
-                "sentiment": "neutral"
-            }
     
-    def generate_reply(self, email_data, tone="professional"):
-        """Generate a draft reply to the email"""
-        prompt = f"""Generate a {tone} email reply to the following email.
+    def _reply_prompt(self, email_data, tone):
+        """Build the draft reply prompt for a single email"""
+        return f"""Generate a {tone} email reply to the following email.
 
 Original Email:
 From: {email_data['sender']}
@@ -142,12 +299,135 @@ Generate a clear, concise, and appropriate response. Include:
 4. Professional closing
 
 Keep it under 150 words. Respond with ONLY the email body, no subject line or additional formatting."""
+    
+    def _combined_prompt(self, email_data, tone):
+        """Build a prompt asking for the analysis and a draft reply in one response"""
+        return f"""Analyze this email and draft a {tone} reply to it.
+
+Email Details:
+From: {email_data['sender']}
+Subject: {email_data['subject']}
+Date: {email_data['date']}
+
+Body:
+{email_data['body']}
+
+Provide your response in the following JSON format:
+{{
+    "summary": "2-3 sentence summary of the email",
+    "key_points": ["point 1", "point 2"],
+    "action_items": ["action 1", "action 2"],
+    "urgency": "low|medium|high",
+    "category": "work|personal|newsletter|promotional",
+    "sentiment": "positive|neutral|negative",
+    "draft_reply": "the reply email body"
+}}
+
+The draft reply should have a proper greeting, acknowledge the email, respond to its key points
+and end with a professional closing. Keep it under 150 words, with no subject line.
+
+Respond ONLY with the JSON, no additional text."""
+    
+    def _bulk_email_block(self, label, email_data):
+        """Render one email as a section of a packed bulk prompt"""
+        return f"""--- EMAIL {label} ---
+From: {email_data['sender']}
+Subject: {email_data['subject']}
+Date: {email_data['date']}
 
+Body:
+{email_data['body']}
+
+"""
+    
+    def _bulk_prompt(self, blocks):
+        """Build a prompt analyzing several packed emails at once"""
+        return f"""Analyze each of the following emails and provide a structured response for every one.
+
+{''.join(blocks)}--- END OF EMAILS ---
+
+Provide your analysis as a JSON array with one object per email, in the following format:
+[
+    {{
+        "id": "the EMAIL label, e.g. E1",
+        "summary": "2-3 sentence summary of the email",
+        "key_points": ["point 1", "point 2"],
+        "action_items": ["action 1", "action 2"],
+        "urgency": "low|medium|high",
+        "category": "work|personal|newsletter|promotional",
+        "sentiment": "positive|neutral|negative"
+    }}
+]
+
+Respond ONLY with the JSON array, no additional text."""
+    
+    def _estimate_tokens(self, text):
+        """Rough token count (~4 characters per token)"""
+        return estimate_tokens(text)
+    
+    def _pack_emails(self, emails, token_budget):
+        """Split emails into groups whose packed prompt stays within the token budget"""
+        base_cost = self._estimate_tokens(self._bulk_prompt([]))
+        groups = []
+        current, used = [], base_cost
+        
+        for email in emails:
+            cost = self._estimate_tokens(self._bulk_email_block(f"E{len(current) + 1}", email))
+            if current and used + cost > token_budget:
+                groups.append(current)
+                current, used = [], base_cost
+            current.append(email)
+            used += cost
+        
+        if current:
+            groups.append(current)
+        return groups
+    
+    def _error_analysis(self):
+        """Analysis returned when the model could not produce a summary"""
+        return {
+            "summary": "Error generating summary. Please try again.",
+            "key_points": [],
+            "action_items": [],
+            "urgency": "unknown",
+            "category": "unknown",
+            "sentiment": "neutral"
+        }
+    
+    async def summarize_email_async(self, email_data):
+        """Generate summary and analysis of email"""
+        cache_key = self.cache.make_key('summary', email_data, SUMMARY_PROMPT_VERSION, self.models[0])
+        cached = await self.cache.aget(cache_key)
+        if cached is not None:
+            return cached
+        
+        try:
+            response_text = await self._call_gemini_async(self._summary_prompt(email_data), SUMMARY_SCHEMA)
+            
+            if response_text:
+                analysis = self.parser.parse_analysis(response_text)
+                self.cache.set(cache_key, analysis)
+                return analysis
+            else:
+                raise ValueError("No response from API")
+        
+        except Exception as e:
+            print(f"⚠️  Error in summarization: {e}")
+            return self._error_analysis()
+    
+    async def generate_reply_async(self, email_data, tone="professional"):
+        """Generate a draft reply to the email"""
+        cache_key = self.cache.make_key('reply', email_data, REPLY_PROMPT_VERSION, self.models[0], tone=tone)
+        cached = await self.cache.aget(cache_key)
+        if cached is not None:
+            return cached
+        
         try:
-            response_text = self._call_gemini(prompt)
+            response_text = await self._call_gemini_async(self._reply_prompt(email_data, tone))
             
             if response_text:
                 reply = response_text.strip()
+                self.cache.set(cache_key, reply)
                 return reply
             else:
                 raise ValueError("No response from API")
@@ -156,20 +436,154 @@ Keep it under 150 words. Respond with ONLY the email body, no subject line or ad
             print(f"⚠️  Error generating reply: {e}")
             return "Error generating reply. Please try again."
     
-    def batch_process(self, emails):
-        """Process multiple emails and return summaries"""
-        results = []
+    async def generate_reply_stream(self, email_data, tone="professional"):
+        """Stream a draft reply to the email chunk by chunk"""
+        cache_key = self.cache.make_key('reply', email_data, REPLY_PROMPT_VERSION, self.models[0], tone=tone)
+        cached = await self.cache.aget(cache_key)
+        if cached is not None:
+            yield cached
+            return
         
-        for idx, email in enumerate(emails, 1):
+        chunks = []
+        async for chunk in self._stream_gemini_async(self._reply_prompt(email_data, tone)):
+            chunks.append(chunk)
+            yield chunk
+        
+        reply = ''.join(chunks).strip()
+        if reply:
+            self.cache.set(cache_key, reply)
+    
+    async def summarize_and_reply_async(self, email_data, tone="professional"):
+        """
+        Generate analysis and a draft reply with a single model call
+        Falls back to separate summary and reply calls if the combined response can't be parsed
+        """
+        cache_key = self.cache.make_key('combined', email_data, COMBINED_PROMPT_VERSION, self.models[0], tone=tone)
+        cached = await self.cache.aget(cache_key)
+        if cached is not None:
+            return cached['summary'], cached['draft_reply']
+        
+        try:
+            response_text = await self._call_gemini_async(self._combined_prompt(email_data, tone), COMBINED_SCHEMA)
+            if not response_text:
+                raise ValueError("No response from API")
+            
+            analysis = self.parser.parse_analysis(response_text)
+            draft_reply = analysis.pop('draft_reply', None)
+            if not isinstance(draft_reply, str) or not draft_reply.strip():
+                raise ValueError("Incomplete combined response")
+            
+            draft_reply = draft_reply.strip()
+            self.cache.set(cache_key, {'summary': analysis, 'draft_reply': draft_reply})
+            return analysis, draft_reply
+        
+        except Exception as e:
+            print(f"⚠️  Combined generation failed ({e}), falling back to separate calls")
+            summary, draft_reply = await asyncio.gather(
+                self.summarize_email_async(email_data),
+                self.generate_reply_async(email_data, tone)
+            )
+            return summary, draft_reply
+    
+    async def summarize_emails_bulk_async(self, emails, token_budget=None):
+        """
+        Summarize many emails by packing several into each model request
+        Returns analyses keyed by email ID; emails missing from a packed response are retried individually
+        """
+        token_budget = token_budget or BULK_TOKEN_BUDGET
+        results = {}
+        pending = []
+        
+        for email in emails:
+            cached = await self.cache.aget(self.cache.make_key('summary', email, SUMMARY_PROMPT_VERSION, self.models[0]))
+            if cached is not None:
+                results[email['id']] = cached
+            else:
+                pending.append(email)
+        
+        groups = self._pack_emails(pending, token_budget)
+        if groups:
+            print(f"📦 Summarizing {len(pending)} emails in {len(groups)} packed request(s)...")
+        
+        group_results = await asyncio.gather(*(self._summarize_packed(group) for group in groups))
+        
+        requeue = []
+        for group, analyses in zip(groups, group_results):
+            for email in group:
+                analysis = analyses.get(email['id'])
+                if analysis is None:
+                    requeue.append(email)
+                    continue
+                results[email['id']] = analysis
+                self.cache.set(
+                    self.cache.make_key('summary', email, SUMMARY_PROMPT_VERSION, self.models[0]),
+                    analysis
+                )
+        
+        if requeue:
+            print(f"  Re-queuing {len(requeue)} email(s) missing from packed responses")
+            singles = await asyncio.gather(*(self.summarize_email_async(email) for email in requeue))
+            for email, analysis in zip(requeue, singles):
+                results[email['id']] = analysis
+        
+        return results
+    
+    async def _summarize_packed(self, emails):
+        """Run one packed request - returns the analyses it produced, keyed by email ID"""
+        labels = {f"E{idx}": email['id'] for idx, email in enumerate(emails, 1)}
+        blocks = [self._bulk_email_block(label, email) for label, email in zip(labels, emails)]
+        
+        try:
+            response_text = await self._call_gemini_async(self._bulk_prompt(blocks), BULK_SCHEMA)
+            if not response_text:
+                raise ValueError("No response from API")
+            
+            analyses = {}
+            for item in self.parser.parse_analyses(response_text):
+                email_id = labels.get(item.pop('id'))
+                if email_id is not None:
+                    analyses[email_id] = item
+            return analyses
+        
+        except Exception as e:
+            print(f"⚠️  Error in packed summarization: {e}")
+            return {}
+    
+    def summarize_email(self, email_data):
+        """Generate summary and analysis of email (sync wrapper)"""
+        return self._run_sync(self.summarize_email_async(email_data))
+    
+    def generate_reply(self, email_data, tone="professional"):
+        """Generate a draft reply to the email (sync wrapper)"""
+        return self._run_sync(self.generate_reply_async(email_data, tone))
+    
+    def summarize_emails_bulk(self, emails, token_budget=None):
+        """Summarize many emails with packed prompts (sync wrapper)"""
+        return self._run_sync(self.summarize_emails_bulk_async(emails, token_budget))
+    
+    async def batch_process_async(self, emails, combined=True):
+        """Process multiple emails concurrently and return summaries"""
+        async def process(idx, email):
             print(f"\n📧 Processing email {idx}/{len(emails)} with Gemini AI...")
             
-            summary = self.summarize_email(email)
-            draft_reply = self.generate_reply(email)
+            if combined:
+                summary, draft_reply = await self.summarize_and_reply_async(email)
+            else:
+                summary, draft_reply = await asyncio.gather(
+                    self.summarize_email_async(email),
+                    self.generate_reply_async(email)
+                )
             
-            results.append({
+            return {
                 'email': email,
                 'summary': summary,
                 'draft_reply': draft_reply
-            })
+            }
         
-        return results
\ No newline at end of file
+        return list(await asyncio.gather(
+            *(process(idx, email) for idx, email in enumerate(emails, 1))
+        ))
+    
+    def batch_process(self, emails, combined=True):
+        """Process multiple emails and return summaries (sync wrapper)"""
+        return self._run_sync(self.batch_process_async(emails, combined))
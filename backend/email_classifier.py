@@ -0,0 +1,333 @@
+import os
+import re
+import sys
+import json
+import pickle
+import hashlib
+import threading
+from email.utils import parseaddr
+
+# Optional: a small text model trained from stored labels (pip install scikit-learn)
+try:
+    from sklearn.feature_extraction.text import TfidfVectorizer
+    from sklearn.linear_model import LogisticRegression
+    from sklearn.pipeline import make_pipeline
+except ImportError:
+    make_pipeline = None
+
+BULK_PRECEDENCE = {'bulk', 'list', 'junk'}
+
+# Precedence values only promotional senders use (mailing lists and notifications send 'list')
+PROMOTIONAL_PRECEDENCE = {'bulk', 'junk'}
+
+NOREPLY_RE = re.compile(
+    r'^(no-?reply|do-?not-?reply|notifications?|mailer-daemon|newsletters?|news|marketing|promotions?|offers?|deals?)([+._-].*)?@',
+    re.IGNORECASE
+)
+
+# Subjects that might need attention are always left to the LLM, whatever the headers say
+ATTENTION_RE = re.compile(
+    r'\b(urgent|asap|action required|security|password|verify|suspicious|overdue|payment|invoice|'
+    r'final notice|deadline|expir\w*|locked|unusual)\b',
+    re.IGNORECASE
+)
+
+# Transactional and work notifications share bulk headers (noreply sender, List-Unsubscribe, List-Id)
+# with marketing mail - receipts, shipping updates, code review and ticket notifications go to the LLM
+TRANSACTIONAL_RE = re.compile(
+    r'\b(order|orders|shipped|shipping|shipment|delivery|delivered|receipt|confirm\w*|booking|reservation|'
+    r'itinerary|statement|refund|review requested|pull request|merge request|mentioned you|assigned|'
+    r'commented|build|pipeline)\b|\bPR #?\d+|^\s*(re:\s*)?\[[\w.-]+/[\w.-]+\]',
+    re.IGNORECASE
+)
+
+# Stored (display) labels mapped back to the analysis values the agent produces
+CATEGORY_LABELS = {"Work": "work", "Personal": "personal", "Promotion": "promotional"}
+URGENCY_LABELS = {"High": "high", "Medium": "medium", "Low": "low"}
+
+# Training needs at least this many labeled emails
+MIN_TRAINING_EMAILS = 200
+
+# Characters of body used as model features (stored emails only keep a 200 character preview)
+MODEL_BODY_CHARS = 200
+
+class EmailClassifier:
+    """
+    Classifies obvious bulk and automated mail locally, so only ambiguous email goes to the LLM
+    Header rules run first; an optional scikit-learn model trained from stored labels runs second
+    """
+
+    def __init__(self, model_path=None, min_confidence=None):
+        self.enabled = os.getenv('LOCAL_CLASSIFIER', 'true').lower() != 'false'
+        self.model_path = model_path or os.getenv('CLASSIFIER_MODEL_PATH', 'classifier_model.pickle')
+        self.min_confidence = float(min_confidence or os.getenv('CLASSIFIER_MIN_CONFIDENCE', 0.9))
+        self.model = self._load_model()
+        self._lock = threading.Lock()
+        self.rule_hits = 0
+        self.model_hits = 0
+        self.llm_routed = 0
+
+    def _load_model(self):
+        if make_pipeline is None or not os.path.exists(self.model_path):
+            return None
+        try:
+            with open(self.model_path, 'rb') as model_file:
+                model = pickle.load(model_file)
+            print(f"✅ Loaded local email classifier model ({self.model_path})")
+            return model
+        except Exception as e:
+            print(f"⚠️  Could not load classifier model: {e}")
+            return None
+
+    def classify(self, email):
+        """Return an analysis dict for a high-confidence email, or None to route it to the LLM"""
+        analysis = None
+        subject = email.get('subject', '')
+        if self.enabled and not ATTENTION_RE.search(subject) and not TRANSACTIONAL_RE.search(subject):
+            analysis = self._classify_by_rules(email) or self._classify_by_model(email)
+
+        with self._lock:
+            if analysis is None:
+                self.llm_routed += 1
+            elif analysis['classified_by'] == 'rules':
+                self.rule_hits += 1
+            else:
+                self.model_hits += 1
+        return analysis
+
+    def _classify_by_rules(self, email):
+        headers = {name.lower(): value for name, value in email.get('headers', {}).items()}
+        labels = set(email.get('labels', []))
+        address = parseaddr(email.get('sender', ''))[1]
+        precedence = headers.get('precedence', '').strip().lower()
+
+        # Bulk headers alone also fit notifications and receipts - require an actual promotional signal
+        if 'CATEGORY_PROMOTIONS' not in labels and precedence not in PROMOTIONAL_PRECEDENCE:
+            return None
+
+        signals = 0
+        if 'CATEGORY_PROMOTIONS' in labels:
+            signals += 2
+        if 'list-unsubscribe' in headers:
+            signals += 1
+        if precedence in BULK_PRECEDENCE:
+            signals += 1
+        # Only machine-generated mail - auto-replies (out-of-office) come from real correspondents
+        if headers.get('auto-submitted', '').strip().lower().startswith('auto-generated'):
+            signals += 1
+        if NOREPLY_RE.match(address):
+            signals += 1
+
+        confidence = min(0.99, 0.5 + 0.2 * signals)
+        if signals < 2 or confidence < self.min_confidence:
+            return None
+
+        # Mailing lists are newsletters; everything else this bulk is promotional
+        is_list = 'list-id' in headers or precedence == 'list'
+        category = 'newsletter' if is_list and 'CATEGORY_PROMOTIONS' not in labels else 'promotional'
+        return local_analysis(email, category, 'low', 'rules', confidence)
+
+    def _classify_by_model(self, email):
+        if self.model is None:
+            return None
+
+        category_probs, urgency_probs = self.model.predict_proba(email)
+        category, category_confidence = max(category_probs.items(), key=lambda item: item[1])
+        urgency, urgency_confidence = max(urgency_probs.items(), key=lambda item: item[1])
+        confidence = min(category_confidence, urgency_confidence)
+
+        # The model only short-circuits bulk mail - personal and work email always gets a real summary
+        if confidence < self.min_confidence or category != 'promotional':
+            return None
+        return local_analysis(email, category, urgency, 'model', confidence)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "model_loaded": self.model is not None,
+                "rule_hits": self.rule_hits,
+                "model_hits": self.model_hits,
+                "llm_routed": self.llm_routed
+            }
+
+class LabelModel:
+    """TF-IDF + logistic regression predicting category and urgency from sender, subject and body"""
+
+    def __init__(self, category_pipeline, urgency_pipeline):
+        self.category_pipeline = category_pipeline
+        self.urgency_pipeline = urgency_pipeline
+
+    @staticmethod
+    def features(sender, subject, body):
+        return f"{sender}\n{subject}\n{(body or '')[:MODEL_BODY_CHARS]}"
+
+    @classmethod
+    def train(cls, rows):
+        """Fit on (features, category, urgency) rows"""
+        texts = [row[0] for row in rows]
+        pipelines = []
+        for column in (1, 2):
+            pipeline = make_pipeline(
+                TfidfVectorizer(ngram_range=(1, 2), min_df=2, sublinear_tf=True),
+                LogisticRegression(max_iter=1000)
+            )
+            pipeline.fit(texts, [row[column] for row in rows])
+            pipelines.append(pipeline)
+        return cls(*pipelines)
+
+    def predict_proba(self, email):
+        text = self.features(email.get('sender', ''), email.get('subject', ''), email.get('body', ''))
+        return tuple(
+            dict(zip(pipeline.classes_, pipeline.predict_proba([text])[0]))
+            for pipeline in (self.category_pipeline, self.urgency_pipeline)
+        )
+
+def local_analysis(email, category, urgency, classified_by, confidence):
+    """Build the same analysis dict the agent returns, with an extractive summary"""
+    return {
+        "summary": extractive_summary(email),
+        "key_points": [],
+        "action_items": [],
+        "urgency": urgency,
+        "category": category,
+        "sentiment": "neutral",
+        "classified_by": classified_by,
+        "confidence": round(confidence, 2)
+    }
+
+def extractive_summary(email, max_chars=300):
+    """Subject plus the opening sentences of the body"""
+    name = parseaddr(email.get('sender', ''))[0] or parseaddr(email.get('sender', ''))[1] or 'Unknown sender'
+    summary = f"{name}: {email.get('subject', 'No Subject')}."
+
+    for sentence in re.split(r'(?<=[.!?])\s+', ' '.join((email.get('body') or '').split())):
+        if len(summary) + len(sentence) + 1 > max_chars:
+            break
+        summary += f" {sentence}"
+    return summary
+
+def training_rows(db, user_ids=None):
+    """Labeled rows from stored emails that the LLM (not this classifier or the fallback) analyzed"""
+    query = db.collection('emails').select(['user_id', 'from', 'subject', 'body_preview', 'category', 'urgency', 'classified_by'])
+    rows = []
+    for doc in query.stream():
+        data = doc.to_dict()
+        if user_ids and data.get('user_id') not in user_ids:
+            continue
+        if data.get('classified_by', 'llm') != 'llm':
+            continue
+        category = CATEGORY_LABELS.get(data.get('category'))
+        urgency = URGENCY_LABELS.get(data.get('urgency'))
+        if category and urgency:
+            features = LabelModel.features(data.get('from', ''), data.get('subject', ''), data.get('body_preview', ''))
+            rows.append((features, category, urgency))
+    return rows
+
+def is_holdout(features):
+    """Deterministic ~20% evaluation split"""
+    return hashlib.sha256(features.encode('utf-8')).digest()[0] < 52
+
+def evaluate(model, rows, min_confidence):
+    """Share of held-out emails the model would answer without the LLM, and its accuracy on them"""
+    classifier = EmailClassifier(min_confidence=min_confidence)
+    classifier.model = model
+    covered = correct = 0
+    for features, category, urgency in rows:
+        sender, subject, body = (features.split('\n', 2) + ['', ''])[:3]
+        analysis = classifier._classify_by_model({'sender': sender, 'subject': subject, 'body': body})
+        if analysis is not None:
+            covered += 1
+            correct += analysis['category'] == category and analysis['urgency'] == urgency
+    return covered, correct
+
+def load_corpus(path):
+    """Labeled emails - dicts with sender, subject, body, headers, labels and the expected category and urgency"""
+    with open(path, 'r') as corpus_file:
+        return json.load(corpus_file)
+
+def benchmark(classifier, corpus):
+    """How many labeled emails the rules and the model answer without the LLM, and how many of those correctly"""
+    report = {
+        "total": len(corpus),
+        "rules": {"covered": 0, "correct": 0},
+        "model": {"covered": 0, "correct": 0},
+        "llm_routed": 0,
+        "mistakes": []
+    }
+    for email in corpus:
+        analysis = classifier.classify(email)
+        if analysis is None:
+            report["llm_routed"] += 1
+            continue
+        counts = report[analysis['classified_by']]
+        counts["covered"] += 1
+        if analysis['category'] == email['category'] and analysis['urgency'] == email['urgency']:
+            counts["correct"] += 1
+        else:
+            report["mistakes"].append(email.get('id'))
+    return report
+
+def print_benchmark(report):
+    for stage in ('rules', 'model'):
+        covered, correct = report[stage]["covered"], report[stage]["correct"]
+        print(f"  📊 {stage}: {covered}/{report['total']} emails ({covered / (report['total'] or 1):.0%}) skip the LLM, "
+              f"{correct}/{covered or 1} ({correct / (covered or 1):.0%}) labeled correctly")
+    if report["mistakes"]:
+        print(f"  ❌ Mislabeled: {', '.join(report['mistakes'])}")
+
+if __name__ == "__main__":
+    # Usage: python email_classifier.py [user_id ...]  (trains on every user's labels when none are given)
+    #        python email_classifier.py --benchmark <corpus.json>  (scores the rules and any saved model)
+    if sys.argv[1:2] == ['--benchmark']:
+        from email_classifier import EmailClassifier, load_corpus, benchmark, print_benchmark
+
+        if len(sys.argv) < 3:
+            sys.exit("Usage: python email_classifier.py --benchmark <corpus.json>  (e.g. tests/fixtures/classifier_corpus.json)")
+        corpus_path = sys.argv[2]
+        print(f"🧪 Benchmarking the local classifier on {corpus_path}...")
+        print_benchmark(benchmark(EmailClassifier(), load_corpus(corpus_path)))
+        sys.exit(0)
+
+    import firebase_admin
+    from firebase_admin import credentials, firestore
+    from dotenv import load_dotenv
+
+    if make_pipeline is None:
+        sys.exit("❌ scikit-learn is not installed (pip install scikit-learn)")
+
+    # Pickle the model under this module's name, not __main__, so the server can load it
+    from email_classifier import (
+        EmailClassifier, LabelModel, training_rows, evaluate, is_holdout, load_corpus, benchmark, print_benchmark
+    )
+
+    load_dotenv()
+    firebase_admin.initialize_app(credentials.Certificate(os.getenv('FIREBASE_SERVICE_ACCOUNT_KEY_PATH')))
+
+    print("🧠 Training local email classifier from stored labels...")
+    rows = training_rows(firestore.client(), set(sys.argv[1:]))
+    if len(rows) < MIN_TRAINING_EMAILS:
+        sys.exit(f"❌ Only {len(rows)} labeled emails - need at least {MIN_TRAINING_EMAILS}")
+
+    train = [row for row in rows if not is_holdout(row[0])]
+    holdout = [row for row in rows if is_holdout(row[0])]
+    min_confidence = float(os.getenv('CLASSIFIER_MIN_CONFIDENCE', 0.9))
+
+    covered, correct = evaluate(LabelModel.train(train), holdout, min_confidence)
+    if holdout:
+        print(f"  📊 Holdout: {covered}/{len(holdout)} emails ({covered / len(holdout):.0%}) skip the LLM, "
+              f"{correct}/{covered or 1} ({correct / (covered or 1):.0%}) labeled correctly")
+
+    model = LabelModel.train(rows)
+    model_path = os.getenv('CLASSIFIER_MODEL_PATH', 'classifier_model.pickle')
+    with open(model_path, 'wb') as model_file:
+        pickle.dump(model, model_file)
+    print(f"✅ Trained on {len(rows)} emails, saved to {model_path}")
+
+    # Optional: score the new model on a labeled corpus too (e.g. tests/fixtures/classifier_corpus.json)
+    corpus_path = os.getenv('CLASSIFIER_CORPUS_PATH')
+    if corpus_path and os.path.exists(corpus_path):
+        classifier = EmailClassifier(min_confidence=min_confidence)
+        classifier.model = model
+        print(f"  🧪 Labeled corpus ({corpus_path}):")
+        print_benchmark(benchmark(classifier, load_corpus(corpus_path)))
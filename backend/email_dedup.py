@@ -0,0 +1,111 @@
+import os
+import re
+import hashlib
+from email.utils import parseaddr
+
+# Max differing SimHash bits for two emails to count as near-duplicates (of 64)
+SIMHASH_DISTANCE = int(os.getenv('DEDUP_SIMHASH_DISTANCE', 3))
+
+# Bodies shorter than this (in words) are only matched exactly - SimHash is unreliable on tiny texts
+MIN_SIMHASH_WORDS = 8
+
+SHINGLE_SIZE = 3
+
+URL_RE = re.compile(r'https?://\S+|www\.\S+')
+DIGITS_RE = re.compile(r'\d+')
+WORD_RE = re.compile(r'\w+')
+
+class Fingerprint:
+    """Exact and near-duplicate fingerprints of one email"""
+
+    def __init__(self, sender, exact, simhash):
+        self.sender = sender
+        self.exact = exact
+        self.simhash = simhash
+
+def normalize_words(text, mask_numbers=False):
+    """Lowercased words with URLs masked out - and numbers (order IDs, dates, amounts) too with mask_numbers"""
+    text = URL_RE.sub(' url ', (text or '').lower())
+    if mask_numbers:
+        text = DIGITS_RE.sub('0', text)
+    return WORD_RE.findall(text)
+
+def email_figures(email):
+    """The numbers in an email's subject and body, in order (URLs excluded)"""
+    text = f"{email.get('subject', '')}\n{email.get('body', '')}"
+    return DIGITS_RE.findall(URL_RE.sub(' ', text))
+
+def shares_analysis(first, other, analysis):
+    """
+    Whether a near-duplicate can reuse the analysis written for the first email of its cluster:
+    only if its summary and points quote no figures, or both emails carry the same ones ($12.50 vs $9800.00)
+    """
+    if not analysis:
+        return True
+    text = ' '.join([str(analysis.get('summary', ''))] + [
+        str(item) for field in ('key_points', 'action_items') for item in analysis.get(field) or []
+    ])
+    return not DIGITS_RE.search(text) or email_figures(first) == email_figures(other)
+
+def simhash(words):
+    """64-bit SimHash over word shingles"""
+    if len(words) < SHINGLE_SIZE:
+        shingles = [' '.join(words)]
+    else:
+        shingles = [' '.join(words[idx:idx + SHINGLE_SIZE]) for idx in range(len(words) - SHINGLE_SIZE + 1)]
+
+    weights = [0] * 64
+    for shingle in shingles:
+        value = int.from_bytes(hashlib.blake2b(shingle.encode('utf-8'), digest_size=8).digest(), 'big')
+        for bit in range(64):
+            weights[bit] += 1 if value >> bit & 1 else -1
+    return sum(1 << bit for bit, weight in enumerate(weights) if weight > 0)
+
+def hamming_distance(a, b):
+    return bin(a ^ b).count('1')
+
+def fingerprint(email):
+    """
+    Fingerprint an email's normalized subject and body (duplicates must share a sender address)
+    The exact key keeps numbers; only the SimHash masks them, so near-duplicates can differ in figures
+    """
+    sender = parseaddr(email.get('sender', ''))[1].lower()
+    subject_words = normalize_words(email.get('subject', ''))
+    body_words = normalize_words(email.get('body', ''))
+
+    exact = hashlib.sha256(
+        f"{sender}\n{' '.join(subject_words)}\n{' '.join(body_words)}".encode('utf-8')
+    ).hexdigest()
+    near = None
+    if len(body_words) >= MIN_SIMHASH_WORDS:
+        near = simhash(normalize_words(email.get('subject', ''), True) + normalize_words(email.get('body', ''), True))
+    return Fingerprint(sender, exact, near)
+
+def cluster_emails(emails, max_distance=None):
+    """
+    Group identical and near-identical emails - returns a list of clusters (lists of emails)
+    in first-seen order. The first email of each cluster is the one to summarize; check
+    shares_analysis() before reusing its summary for the other members.
+    """
+    max_distance = SIMHASH_DISTANCE if max_distance is None else max_distance
+    clusters = []  # (fingerprint of the first member, members)
+    by_exact = {}
+
+    for email in emails:
+        fp = fingerprint(email)
+        members = by_exact.get(fp.exact)
+
+        if members is None and fp.simhash is not None:
+            members = next((
+                cluster_members for first, cluster_members in clusters
+                if first.simhash is not None and first.sender == fp.sender
+                and hamming_distance(first.simhash, fp.simhash) <= max_distance
+            ), None)
+
+        if members is None:
+            members = []
+            clusters.append((fp, members))
+        by_exact[fp.exact] = members
+        members.append(email)
+
+    return [members for _, members in clusters]
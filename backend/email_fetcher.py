@@ -1,71 +1,162 @@
 import os
+import time
 import base64
-from google.oauth2.credentials import Credentials
-from google_auth_oauthlib.flow import InstalledAppFlow
-from google.auth.transport.requests import Request
+import threading
+import httplib2
+import google_auth_httplib2
 from googleapiclient.discovery import build
-import pickle
+from googleapiclient.errors import HttpError
+from credential_store import GmailNotAuthorized
 from email.mime.text import MIMEText
-from bs4 import BeautifulSoup
+from mime_body import extract_text
 
-SCOPES = ['https://www.googleapis.com/auth/gmail.modify']
+# Gmail accepts up to 100 sub-requests per batch HTTP call
+BATCH_SIZE = 100
+BATCH_MAX_RETRIES = 3
+RETRYABLE_STATUSES = {429, 500, 502, 503, 504}
+
+# Raw email bodies are cut to this many characters (email_preprocess fits them to the prompt budget)
+BODY_CHAR_LIMIT = int(os.getenv('BODY_CHAR_LIMIT', 20000))
+
+# Headers requested by metadata-only (listing) fetches
+LISTING_HEADERS = ['Subject', 'From', 'Date']
+
+# Headers kept on full fetches for the local pre-classifier (bulk/automated mail signals)
+CLASSIFIER_HEADERS = ['List-Unsubscribe', 'List-Id', 'Precedence', 'Auto-Submitted', 'Reply-To']
+
+def is_retryable_error(exception):
+    """Rate limits, server errors and transport failures are worth retrying"""
+    if isinstance(exception, HttpError):
+        return exception.resp.status in RETRYABLE_STATUSES
+    return True
 
 class EmailFetcher:
-    def __init__(self):
+    def __init__(self, user_id, credential_store):
+        self.user_id = user_id
+        self.credential_store = credential_store
         self.service = None
+        self.creds = None
+        self._local = threading.local()
         self.authenticate()
     
     def authenticate(self):
-        """Authenticate with Gmail API"""
-        creds = None
-        
-        # Token.pickle stores the user's access and refresh tokens
-        if os.path.exists('token.pickle'):
-            with open('token.pickle', 'rb') as token:
-                creds = pickle.load(token)
-        
-        # If there are no valid credentials, let the user log in
-        if not creds or not creds.valid:
-            if creds and creds.expired and creds.refresh_token:
-                creds.refresh(Request())
-            else:
-                flow = InstalledAppFlow.from_client_secrets_file(
-                    'credentials.json', SCOPES)
-                creds = flow.run_local_server(port=0)
-            
-            # Save the credentials for the next run
-            with open('token.pickle', 'wb') as token:
-                pickle.dump(creds, token)
+        """Authenticate with Gmail API using the user's stored credentials"""
+        # The credential store holds each user's access and refresh tokens
+        creds = self.credential_store.load(self.user_id)
+        
+        # Consent is granted in a separate setup step (python credential_store.py authorize <uid>),
+        # never here - this runs on request paths
+        if not creds:
+            raise GmailNotAuthorized(f"No Gmail credentials stored for user {self.user_id}")
+        if not creds.valid:
+            if not creds.refresh_token:
+                raise GmailNotAuthorized(f"Gmail credentials for user {self.user_id} expired and cannot be refreshed")
+            creds = self.credential_store.refresh(self.user_id)
         
-        self.service = build('gmail', 'v1', credentials=creds)
-        print("✅ Successfully authenticated with Gmail!")
+        self.creds = creds
+        
+        # Use the discovery document bundled with the client library - no network fetch
+        self.service = build(
+            'gmail', 'v1',
+            credentials=creds,
+            static_discovery=True,
+            cache_discovery=False
+        )
+        print(f"✅ Successfully authenticated with Gmail for user {self.user_id}!")
+    
+    def refresh_credentials(self):
+        """Refresh the access token if it has expired (normally done ahead of time in the background)"""
+        if not self.creds.valid:
+            self.creds = self.credential_store.refresh(self.user_id)
+    
+    def _http(self):
+        """Per-thread authorized transport, since httplib2 connections are not thread-safe"""
+        http = getattr(self._local, 'http', None)
+        if http is None:
+            http = google_auth_httplib2.AuthorizedHttp(self.creds, http=httplib2.Http(timeout=30))
+            self._local.http = http
+        return http
     
     def fetch_emails(self, max_results=3):
         """Fetch recent unread emails"""
+        msg_ids = self.list_unread_ids(max_results)
+        
+        if not msg_ids:
+            print("No unread emails found.")
+            return []
+        
+        return self.get_emails_details(msg_ids)
+    
+    def list_unread_ids(self, max_results=3):
+        """List the IDs of recent unread emails"""
+        return self.list_message_ids(max_results, query='is:unread')
+    
+    def list_message_ids(self, max_results=3, query='is:unread'):
+        """List the IDs of recent emails matching a Gmail search query"""
         try:
             results = self.service.users().messages().list(
                 userId='me',
-                q='is:unread',
+                q=query,
                 maxResults=max_results
-            ).execute()
-            
-            messages = results.get('messages', [])
+            ).execute(http=self._http())
             
-            if not messages:
-                print("No unread emails found.")
-                return []
-            
-            emails = []
-            for message in messages:
-                email_data = self.get_email_details(message['id'])
-                emails.append(email_data)
-            
-            return emails
+            return [message['id'] for message in results.get('messages', [])]
         
         except Exception as e:
-            print(f"Error fetching emails: {e}")
+            print(f"Error listing emails: {e}")
             return []
     
+    def get_history_id(self):
+        """Get the mailbox's current history ID (the checkpoint for incremental sync)"""
+        profile = self.service.users().getProfile(userId='me').execute(http=self._http())
+        return profile['historyId']
+    
+    def list_new_message_ids(self, start_history_id, max_results=50):
+        """
+        List unread emails added since start_history_id
+        Returns (msg_ids, history_id) where history_id is the checkpoint to resume from,
+        or (None, None) if the history is unavailable and a full sync is needed
+        """
+        msg_ids = []
+        history_id = start_history_id
+        page_token = None
+        
+        try:
+            while True:
+                response = self.service.users().history().list(
+                    userId='me',
+                    startHistoryId=start_history_id,
+                    historyTypes=['messageAdded'],
+                    labelId='UNREAD',
+                    pageToken=page_token
+                ).execute(http=self._http())
+                
+                # History records come oldest first
+                for record in response.get('history', []):
+                    for added in record.get('messagesAdded', []):
+                        message = added['message']
+                        if message['id'] in msg_ids or 'UNREAD' not in message.get('labelIds', []):
+                            continue
+                        if len(msg_ids) >= max_results:
+                            # Stop here and resume from this record on the next sync
+                            return msg_ids, history_id
+                        msg_ids.append(message['id'])
+                    history_id = record['id']
+                
+                page_token = response.get('nextPageToken')
+                if not page_token:
+                    return msg_ids, response.get('historyId', history_id)
+        
+        except HttpError as e:
+            if e.resp.status == 404:
+                print("History ID expired, falling back to full sync")
+            else:
+                print(f"Error listing mailbox history: {e}")
+            return None, None
+        except Exception as e:
+            print(f"Error listing mailbox history: {e}")
+            return None, None
+    
     def get_email_details(self, msg_id):
         """Get detailed information about an email"""
         try:
@@ -73,51 +164,124 @@ class EmailFetcher:
                 userId='me',
                 id=msg_id,
                 format='full'
-            ).execute()
+            ).execute(http=self._http())
             
-            headers = message['payload']['headers']
-            
-            # Extract headers
-            subject = next((h['value'] for h in headers if h['name'] == 'Subject'), 'No Subject')
-            sender = next((h['value'] for h in headers if h['name'] == 'From'), 'Unknown')
-            date = next((h['value'] for h in headers if h['name'] == 'Date'), 'Unknown')
-            
-            # Extract body
-            body = self.extract_body(message['payload'])
-            
-            return {
-                'id': msg_id,
-                'subject': subject,
-                'sender': sender,
-                'date': date,
-                'body': body
-            }
+            return self.parse_message(message)
         
         except Exception as e:
             print(f"Error getting email details: {e}")
             return None
     
+    def list_inbox(self, max_results=20, unread_only=False):
+        """Fast inbox listing - headers and snippet only, no message bodies or attachments"""
+        msg_ids = self.list_message_ids(max_results, query='is:unread' if unread_only else 'in:inbox')
+        return self.get_emails_details(msg_ids, metadata_only=True) if msg_ids else []
+    
+    def get_emails_details(self, msg_ids, metadata_only=False):
+        """
+        Get detailed information about many emails using Gmail batch requests
+        With metadata_only, fetches just the listing headers and snippet instead of full bodies
+        """
+        details = {}
+        pending = list(msg_ids)
+        
+        for attempt in range(BATCH_MAX_RETRIES + 1):
+            failed = []
+            for start in range(0, len(pending), BATCH_SIZE):
+                failed.extend(self._execute_details_batch(pending[start:start + BATCH_SIZE], details, metadata_only))
+            
+            if not failed:
+                break
+            
+            # Only the failed sub-requests are retried, with exponential backoff
+            pending = failed
+            if attempt < BATCH_MAX_RETRIES:
+                delay = 2 ** attempt
+                print(f"  Retrying {len(failed)} failed message(s) in {delay}s...")
+                time.sleep(delay)
+            else:
+                print(f"Giving up on {len(failed)} message(s) after {BATCH_MAX_RETRIES} retries")
+        
+        # Preserve the listing order, dropping messages that could not be fetched
+        return [details[msg_id] for msg_id in msg_ids if msg_id in details]
+    
+    def _execute_details_batch(self, msg_ids, details, metadata_only=False):
+        """Run one batch HTTP call - returns the IDs of sub-requests worth retrying"""
+        failed = []
+        parse = self.parse_metadata if metadata_only else self.parse_message
+        
+        def on_response(request_id, response, exception):
+            if exception is not None:
+                if is_retryable_error(exception):
+                    failed.append(request_id)
+                else:
+                    print(f"Error getting email details for {request_id}: {exception}")
+                return
+            try:
+                details[request_id] = parse(response)
+            except Exception as e:
+                print(f"Error parsing email {request_id}: {e}")
+        
+        batch = self.service.new_batch_http_request(callback=on_response)
+        for msg_id in msg_ids:
+            if metadata_only:
+                request = self.service.users().messages().get(
+                    userId='me', id=msg_id, format='metadata', metadataHeaders=LISTING_HEADERS
+                )
+            else:
+                request = self.service.users().messages().get(userId='me', id=msg_id, format='full')
+            batch.add(request, request_id=msg_id)
+        
+        try:
+            batch.execute(http=self._http())
+        except Exception as e:
+            # The whole HTTP call failed - retry everything that has no result yet
+            print(f"Error executing Gmail batch: {e}")
+            return [msg_id for msg_id in msg_ids if msg_id not in details]
+        
+        return failed
+    
+    def parse_message(self, message):
+        """Convert a Gmail API message resource into our email dict"""
+        headers = message['payload']['headers']
+        
+        # Extract headers
+        subject = next((h['value'] for h in headers if h['name'] == 'Subject'), 'No Subject')
+        sender = next((h['value'] for h in headers if h['name'] == 'From'), 'Unknown')
+        date = next((h['value'] for h in headers if h['name'] == 'Date'), 'Unknown')
+        
+        # Extract body
+        body = self.extract_body(message['payload'])
+        
+        wanted = {name.lower(): name for name in CLASSIFIER_HEADERS}
+        
+        return {
+            'id': message['id'],
+            'subject': subject,
+            'sender': sender,
+            'date': date,
+            'body': body,
+            'headers': {wanted[h['name'].lower()]: h['value'] for h in headers if h['name'].lower() in wanted},
+            'labels': message.get('labelIds', [])
+        }
+    
+    def parse_metadata(self, message):
+        """Convert a format='metadata' message resource into a listing entry"""
+        headers = message['payload'].get('headers', [])
+        
+        return {
+            'id': message['id'],
+            'thread_id': message.get('threadId'),
+            'subject': next((h['value'] for h in headers if h['name'] == 'Subject'), 'No Subject'),
+            'sender': next((h['value'] for h in headers if h['name'] == 'From'), 'Unknown'),
+            'date': next((h['value'] for h in headers if h['name'] == 'Date'), 'Unknown'),
+            'snippet': message.get('snippet', ''),
+            'unread': 'UNREAD' in message.get('labelIds', [])
+        }
+    
     def extract_body(self, payload):
-        """Extract email body from payload"""
-        body = ""
-        
-        if 'parts' in payload:
-            for part in payload['parts']:
-                if part['mimeType'] == 'text/plain':
-                    if 'data' in part['body']:
-                        body = base64.urlsafe_b64decode(part['body']['data']).decode('utf-8')
-                        break
-                elif part['mimeType'] == 'text/html':
-                    if 'data' in part['body']:
-                        html_body = base64.urlsafe_b64decode(part['body']['data']).decode('utf-8')
-                        body = BeautifulSoup(html_body, 'html.parser').get_text()
-        else:
-            if 'body' in payload and 'data' in payload['body']:
-                body = base64.urlsafe_b64decode(payload['body']['data']).decode('utf-8')
-        
-        # Clean up body
-        body = ' '.join(body.split())
-        return body[:2000]  # Limit to first 2000 chars
+        """Extract email body from payload (walks nested multipart, stops decoding at the size limit)"""
+        return extract_text(payload, limit=BODY_CHAR_LIMIT)
     
     def mark_as_read(self, msg_id):
         """Mark email as read"""
@@ -126,7 +290,7 @@ class EmailFetcher:
                 userId='me',
                 id=msg_id,
                 body={'removeLabelIds': ['UNREAD']}
-            ).execute()
+            ).execute(http=self._http())
             print(f"✅ Marked email {msg_id} as read")
         except Exception as e:
             print(f"Error marking email as read: {e}")
@@ -143,7 +307,7 @@ class EmailFetcher:
             self.service.users().messages().send(
                 userId='me',
                 body={'raw': raw}
-            ).execute()
+            ).execute(http=self._http())
             
             print(f"✅ Reply sent to {to_email}")
             return True
@@ -0,0 +1,142 @@
+import os
+import re
+
+# Rough size of a token for English text (matches the estimate used to pack bulk prompts)
+CHARS_PER_TOKEN = 4
+
+# Body token budgets for each summary length preference
+SUMMARY_LENGTH_BUDGETS = {
+    "Short": int(os.getenv('BODY_TOKENS_SHORT', 300)),
+    "Medium": int(os.getenv('BODY_TOKENS_MEDIUM', 600)),
+    "Detailed": int(os.getenv('BODY_TOKENS_DETAILED', 1500)),
+}
+DEFAULT_SUMMARY_LENGTH = "Medium"
+
+# Upper bound on the body budget per model (models not listed use the default)
+MODEL_BODY_TOKEN_LIMITS = {
+    "gemini-pro": 1000,
+}
+DEFAULT_MODEL_BODY_TOKENS = 4000
+
+TRUNCATION_MARKER = "\n[...]"
+
+# "On Mon, 1 Jan 2024 at 10:00, Jane <jane@example.com> wrote:" (clients often wrap it over two lines)
+REPLY_HEADER_RE = re.compile(r'^On\b.*\bwrote:$', re.IGNORECASE)
+ORIGINAL_MESSAGE_RE = re.compile(r'^-{2,}\s*Original Message\s*-{2,}$', re.IGNORECASE)
+OUTLOOK_HEADER_RE = re.compile(r'^\*?From:\*?\s', re.IGNORECASE)
+OUTLOOK_FIELD_RE = re.compile(r'^\*?(Sent|Date|To|Subject):\*?\s', re.IGNORECASE)
+OUTLOOK_RULE_RE = re.compile(r'^_{10,}$')
+# Gmail / Apple Mail forward markers - what follows is the content being forwarded, not reply history
+FORWARDED_RE = re.compile(r'^(-{2,}\s*Forwarded message\s*-{2,}|Begin forwarded message:)$', re.IGNORECASE)
+
+SIGNATURE_DELIMITERS = {'--', '-- ', '__'}
+MOBILE_SIGNOFF_RE = re.compile(
+    r'^(Sent from my \w+|Sent from (Mail|Outlook) for \w+|Get Outlook for \w+|Sent from Yahoo Mail.*)$',
+    re.IGNORECASE
+)
+
+BOILERPLATE_RE = re.compile(
+    r'intended recipient|privileged and confidential|confidentiality notice|'
+    r'unsubscribe|view (this|it) in (your|a) browser|manage (your )?(email )?preferences|'
+    r'this (e-?mail|message) was sent to|you are receiving this|no longer wish to receive|all rights reserved',
+    re.IGNORECASE
+)
+
+# Footers are written by the sender's systems, never in the first person ("please unsubscribe me...")
+FIRST_PERSON_RE = re.compile(r"\bI\b|\b[Mm][ey]\b")
+
+def estimate_tokens(text):
+    """Rough token count (~4 characters per token)"""
+    return len(text) // CHARS_PER_TOKEN + 1
+
+def body_token_budget(summary_length=DEFAULT_SUMMARY_LENGTH, model=None):
+    """Body token budget for a summary length preference, capped by the model's limit"""
+    budget = SUMMARY_LENGTH_BUDGETS.get(summary_length, SUMMARY_LENGTH_BUDGETS[DEFAULT_SUMMARY_LENGTH])
+    return min(budget, MODEL_BODY_TOKEN_LIMITS.get(model, DEFAULT_MODEL_BODY_TOKENS))
+
+def _quote_start(lines):
+    """Index of the line where quoted reply history begins, or None"""
+    for idx, line in enumerate(lines):
+        stripped = line.strip()
+        next_line = lines[idx + 1].strip() if idx + 1 < len(lines) else ''
+
+        # A forwarded message's header block and body are the point of the email - keep them
+        if FORWARDED_RE.match(stripped):
+            return None
+        if REPLY_HEADER_RE.match(stripped):
+            return idx
+        if stripped.startswith('On ') and REPLY_HEADER_RE.match(f"{stripped} {next_line}"):
+            return idx
+        if ORIGINAL_MESSAGE_RE.match(stripped):
+            return idx
+        if OUTLOOK_RULE_RE.match(stripped) and OUTLOOK_HEADER_RE.match(next_line):
+            return idx
+        # Outlook-style header block: "From:" followed closely by "Sent:"/"To:"/"Subject:"
+        if idx and OUTLOOK_HEADER_RE.match(stripped) and any(
+            OUTLOOK_FIELD_RE.match(following.strip()) for following in lines[idx + 1:idx + 4]
+        ):
+            return idx
+    return None
+
+def strip_quoted(lines):
+    """Drop quoted reply history - the trailing quoted thread and any '>' quoted lines"""
+    start = _quote_start(lines)
+    if start:  # Keep it if the whole email is quoted history
+        lines = lines[:start]
+    return [line for line in lines if not line.lstrip().startswith('>')]
+
+def strip_signature(lines):
+    """Drop everything after a signature delimiter, and mobile client sign-offs"""
+    for idx, line in enumerate(lines):
+        if idx and line.rstrip() in SIGNATURE_DELIMITERS:
+            lines = lines[:idx]
+            break
+    return [line for line in lines if not MOBILE_SIGNOFF_RE.match(line.strip())]
+
+def is_footer(paragraph):
+    """A legal notice or mailing-list footer paragraph"""
+    return bool(BOILERPLATE_RE.search(paragraph)) and not FIRST_PERSON_RE.search(paragraph)
+
+def strip_boilerplate(text):
+    """Drop legal footers and mailing-list boilerplate - only trailing paragraphs, never the first one"""
+    paragraphs = [p for p in re.split(r'\n\s*\n', text) if p.strip()]
+    end = len(paragraphs)
+    while end > 1 and is_footer(paragraphs[end - 1]):
+        end -= 1
+    return '\n\n'.join(paragraphs[:end])
+
+def clean_body(text):
+    """Strip quoted history, signatures and boilerplate, keeping the message's own content"""
+    if not text:
+        return ''
+
+    lines = [line.rstrip() for line in text.replace('\r\n', '\n').replace('\r', '\n').split('\n')]
+    lines = strip_signature(strip_quoted(lines))
+    cleaned = strip_boilerplate('\n'.join(lines))
+    cleaned = re.sub(r'\n{3,}', '\n\n', cleaned).strip()
+
+    # Never hand the model an empty body because every line looked like noise
+    return cleaned or text.strip()
+
+def fit_to_budget(text, max_tokens):
+    """Cut text to roughly max_tokens, preferring a paragraph, line or sentence boundary"""
+    max_chars = max_tokens * CHARS_PER_TOKEN
+    if len(text) <= max_chars:
+        return text
+
+    cut = text[:max_chars - len(TRUNCATION_MARKER)]
+    for boundary in ('\n\n', '\n', '. ', ' '):
+        position = cut.rfind(boundary)
+        if position > len(cut) // 2:
+            cut = cut[:position + 1]
+            break
+    return cut.rstrip() + TRUNCATION_MARKER
+
+def prepare_email(email_data, summary_length=DEFAULT_SUMMARY_LENGTH, model=None):
+    """Copy of the email with its body cleaned and fitted to the prompt token budget"""
+    body = fit_to_budget(clean_body(email_data.get('body', '')), body_token_budget(summary_length, model))
+    return {**email_data, 'body': body}
+
+def prepare_emails(emails, summary_length=DEFAULT_SUMMARY_LENGTH, model=None):
+    """Prepare a list of emails for prompting"""
+    return [prepare_email(email, summary_length, model) for email in emails]
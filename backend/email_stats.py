@@ -0,0 +1,223 @@
+import os
+import sys
+from datetime import date, timedelta
+from firebase_admin import firestore
+
+# Per-user aggregate counters live in user_stats/{user_id},
+# with daily rollups in user_stats/{user_id}/daily/{YYYY-MM-DD}.
+# The stats document's rebuilt_at marks that both were built from the stored emails;
+# increments alone (which create the document too) don't count as built.
+STATS_COLLECTION = 'user_stats'
+DAILY_COLLECTION = 'daily'
+
+GRANULARITIES = ("day", "week", "month")
+
+URGENCY_LEVELS = ["High", "Medium", "Low"]
+CATEGORIES = ["Work", "Personal", "Promotion", "Other"]
+
+def stats_ref(db, user_id):
+    """Reference to a user's aggregate stats document"""
+    return db.collection(STATS_COLLECTION).document(user_id)
+
+def stats_increments(email_doc, delta=1):
+    """Counter increments for adding (delta=1) or removing (delta=-1) one email - apply with set(merge=True)"""
+    return {
+        'total': firestore.Increment(delta),
+        'urgency': {email_doc.get('urgency', 'Medium'): firestore.Increment(delta)},
+        'category': {email_doc.get('category', 'Other'): firestore.Increment(delta)},
+        'updated_at': firestore.SERVER_TIMESTAMP
+    }
+
+def daily_ref(db, user_id, day):
+    """Reference to a user's rollup document for one (UTC) day"""
+    return stats_ref(db, user_id).collection(DAILY_COLLECTION).document(day.isoformat())
+
+def daily_increments(email_doc, day, delta=1):
+    """Rollup increments for one email on a given day - apply with set(merge=True)"""
+    return {**stats_increments(email_doc, delta), 'date': day.isoformat()}
+
+def empty_stats():
+    return {
+        'total': 0,
+        'urgency': {level: 0 for level in URGENCY_LEVELS},
+        'category': {category: 0 for category in CATEGORIES}
+    }
+
+def read_stats(db, user_id):
+    """Read a user's aggregate counters - returns None if they haven't been built yet"""
+    doc = stats_ref(db, user_id).get()
+    if not doc.exists or 'rebuilt_at' not in doc.to_dict():
+        return None
+    return _counters(doc.to_dict())
+
+def _counters(data):
+    """The counters held in a stats or rollup document (all zero for a missing one)"""
+    stats = empty_stats()
+    if data:
+        stats['total'] = data.get('total', 0)
+        stats['urgency'].update(data.get('urgency', {}))
+        stats['category'].update(data.get('category', {}))
+    return stats
+
+def _carry_over(recount, current, counted):
+    """recount + (current - counted): add the increments made since the recount's snapshot"""
+    stats = empty_stats()
+    stats['total'] = recount['total'] + current['total'] - counted['total']
+    for field in ('urgency', 'category'):
+        for key in set(recount[field]) | set(current[field]) | set(counted[field]):
+            stats[field][key] = recount[field].get(key, 0) + current[field].get(key, 0) - counted[field].get(key, 0)
+    return stats
+
+def ensure_user_stats(db, user_id):
+    """A user's aggregate counters, rebuilding them (and the daily rollups) first if they were never built"""
+    stats = read_stats(db, user_id)
+    if stats is None:
+        print(f"📊 Building analytics aggregates for user {user_id}...")
+        stats = rebuild_user_stats(db, user_id)
+    return stats
+
+def _count(stats, data):
+    stats['total'] += 1
+    urgency = data.get('urgency', 'Medium')
+    category = data.get('category', 'Other')
+    stats['urgency'][urgency] = stats['urgency'].get(urgency, 0) + 1
+    stats['category'][category] = stats['category'].get(category, 0) + 1
+
+def rebuild_user_stats(db, user_id):
+    """
+    Recount a user's stats and daily rollups from their stored emails (one full scan)
+    The scan reads a snapshot; emails stored while it runs are counted by their own increments,
+    which are carried over onto the recount instead of being overwritten
+    """
+    ref = stats_ref(db, user_id)
+    daily_collection = ref.collection(DAILY_COLLECTION)
+
+    # Emails and counters as of one instant - each email is created in the same write as its increments
+    snapshot = ref.get()
+    read_time = snapshot.read_time
+    counted = _counters(snapshot.to_dict() if snapshot.exists else None)
+    counted_daily = {doc.id: _counters(doc.to_dict()) for doc in daily_collection.stream(read_time=read_time)}
+
+    stats = empty_stats()
+    daily = {}
+    emails = db.collection('emails')\
+        .where('user_id', '==', user_id)\
+        .select(['urgency', 'category', 'created_at'])\
+        .stream(read_time=read_time)
+
+    for doc in emails:
+        data = doc.to_dict()
+        _count(stats, data)
+        if data.get('created_at'):
+            day = data['created_at'].date().isoformat()
+            _count(daily.setdefault(day, empty_stats()), data)
+
+    @firestore.transactional
+    def write(transaction):
+        current = ref.get(transaction=transaction)
+        current_daily = {doc.id: _counters(doc.to_dict()) for doc in transaction.get(daily_collection)}
+
+        result = _carry_over(stats, _counters(current.to_dict() if current.exists else None), counted)
+        transaction.set(ref, {
+            **result,
+            'updated_at': firestore.SERVER_TIMESTAMP,
+            'rebuilt_at': firestore.SERVER_TIMESTAMP
+        })
+        for day in set(daily) | set(current_daily):
+            day_stats = _carry_over(
+                daily.get(day, empty_stats()), current_daily.get(day, empty_stats()), counted_daily.get(day, empty_stats())
+            )
+            if day_stats['total'] > 0:
+                transaction.set(daily_collection.document(day), {**day_stats, 'date': day})
+            else:
+                transaction.delete(daily_collection.document(day))
+        return result
+
+    return write(db.transaction())
+
+def reset_user_stats(db, user_id):
+    """Zero a user's counters and drop their rollups (after all their emails are deleted)"""
+    _delete_daily(db, user_id)
+    stats_ref(db, user_id).set({
+        **empty_stats(),
+        'updated_at': firestore.SERVER_TIMESTAMP,
+        'rebuilt_at': firestore.SERVER_TIMESTAMP
+    })
+
+def _delete_daily(db, user_id):
+    batch = db.batch()
+    for count, doc in enumerate(stats_ref(db, user_id).collection(DAILY_COLLECTION).select(['__name__']).stream(), 1):
+        batch.delete(doc.reference)
+        if count % 400 == 0:
+            batch.commit()
+            batch = db.batch()
+    batch.commit()
+
+def period_start(day, granularity):
+    """First day of the week (Monday) or month containing day"""
+    if granularity == "week":
+        return day - timedelta(days=day.weekday())
+    if granularity == "month":
+        return day.replace(day=1)
+    return day
+
+def _next_period(start, granularity):
+    if granularity == "week":
+        return start + timedelta(days=7)
+    if granularity == "month":
+        return (start.replace(day=28) + timedelta(days=4)).replace(day=1)
+    return start + timedelta(days=1)
+
+def read_trends(db, user_id, start, end, granularity="day"):
+    """
+    Bucket a user's daily rollups between start and end (inclusive) by day, week or month
+    Returns one zero-filled point per period, oldest first
+    """
+    buckets = {}
+    period = period_start(start, granularity)
+    while period <= end:
+        buckets[period] = empty_stats()
+        period = _next_period(period, granularity)
+
+    rollups = stats_ref(db, user_id).collection(DAILY_COLLECTION)\
+        .where('date', '>=', start.isoformat())\
+        .where('date', '<=', end.isoformat())\
+        .stream()
+
+    for doc in rollups:
+        data = doc.to_dict()
+        bucket = buckets[period_start(date.fromisoformat(data['date']), granularity)]
+        bucket['total'] += data.get('total', 0)
+        for field in ('urgency', 'category'):
+            for key, value in data.get(field, {}).items():
+                bucket[field][key] = bucket[field].get(key, 0) + value
+
+    return [{'period': period.isoformat(), **stats} for period, stats in buckets.items()]
+
+def rebuild_all_stats(db):
+    """Rebuild the aggregates for every user that has stored emails"""
+    user_ids = set()
+    for doc in db.collection('emails').select(['user_id']).stream():
+        user_ids.add(doc.get('user_id'))
+
+    for user_id in sorted(user_ids):
+        stats = rebuild_user_stats(db, user_id)
+        print(f"  ✅ {user_id}: {stats['total']} emails")
+    return len(user_ids)
+
+if __name__ == "__main__":
+    # Usage: python email_stats.py [user_id ...]  (rebuilds every user when none are given)
+    import firebase_admin
+    from firebase_admin import credentials
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    firebase_admin.initialize_app(credentials.Certificate(os.getenv('FIREBASE_SERVICE_ACCOUNT_KEY_PATH')))
+    client = firestore.client()
+
+    print("📊 Rebuilding email analytics aggregates...")
+    if len(sys.argv) > 1:
+        for uid in sys.argv[1:]:
+            print(f"  ✅ {uid}: {rebuild_user_stats(client, uid)['total']} emails")
+    else:
+        print(f"✅ Rebuilt stats for {rebuild_all_stats(client)} users")
@@ -0,0 +1,142 @@
+import os
+import asyncio
+import hashlib
+from fastapi.concurrency import run_in_threadpool
+from google.api_core.exceptions import AlreadyExists
+
+# Firestore rejects batches with more than 500 writes
+MAX_BATCH_WRITES = 500
+
+def email_doc_id(user_id, email_id):
+    """Deterministic document ID for a user's email, so a re-fetch can't store (or count) it twice"""
+    return hashlib.sha256(f"{user_id}:{email_id}".encode('utf-8')).hexdigest()[:40]
+
+class BatchWriter:
+    """Write-behind buffer that groups Firestore writes into WriteBatch commits"""
+
+    def __init__(self, db, max_batch_size=None, flush_interval=None):
+        self.db = db
+        self.max_batch_size = min(int(max_batch_size or os.getenv('FIRESTORE_BATCH_SIZE', MAX_BATCH_WRITES)), MAX_BATCH_WRITES)
+        self.flush_interval = float(flush_interval or os.getenv('FIRESTORE_FLUSH_INTERVAL', 1.0))
+        self._pending = []  # (operation, future, writes)
+        self._pending_writes = 0
+        self._flush_lock = asyncio.Lock()
+        self._flusher = None
+        self._flush_tasks = set()  # strong references, so size-triggered flushes aren't garbage-collected
+        self.commits = 0
+        self.writes = 0
+
+    async def start(self):
+        """Start the periodic (time-based) flusher"""
+        self._flusher = asyncio.create_task(self._flush_periodically())
+
+    async def stop(self):
+        """Stop the periodic flusher and commit everything still buffered"""
+        if self._flusher is not None:
+            self._flusher.cancel()
+            await asyncio.gather(self._flusher, return_exceptions=True)
+            self._flusher = None
+        if self._flush_tasks:
+            await asyncio.gather(*self._flush_tasks, return_exceptions=True)
+        await self.flush()
+        print(f"💾 Flushed Firestore writes ({self.writes} writes in {self.commits} commits)")
+
+    async def set(self, doc_ref, data, merge=False, wait=True):
+        """Buffer a document set - with wait=True, returns once the write is committed"""
+        return await self._enqueue(lambda batch: batch.set(doc_ref, data, merge=merge), wait)
+
+    async def create(self, doc_ref, data, merges=(), wait=True):
+        """
+        Buffer a document create together with (doc_ref, data) merge sets that only apply if it succeeds
+        Raises AlreadyExists when the document is already stored (nothing is written then)
+        """
+        def operation(batch):
+            batch.create(doc_ref, data)
+            for merge_ref, merge_data in merges:
+                batch.set(merge_ref, merge_data, merge=True)
+        return await self._enqueue(operation, wait, writes=1 + len(merges))
+
+    async def update(self, doc_ref, data, wait=True):
+        """Buffer a document update"""
+        return await self._enqueue(lambda batch: batch.update(doc_ref, data), wait)
+
+    async def delete(self, doc_ref, wait=True):
+        """Buffer a document delete"""
+        return await self._enqueue(lambda batch: batch.delete(doc_ref), wait)
+
+    async def _enqueue(self, operation, wait, writes=1):
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((operation, future, writes))
+        self._pending_writes += writes
+
+        # Size-based flush
+        if self._pending_writes >= self.max_batch_size:
+            task = asyncio.create_task(self.flush())
+            self._flush_tasks.add(task)
+            task.add_done_callback(self._flush_tasks.discard)
+
+        if wait:
+            await future
+        else:
+            future.add_done_callback(_log_write_error)
+
+    async def flush(self):
+        """Commit all buffered writes, in chunks of at most max_batch_size writes"""
+        async with self._flush_lock:
+            while self._pending:
+                chunk = self._take_chunk()
+                try:
+                    await self._commit(chunk)
+                except AlreadyExists:
+                    # One create hit an existing document, failing the whole batch - commit each entry
+                    # on its own so only that entry fails
+                    for entry in chunk:
+                        try:
+                            await self._commit([entry])
+                        except Exception as e:
+                            _fail([entry], e)
+                except Exception as e:
+                    print(f"❌ Firestore batch commit failed ({sum(writes for _, _, writes in chunk)} writes): {str(e)}")
+                    _fail(chunk, e)
+
+    def _take_chunk(self):
+        """Pop the oldest entries holding at most max_batch_size writes (always at least one entry)"""
+        size = writes = 0
+        for _, _, entry_writes in self._pending:
+            if size and writes + entry_writes > self.max_batch_size:
+                break
+            size += 1
+            writes += entry_writes
+        chunk = self._pending[:size]
+        del self._pending[:size]
+        self._pending_writes -= writes
+        return chunk
+
+    async def _commit(self, chunk):
+        batch = self.db.batch()
+        for operation, _, _ in chunk:
+            operation(batch)
+        await run_in_threadpool(batch.commit)
+
+        self.commits += 1
+        self.writes += sum(writes for _, _, writes in chunk)
+        for _, future, _ in chunk:
+            if not future.done():
+                future.set_result(None)
+
+    async def _flush_periodically(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except Exception as e:
+                print(f"⚠️  Periodic Firestore flush failed: {str(e)}")
+
+def _fail(chunk, error):
+    for _, future, _ in chunk:
+        if not future.done():
+            future.set_exception(error)
+
+def _log_write_error(future):
+    if not future.cancelled() and future.exception() is not None and not isinstance(future.exception(), AlreadyExists):
+        print(f"⚠️  Background Firestore write failed: {future.exception()}")
@@ -0,0 +1,69 @@
+import os
+import time
+import threading
+from email_fetcher import EmailFetcher
+
+class _ClientEntry:
+    def __init__(self):
+        self.fetcher = None
+        self.last_used = time.monotonic()
+        self.lock = threading.Lock()
+
+class GmailClientRegistry:
+    """Process-wide registry of authenticated Gmail clients, keyed by user"""
+
+    def __init__(self, credential_store, idle_timeout=None):
+        self.credential_store = credential_store
+        self.idle_timeout = int(idle_timeout or os.getenv('GMAIL_CLIENT_IDLE_TIMEOUT', 1800))
+        self._clients = {}
+        self._lock = threading.Lock()
+
+    def get(self, user_id):
+        """Return the user's EmailFetcher, building it on first use and refreshing its token lazily"""
+        self.evict_idle()
+
+        with self._lock:
+            entry = self._clients.get(user_id)
+            if entry is None:
+                entry = _ClientEntry()
+                self._clients[user_id] = entry
+
+        # Build outside the registry lock so one slow authentication doesn't block other users
+        with entry.lock:
+            if entry.fetcher is None:
+                try:
+                    entry.fetcher = EmailFetcher(user_id, self.credential_store)
+                except Exception:
+                    with self._lock:
+                        if self._clients.get(user_id) is entry:
+                            del self._clients[user_id]
+                    self.credential_store.evict(user_id)
+                    raise
+            entry.last_used = time.monotonic()
+            fetcher = entry.fetcher
+
+        fetcher.refresh_credentials()
+        return fetcher
+
+    def evict_idle(self):
+        """Drop clients that haven't been used within the idle timeout, along with their cached credentials"""
+        cutoff = time.monotonic() - self.idle_timeout
+        with self._lock:
+            idle = [user_id for user_id, entry in self._clients.items()
+                    if entry.fetcher is not None and entry.last_used < cutoff]
+            for user_id in idle:
+                del self._clients[user_id]
+        # Otherwise the store's background refresher keeps renewing tokens for users who left
+        for user_id in idle:
+            self.credential_store.evict(user_id)
+        if idle:
+            print(f"🧹 Evicted {len(idle)} idle Gmail client(s)")
+
+    def invalidate(self, user_id):
+        """Forget a user's client, e.g. after their credentials change"""
+        with self._lock:
+            self._clients.pop(user_id, None)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._clients)
@@ -0,0 +1,124 @@
+import os
+import time
+import uuid
+import asyncio
+from datetime import datetime
+
+class Job:
+    """A unit of background work with per-item progress and partial results"""
+
+    def __init__(self, user_id, kind):
+        self.id = uuid.uuid4().hex
+        self.user_id = user_id
+        self.kind = kind
+        self.status = "queued"
+        self.total = 0
+        self.processed = 0
+        self.failed = 0
+        self.results = []
+        self.message = None
+        self.error = None
+        self.error_code = None
+        self.created_at = datetime.utcnow().isoformat()
+        self.updated_at = self.created_at
+        self.finished_at = None
+
+    def add_result(self, result):
+        """Record a successfully processed item"""
+        self.results.append(result)
+        self.processed += 1
+        self.updated_at = datetime.utcnow().isoformat()
+
+    def advance(self, count):
+        """Record progress on items that don't produce a result (e.g. deletions)"""
+        self.processed += count
+        self.updated_at = datetime.utcnow().isoformat()
+
+    def add_failure(self):
+        """Record an item that could not be processed"""
+        self.failed += 1
+        self.updated_at = datetime.utcnow().isoformat()
+
+    def to_dict(self):
+        return {
+            "job_id": self.id,
+            "kind": self.kind,
+            "status": self.status,
+            "total": self.total,
+            "processed": self.processed,
+            "failed": self.failed,
+            "results": self.results,
+            "message": self.message,
+            "error": self.error,
+            "error_code": self.error_code,
+            "created_at": self.created_at,
+            "updated_at": self.updated_at
+        }
+
+class JobQueue:
+    """In-process job queue drained by a pool of asyncio worker tasks"""
+
+    def __init__(self, workers=None, retention_seconds=None):
+        self.workers = int(workers or os.getenv('JOB_WORKERS', 4))
+        self.retention_seconds = int(retention_seconds or os.getenv('JOB_RETENTION_SECONDS', 3600))
+        self._jobs = {}
+        self._queue = None
+        self._tasks = []
+
+    async def start(self):
+        """Start the worker tasks on the running event loop"""
+        self._queue = asyncio.Queue()
+        self._tasks = [
+            asyncio.create_task(self._worker(idx)) for idx in range(self.workers)
+        ]
+        print(f"⚙️  Started {self.workers} job worker(s)")
+
+    async def stop(self):
+        """Cancel the worker tasks (jobs still queued are dropped)"""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def submit(self, user_id, kind, handler, *args):
+        """Queue handler(job, *args) to run in the background - returns the Job immediately"""
+        self._prune()
+        job = Job(user_id, kind)
+        self._jobs[job.id] = job
+        self._queue.put_nowait((job, handler, args))
+        return job
+
+    def get(self, job_id):
+        """Look up a job by ID"""
+        return self._jobs.get(job_id)
+
+    async def _worker(self, idx):
+        while True:
+            job, handler, args = await self._queue.get()
+            job.status = "running"
+            job.updated_at = datetime.utcnow().isoformat()
+            try:
+                await handler(job, *args)
+                job.status = "completed"
+            except asyncio.CancelledError:
+                job.status = "failed"
+                job.error = "Server shutting down"
+                raise
+            except Exception as e:
+                print(f"❌ Job {job.id} failed: {str(e)}")
+                job.status = "failed"
+                job.error = str(e)
+                # Exceptions may carry a machine-readable code the client can act on
+                job.error_code = getattr(e, 'error_code', None)
+            finally:
+                job.updated_at = datetime.utcnow().isoformat()
+                job.finished_at = time.monotonic()
+                self._queue.task_done()
+
+    def _prune(self):
+        """Forget finished jobs older than the retention period"""
+        cutoff = time.monotonic() - self.retention_seconds
+        expired = [job_id for job_id, job in self._jobs.items()
+                   if job.finished_at is not None and job.finished_at < cutoff]
+        for job_id in expired:
+            del self._jobs[job_id]
@@ -3,20 +3,39 @@
 # Updated to use email_fetcher.py and email_agent.py
 # ============================================
 
-from fastapi import FastAPI, HTTPException, Depends, Header
+from fastapi import FastAPI, HTTPException, Depends, Header, Query
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel, EmailStr
 from typing import List, Optional, Dict
 import os
-from datetime import datetime, timedelta
+import asyncio
+import hashlib
+import base64
+from datetime import datetime, date, timedelta
 import json
 import firebase_admin
-from firebase_admin import credentials, firestore, auth
+from firebase_admin import credentials, firestore
+from google.api_core.exceptions import AlreadyExists
 from dotenv import load_dotenv
 
 # Import our custom modules
-from email_fetcher import EmailFetcher
+from gmail_clients import GmailClientRegistry
+from credential_store import create_credential_store, GmailNotAuthorized
 from email_agent import EmailAgent
+from job_queue import JobQueue
+from auth_cache import FirebaseTokenVerifier
+from firestore_writer import BatchWriter, email_doc_id
+from bulk_delete import DELETE_PAGE_SIZE, fetch_key_page, delete_query_results
+from email_preprocess import prepare_email, prepare_emails
+from rate_limiter import current_user
+from email_dedup import cluster_emails, shares_analysis
+from email_classifier import EmailClassifier
+from email_stats import (
+    stats_ref, stats_increments, daily_ref, daily_increments, ensure_user_stats, read_trends,
+    reset_user_stats, GRANULARITIES, URGENCY_LEVELS, CATEGORIES
+)
 
 # Load environment variables
 load_dotenv()
@@ -34,6 +53,9 @@ except ValueError:
 
 db = firestore.client()
 
+# Verified ID tokens are cached until they expire
+token_verifier = FirebaseTokenVerifier()
+
 # ============================================
 # AI AGENT INITIALIZATION
 # ============================================
@@ -45,6 +67,39 @@ except Exception as e:
     print(f"WARNING: Could not initialize Email Agent: {e}")
     email_agent = None
 
+# Per-user Gmail credentials and the authenticated clients built from them
+credential_store = create_credential_store(db)
+gmail_clients = GmailClientRegistry(credential_store)
+
+# Streaming response formats for incremental results
+STREAM_MEDIA_TYPES = {'sse': 'text/event-stream', 'ndjson': 'application/x-ndjson'}
+
+# Background workers for long-running email processing
+job_queue = JobQueue()
+
+# Local pre-classifier - obvious bulk and automated mail skips Gemini
+email_classifier = EmailClassifier()
+
+# Bounded concurrency for the fetch pipeline's summarize stage (shared across requests)
+MAX_FETCH_RESULTS = int(os.getenv('MAX_FETCH_RESULTS', 50))
+summarize_semaphore = asyncio.Semaphore(int(os.getenv('SUMMARIZE_CONCURRENCY', 10)))
+
+# Inbox listings are header-only, so they can cover more messages per request than the fetch pipeline
+MAX_INBOX_RESULTS = int(os.getenv('MAX_INBOX_RESULTS', 100))
+
+# Write-behind Firestore persistence, committed in batches
+firestore_writer = BatchWriter(db)
+
+# Summaries listing: page size cap and the fields that can be projected
+MAX_SUMMARIES_PAGE = 100
+SUMMARY_FIELDS = {
+    'email_id', 'from', 'subject', 'date', 'body_preview', 'summary', 'urgency', 'tone',
+    'category', 'key_points', 'action_items', 'cluster_size', 'classified_by', 'unread', 'created_at'
+}
+
+# Longest date range served by the analytics trends endpoint
+MAX_TREND_DAYS = 731
+
 # ============================================
 # FASTAPI APP INITIALIZATION
 # ============================================
@@ -73,6 +128,25 @@ app.add_middleware(
     expose_headers=["*"],
 )
 
+@app.on_event("startup")
+async def start_background_workers():
+    """Start job workers, the write-behind flusher and the token/cert refreshers"""
+    await job_queue.start()
+    await firestore_writer.start()
+    await token_verifier.start()
+    credential_store.start_background_refresh()
+
+@app.on_event("shutdown")
+async def stop_background_workers():
+    """Stop background workers, flush pending writes and release pooled Gemini connections on shutdown"""
+    await job_queue.stop()
+    await firestore_writer.stop()
+    await token_verifier.stop()
+    credential_store.stop_background_refresh()
+    if email_agent:
+        await email_agent.aclose()
+        await run_in_threadpool(email_agent.cache.close)
+
 # Handle preflight OPTIONS requests
 @app.options("/{rest_of_path:path}")
 async def preflight_handler(rest_of_path: str):
@@ -102,6 +176,7 @@ class GmailAuthRequest(BaseModel):
 class EmailFetchRequest(BaseModel):
     user_id: str
     max_results: int = 10
+    incremental: bool = True  # Only pull mail added since the last sync
 
 class UserPreferences(BaseModel):
     summary_length: str = "Medium"
@@ -126,7 +201,7 @@ async def verify_firebase_token(authorization: str = Header(None)):
     token = authorization.split('Bearer ')[1]
     
     try:
-        decoded_token = auth.verify_id_token(token)
+        decoded_token = await token_verifier.verify(token)
         return decoded_token
     except Exception as e:
         raise HTTPException(status_code=401, detail=f"Invalid token: {str(e)}")
@@ -135,6 +210,10 @@ async def verify_firebase_token(authorization: str = Header(None)):
 # HELPER FUNCTIONS
 # ============================================
 
+def prompt_model() -> Optional[str]:
+    """The model prompts are sized for (the agent's preferred model)"""
+    return email_agent.models[0] if email_agent else None
+
 def map_urgency(gemini_urgency: str) -> str:
     """Map Gemini urgency to our format"""
     urgency_map = {
@@ -179,6 +258,11 @@ async def root():
         "version": "1.0.0",
         "gemini_status": gemini_status,
         "model": email_agent.model if email_agent else "N/A",
+        "cache": email_agent.cache.stats() if email_agent else None,
+        "models": email_agent.router.stats() if email_agent else None,
+        "rate_limits": email_agent.rate_limiter.stats() if email_agent else None,
+        "parser": email_agent.parser.stats() if email_agent else None,
+        "classifier": email_classifier.stats(),
         "timestamp": datetime.utcnow().isoformat()
     }
 
@@ -195,16 +279,17 @@ async def summarize_email(
         if not email_agent:
             raise HTTPException(status_code=503, detail="AI service not available")
         
-        # Prepare email data for agent
-        email_data = {
+        # Prepare email data for agent (body cleaned and fitted to the requested summary length)
+        email_data = prepare_email({
             'sender': request.email_sender,
             'subject': request.email_subject,
             'body': request.email_body,
             'date': datetime.utcnow().isoformat()
-        }
+        }, request.summary_length, prompt_model())
         
         # Get AI analysis
-        analysis = email_agent.summarize_email(email_data)
+        current_user.set(user_data['uid'])
+        analysis = await email_agent.summarize_email_async(email_data)
         
         # Map to our response format
         summary_response = EmailSummaryResponse(
@@ -216,9 +301,13 @@ async def summarize_email(
             action_items=analysis.get('action_items', [])
         )
         
-        # Save to Firestore
+        # Save to Firestore (write-behind; re-summarizing the same email overwrites its document)
         user_id = user_data['uid']
-        db.collection('summaries').add({
+        content_id = hashlib.sha256(
+            f"{request.email_sender}\n{request.email_subject}\n{request.email_body}".encode('utf-8')
+        ).hexdigest()
+        summary_ref = db.collection('summaries').document(email_doc_id(user_id, content_id))
+        await firestore_writer.set(summary_ref, {
             'user_id': user_id,
             'subject': request.email_subject,
             'sender': request.email_sender,
@@ -229,7 +318,7 @@ async def summarize_email(
             'key_points': summary_response.key_points,
             'action_items': summary_response.action_items,
             'created_at': firestore.SERVER_TIMESTAMP
-        })
+        }, wait=False)
         
         return summary_response
         
@@ -243,8 +332,8 @@ async def authorize_gmail(
     user_data: dict = Depends(verify_firebase_token)
 ):
     """
-    Initialize Gmail OAuth flow
-    This will trigger the OAuth flow when EmailFetcher is instantiated
+    Record that the user wants Gmail connected
+    Consent itself is granted with `python credential_store.py authorize <uid>` on the backend
     """
     try:
         user_id = user_data['uid']
@@ -258,8 +347,8 @@ async def authorize_gmail(
         
         return {
             "success": True,
-            "message": "Gmail authorization initiated. Please complete OAuth flow in terminal/browser.",
-            "note": "Run the backend to complete the OAuth flow if not already authenticated."
+            "message": "Gmail authorization requested.",
+            "note": f"Run `python credential_store.py authorize {user_id}` on the backend to complete the OAuth flow."
         }
         
     except Exception as e:
@@ -271,120 +360,356 @@ async def fetch_emails(
     user_data: dict = Depends(verify_firebase_token)
 ):
     """
-    Fetch latest emails from Gmail and generate summaries
+    Queue a background job that fetches latest emails from Gmail and generates summaries
+    Returns the job ID immediately - poll /api/jobs/{job_id} for progress and results
     Requires: Gmail authorization completed
     """
     try:
         user_id = user_data['uid']
         
-        # Limit max results to prevent timeouts
-        max_results = min(request.max_results, 5)  # Process max 5 emails at a time
+        # Limit max results to bound a single job's fan-out
+        max_results = min(request.max_results, MAX_FETCH_RESULTS)
         
-        print(f"📧 Fetching up to {max_results} emails for user {user_id}")
+        job = job_queue.submit(user_id, "gmail_fetch", run_fetch_job, user_id, max_results, request.incremental)
+        print(f"📧 Queued fetch job {job.id} for up to {max_results} emails for user {user_id}")
         
-        # Initialize EmailFetcher (will use existing token.pickle)
-        try:
-            fetcher = EmailFetcher()
-        except Exception as e:
-            print(f"❌ Gmail auth error: {str(e)}")
-            raise HTTPException(
-                status_code=401, 
-                detail=f"Gmail not authorized. Please complete OAuth flow in backend terminal. Error: {str(e)}"
-            )
-        
-        # Fetch emails
-        print(f"🔍 Fetching emails from Gmail...")
-        emails = fetcher.fetch_emails(max_results=max_results)
-        
-        if not emails:
-            print("📭 No unread emails found")
-            return {
-                "success": True,
-                "emails_processed": 0,
-                "emails": [],
-                "message": "No unread emails found"
-            }
-        
-        print(f"📬 Found {len(emails)} emails, processing...")
-        processed_emails = []
+        return {
+            "success": True,
+            "job_id": job.id,
+            "status": job.status
+        }
         
-        for idx, email in enumerate(emails, 1):
-            try:
-                print(f"  [{idx}/{len(emails)}] Processing: {email.get('subject', 'No subject')[:50]}")
-                
-                # Generate AI summary if agent is available
-                if email_agent:
-                    try:
-                        analysis = email_agent.summarize_email(email)
-                        
-                        # Prepare processed email data for Firestore
-                        email_doc_firestore = {
-                            'user_id': user_id,
-                            'email_id': email['id'],
-                            'from': email['sender'],
-                            'subject': email['subject'],
-                            'date': email['date'],
-                            'body_preview': email['body'][:200],
-                            'summary': analysis.get('summary', 'Unable to generate summary'),
-                            'urgency': map_urgency(analysis.get('urgency', 'medium')),
-                            'tone': map_tone(analysis.get('sentiment', 'neutral')),
-                            'category': map_category(analysis.get('category', 'unknown')),
-                            'key_points': analysis.get('key_points', []),
-                            'action_items': analysis.get('action_items', []),
-                            'created_at': firestore.SERVER_TIMESTAMP,
-                            'unread': True
-                        }
-                        
-                        # Prepare email data for API response (without SERVER_TIMESTAMP)
-                        email_doc_response = {
-                            'user_id': user_id,
-                            'email_id': email['id'],
-                            'from': email['sender'],
-                            'subject': email['subject'],
-                            'date': email['date'],
-                            'body_preview': email['body'][:200],
-                            'summary': analysis.get('summary', 'Unable to generate summary'),
-                            'urgency': map_urgency(analysis.get('urgency', 'medium')),
-                            'tone': map_tone(analysis.get('sentiment', 'neutral')),
-                            'category': map_category(analysis.get('category', 'unknown')),
-                            'key_points': analysis.get('key_points', []),
-                            'action_items': analysis.get('action_items', []),
-                            'created_at': datetime.utcnow().isoformat(),
-                            'unread': True
-                        }
-                        print(f"  ✅ AI summary generated")
-                    except Exception as ai_error:
-                        print(f"  ⚠️ AI error: {str(ai_error)}, using fallback")
-                        email_doc_firestore, email_doc_response = create_fallback_email_doc(user_id, email)
-                else:
-                    print(f"  ⚠️ AI agent unavailable, using fallback")
-                    email_doc_firestore, email_doc_response = create_fallback_email_doc(user_id, email)
-                
-                # Save to Firestore
-                db.collection('emails').add(email_doc_firestore)
-                processed_emails.append(email_doc_response)
-                print(f"  💾 Saved to Firestore")
-                
-            except Exception as e:
-                print(f"  ❌ Error processing email {email.get('id')}: {str(e)}")
-                continue
+    except Exception as e:
+        print(f"❌ Error in fetch_emails: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Error fetching emails: {str(e)}")
+
+@app.get("/api/gmail/inbox")
+async def list_inbox(
+    max_results: int = Query(20, ge=1),
+    unread_only: bool = False,
+    user_data: dict = Depends(verify_firebase_token)
+):
+    """
+    Fast inbox listing - Subject/From/Date, snippet and read state only, without downloading bodies
+    Each entry says whether it has already been summarized; full bodies are only fetched by /api/gmail/fetch
+    Requires: Gmail authorization completed
+    """
+    user_id = user_data['uid']
+    max_results = min(max_results, MAX_INBOX_RESULTS)
+    
+    try:
+        fetcher = await run_in_threadpool(gmail_clients.get, user_id)
+    except Exception as e:
+        print(f"❌ Gmail auth error: {str(e)}")
+        raise HTTPException(status_code=401, detail=f"Gmail not authorized: {str(e)}")
+    
+    try:
+        messages = await run_in_threadpool(fetcher.list_inbox, max_results, unread_only)
+        processed_ids = await run_in_threadpool(
+            get_processed_email_ids, user_id, [message['id'] for message in messages]
+        )
         
-        print(f"✅ Successfully processed {len(processed_emails)} emails")
+        for message in messages:
+            message['summarized'] = message['id'] in processed_ids
         
         return {
             "success": True,
-            "emails_processed": len(processed_emails),
-            "emails": processed_emails,
-            "message": f"Processed {len(processed_emails)} out of {len(emails)} emails"
+            "count": len(messages),
+            "emails": messages
         }
         
-    except HTTPException:
-        raise
     except Exception as e:
-        print(f"❌ Error in fetch_emails: {str(e)}")
-        raise HTTPException(status_code=500, detail=f"Error fetching emails: {str(e)}")
+        print(f"❌ Error listing inbox: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Error listing inbox: {str(e)}")
 
-def create_fallback_email_doc(user_id: str, email: dict):
+@app.get("/api/jobs/{job_id}")
+async def get_job(
+    job_id: str,
+    user_data: dict = Depends(verify_firebase_token)
+):
+    """
+    Get the status, per-email progress and partial results of a background job
+    """
+    job = job_queue.get(job_id)
+    
+    # Verify user is accessing their own job
+    if job is None or job.user_id != user_data['uid']:
+        raise HTTPException(status_code=404, detail="Job not found")
+    
+    return {
+        "success": True,
+        **job.to_dict()
+    }
+
+async def run_fetch_job(job, user_id: str, max_results: int, incremental: bool):
+    """Background job: fetch new Gmail messages, then summarize and persist each one"""
+    print(f"📧 Fetching up to {max_results} emails for user {user_id}")
+    
+    # Get the user's Gmail client (built once from their stored credentials, then reused)
+    try:
+        fetcher = await run_in_threadpool(gmail_clients.get, user_id)
+    except GmailNotAuthorized as e:
+        print(f"❌ Gmail auth error: {str(e)}")
+        raise GmailNotAuthorized(f"Gmail not authorized. Run `python credential_store.py authorize <uid>` on the backend. Error: {str(e)}") from e
+    except Exception as e:
+        print(f"❌ Gmail client error: {str(e)}")
+        raise RuntimeError(f"Could not connect to Gmail: {str(e)}") from e
+    
+    emails, user_ref, history_id = await collect_new_emails(fetcher, user_id, max_results, incremental)
+    job.total = len(emails)
+    
+    if not emails:
+        print("📭 No new emails found")
+        await run_in_threadpool(save_history_checkpoint, user_ref, history_id)
+        job.message = "No new emails found"
+        return
+    
+    print(f"📬 Found {len(emails)} new emails, processing...")
+    clusters = cluster_emails(emails)
+    if len(clusters) < len(emails):
+        print(f"🧬 {len(emails)} emails collapse to {len(clusters)} unique, summarizing each once")
+    
+    # Summarize and persist all clusters concurrently; one failure doesn't block the rest
+    async def process_into_job(cluster):
+        try:
+            for email_doc_response in await process_cluster(user_id, cluster):
+                job.add_result(email_doc_response)
+        except Exception as e:
+            print(f"  ❌ Error processing email {cluster[0].get('id')}: {str(e)}")
+            for _ in cluster:
+                job.add_failure()
+    
+    await asyncio.gather(*(process_into_job(cluster) for cluster in clusters))
+    
+    # Only advance the checkpoint once every fetched email is stored, so failures get retried
+    if job.failed == 0:
+        await run_in_threadpool(save_history_checkpoint, user_ref, history_id)
+    
+    print(f"✅ Successfully processed {job.processed} emails")
+    job.message = f"Processed {job.processed} out of {job.total} emails"
+
+async def collect_new_emails(fetcher, user_id: str, max_results: int, incremental: bool):
+    """
+    Find emails that still need processing - history deltas since the last sync, or a full unread listing
+    Bodies come back cleaned and fitted to the user's summary length preference
+    Returns (emails, user_ref, history_id) where history_id is the checkpoint to save afterwards
+    """
+    print(f"🔍 Fetching emails from Gmail...")
+    user_ref = db.collection('users').document(user_id)
+    user_doc = await run_in_threadpool(user_ref.get)
+    user_info = user_doc.to_dict() or {}
+    last_history_id = user_info.get('gmail_history_id')
+    
+    msg_ids = None
+    if incremental and last_history_id:
+        msg_ids, history_id = await run_in_threadpool(
+            fetcher.list_new_message_ids, last_history_id, max_results
+        )
+    if msg_ids is None:
+        # Checkpoint the mailbox before listing so nothing added meanwhile is missed
+        history_id = await run_in_threadpool(fetcher.get_history_id)
+        msg_ids = await run_in_threadpool(fetcher.list_unread_ids, max_results)
+    
+    # Skip emails we've already summarized before spending any Gemini calls
+    processed_ids = await run_in_threadpool(get_processed_email_ids, user_id, msg_ids)
+    msg_ids = [msg_id for msg_id in msg_ids if msg_id not in processed_ids]
+    
+    if not msg_ids:
+        return [], user_ref, history_id
+    
+    emails = await run_in_threadpool(fetcher.get_emails_details, msg_ids)
+    
+    # Strip quoted history, signatures and footers before anything is sent to the model
+    summary_length = user_info.get('preferences', {}).get('summary_length', 'Medium')
+    emails = await run_in_threadpool(prepare_emails, emails, summary_length, prompt_model())
+    return emails, user_ref, history_id
+
+@app.post("/api/gmail/fetch/stream")
+async def fetch_emails_stream(
+    request: EmailFetchRequest,
+    stream_format: str = Query("sse", alias="format"),
+    user_data: dict = Depends(verify_firebase_token)
+):
+    """
+    Fetch latest emails from Gmail and stream each processed email as soon as its summary is ready
+    Streams server-sent events (format=sse) or newline-delimited JSON (format=ndjson)
+    """
+    if stream_format not in STREAM_MEDIA_TYPES:
+        raise HTTPException(status_code=400, detail="format must be 'sse' or 'ndjson'")
+    
+    user_id = user_data['uid']
+    max_results = min(request.max_results, MAX_FETCH_RESULTS)
+    
+    try:
+        fetcher = await run_in_threadpool(gmail_clients.get, user_id)
+    except Exception as e:
+        print(f"❌ Gmail auth error: {str(e)}")
+        raise HTTPException(
+            status_code=401,
+            detail=f"Gmail not authorized. Run `python credential_store.py authorize <uid>` on the backend. Error: {str(e)}"
+        )
+    
+    async def process_or_error(cluster):
+        try:
+            return cluster, await process_cluster(user_id, cluster), None
+        except Exception as e:
+            return cluster, None, e
+    
+    async def event_stream():
+        try:
+            emails, user_ref, history_id = await collect_new_emails(fetcher, user_id, max_results, request.incremental)
+        except Exception as e:
+            print(f"❌ Error in fetch_emails_stream: {str(e)}")
+            yield format_stream_event('error', {'message': f"Error fetching emails: {str(e)}"}, stream_format)
+            return
+        
+        yield format_stream_event('start', {'total': len(emails)}, stream_format)
+        
+        # Emit each email document in completion order, not fetch order
+        processed = failed = 0
+        for next_done in asyncio.as_completed([process_or_error(cluster) for cluster in cluster_emails(emails)]):
+            cluster, email_doc_responses, error = await next_done
+            if error is not None:
+                print(f"  ❌ Error processing email {cluster[0].get('id')}: {str(error)}")
+                failed += len(cluster)
+                for email in cluster:
+                    yield format_stream_event('error', {'email_id': email.get('id'), 'message': str(error)}, stream_format)
+                continue
+            for email_doc_response in email_doc_responses:
+                processed += 1
+                yield format_stream_event('email', email_doc_response, stream_format)
+        
+        # Only advance the checkpoint once every fetched email is stored, so failures get retried
+        if failed == 0:
+            await run_in_threadpool(save_history_checkpoint, user_ref, history_id)
+        
+        yield format_stream_event('done', {
+            'success': True,
+            'emails_processed': processed,
+            'message': f"Processed {processed} out of {len(emails)} emails" if emails else "No new emails found"
+        }, stream_format)
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type=STREAM_MEDIA_TYPES[stream_format],
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+def format_stream_event(event: str, data: dict, stream_format: str) -> str:
+    """Serialize one streaming event as SSE or an NDJSON line"""
+    if stream_format == 'ndjson':
+        return json.dumps({'event': event, 'data': data}) + '\n'
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+def get_processed_email_ids(user_id: str, msg_ids: List[str]) -> set:
+    """Return the subset of Gmail message IDs already stored for this user"""
+    if not msg_ids:
+        return set()
+    
+    # Email documents have deterministic IDs, so this is a batch of key lookups rather than a query
+    refs = {email_doc_id(user_id, msg_id): msg_id for msg_id in msg_ids}
+    snapshots = db.get_all(
+        [db.collection('emails').document(doc_id) for doc_id in refs],
+        field_paths=['email_id']
+    )
+    return {refs[snapshot.id] for snapshot in snapshots if snapshot.exists}
+
+def save_history_checkpoint(user_ref, history_id):
+    """Remember the Gmail history ID the next incremental sync starts from"""
+    user_ref.set({
+        'gmail_history_id': history_id,
+        'gmail_synced_at': firestore.SERVER_TIMESTAMP
+    }, merge=True)
+
+async def process_cluster(user_id: str, cluster: List[dict]) -> List[dict]:
+    """
+    Summarize a cluster of duplicate emails once and persist every member with that summary
+    Returns the API response documents, one per email
+    """
+    # Gemini calls made for this email queue fairly against other users' calls
+    current_user.set(user_id)
+    email = cluster[0]
+    
+    print(f"  Processing: {email.get('subject', 'No subject')[:50]}" + (f" (+{len(cluster) - 1} duplicates)" if len(cluster) > 1 else ""))
+    
+    # Obvious bulk/automated mail is classified locally; only the rest costs a Gemini call
+    analysis = email_classifier.classify(email)
+    if analysis is not None:
+        print(f"  ⚡ Classified locally ({analysis['classified_by']}), skipping Gemini")
+    elif email_agent:
+        async with summarize_semaphore:
+            try:
+                analysis = await email_agent.summarize_email_async(email)
+                print(f"  ✅ AI summary generated")
+            except Exception as ai_error:
+                print(f"  ⚠️ AI error: {str(ai_error)}, using fallback")
+    else:
+        print(f"  ⚠️ AI agent unavailable, using fallback")
+    
+    # Near-duplicates only share an analysis that doesn't quote figures they differ in
+    sharing = [member for member in cluster if shares_analysis(email, member, analysis)]
+    separate = [member for member in cluster if not shares_analysis(email, member, analysis)]
+    if separate:
+        print(f"  🔢 {len(separate)} near-duplicate(s) have different figures, summarizing separately")
+    
+    responses, separate_responses = await asyncio.gather(
+        asyncio.gather(*(persist_email(user_id, member, analysis, len(sharing)) for member in sharing)),
+        asyncio.gather(*(process_cluster(user_id, [member]) for member in separate))
+    )
+    print(f"  💾 Saved to Firestore")
+    
+    return list(responses) + [response for member_responses in separate_responses for response in member_responses]
+
+async def persist_email(user_id: str, email: dict, analysis: Optional[dict], cluster_size: int = 1) -> dict:
+    """Store one email with its analysis (or a fallback without one) - returns the API response document"""
+    if analysis is not None:
+        email_doc_firestore, email_doc_response = create_email_docs(user_id, email, analysis, cluster_size)
+    else:
+        email_doc_firestore, email_doc_response = create_fallback_email_doc(user_id, email, cluster_size)
+    
+    # Save to Firestore
+    # Batched write-behind; returns once the batch containing this email is committed.
+    # The email is created only if it isn't stored yet (its ID is deterministic), and the analytics
+    # counters move in the same atomic write - concurrent fetches can't count an email twice
+    email_ref = db.collection('emails').document(email_doc_id(user_id, email['id']))
+    today = datetime.utcnow().date()
+    try:
+        await firestore_writer.create(email_ref, email_doc_firestore, merges=[
+            (stats_ref(db, user_id), stats_increments(email_doc_firestore)),
+            (daily_ref(db, user_id, today), daily_increments(email_doc_firestore, today))
+        ])
+    except AlreadyExists:
+        print(f"  ↩️  Email {email['id']} was already stored by another fetch")
+    
+    return email_doc_response
+
+def create_email_docs(user_id: str, email: dict, analysis: dict, cluster_size: int = 1):
+    """Create email document from AI analysis - returns both Firestore and response versions"""
+    email_doc = {
+        'user_id': user_id,
+        'email_id': email['id'],
+        'from': email['sender'],
+        'subject': email['subject'],
+        'date': email['date'],
+        'body_preview': email['body'][:200],
+        'summary': analysis.get('summary', 'Unable to generate summary'),
+        'urgency': map_urgency(analysis.get('urgency', 'medium')),
+        'tone': map_tone(analysis.get('sentiment', 'neutral')),
+        'category': map_category(analysis.get('category', 'unknown')),
+        'key_points': analysis.get('key_points', []),
+        'action_items': analysis.get('action_items', []),
+        'cluster_size': cluster_size,
+        'classified_by': analysis.get('classified_by', 'llm'),
+        'unread': True
+    }
+    
+    # Firestore gets a server timestamp, the API response an ISO string
+    firestore_doc = {**email_doc, 'created_at': firestore.SERVER_TIMESTAMP}
+    response_doc = {**email_doc, 'created_at': datetime.utcnow().isoformat()}
+    
+    return firestore_doc, response_doc
+
+def create_fallback_email_doc(user_id: str, email: dict, cluster_size: int = 1):
     """Create fallback email document without AI analysis - returns both Firestore and response versions"""
     firestore_doc = {
         'user_id': user_id,
@@ -399,6 +724,8 @@ def create_fallback_email_doc(user_id: str, email: dict):
         'category': 'Other',
         'key_points': [],
         'action_items': [],
+        'cluster_size': cluster_size,
+        'classified_by': 'fallback',
         'created_at': firestore.SERVER_TIMESTAMP,
         'unread': True
     }
@@ -416,6 +743,8 @@ def create_fallback_email_doc(user_id: str, email: dict):
         'category': 'Other',
         'key_points': [],
         'action_items': [],
+        'cluster_size': cluster_size,
+        'classified_by': 'fallback',
         'created_at': datetime.utcnow().isoformat(),
         'unread': True
     }
@@ -434,16 +763,17 @@ async def generate_reply(
         if not email_agent:
             raise HTTPException(status_code=503, detail="AI service not available")
         
-        # Prepare email data
-        email_data = {
+        # Prepare email data (quoted history and signatures stripped)
+        email_data = prepare_email({
             'sender': request.email_sender,
             'subject': request.email_subject,
             'body': request.email_body,
             'date': datetime.utcnow().isoformat()
-        }
+        }, model=prompt_model())
         
         # Generate reply
-        draft_reply = email_agent.generate_reply(email_data, tone=request.tone)
+        current_user.set(user_data['uid'])
+        draft_reply = await email_agent.generate_reply_async(email_data, tone=request.tone)
         
         return {
             "success": True,
@@ -454,40 +784,126 @@ async def generate_reply(
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error generating reply: {str(e)}")
 
+@app.post("/api/gmail/reply/stream")
+async def generate_reply_stream(
+    request: ReplyRequest,
+    stream_format: str = Query("sse", alias="format"),
+    user_data: dict = Depends(verify_firebase_token)
+):
+    """
+    Stream an AI-powered reply to an email as it is generated
+    """
+    if not email_agent:
+        raise HTTPException(status_code=503, detail="AI service not available")
+    if stream_format not in STREAM_MEDIA_TYPES:
+        raise HTTPException(status_code=400, detail="format must be 'sse' or 'ndjson'")
+    
+    # Prepare email data (quoted history and signatures stripped)
+    email_data = prepare_email({
+        'sender': request.email_sender,
+        'subject': request.email_subject,
+        'body': request.email_body,
+        'date': datetime.utcnow().isoformat()
+    }, model=prompt_model())
+    
+    async def event_stream():
+        current_user.set(user_data['uid'])
+        chunks = []
+        try:
+            async for chunk in email_agent.generate_reply_stream(email_data, tone=request.tone):
+                chunks.append(chunk)
+                yield format_stream_event('token', {'text': chunk}, stream_format)
+        except Exception as e:
+            print(f"⚠️  Error streaming reply: {e}")
+        
+        draft_reply = ''.join(chunks).strip() or "Error generating reply. Please try again."
+        yield format_stream_event('done', {
+            'success': True,
+            'draft_reply': draft_reply,
+            'tone': request.tone
+        }, stream_format)
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type=STREAM_MEDIA_TYPES[stream_format],
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
 @app.get("/api/summaries/{user_id}")
 async def get_user_summaries(
     user_id: str,
     limit: int = 50,
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None,
+    compact: bool = False,
     user_data: dict = Depends(verify_firebase_token)
 ):
     """
-    Get all summaries for a user
+    Get summaries for a user, newest first, one page at a time
+    Pass the returned next_cursor to get the following page. fields (comma-separated) limits
+    the returned fields; compact drops empty values and the redundant user_id.
     """
     try:
         # Verify user is accessing their own data
         if user_data['uid'] != user_id:
             raise HTTPException(status_code=403, detail="Access denied")
         
-        # Query Firestore
-        summaries = db.collection('emails')\
+        limit = max(1, min(limit, MAX_SUMMARIES_PAGE))
+        
+        field_list = None
+        if fields:
+            field_list = [field.strip() for field in fields.split(',') if field.strip()]
+            unknown = set(field_list) - SUMMARY_FIELDS
+            if unknown:
+                raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(sorted(unknown))}")
+        
+        # Query Firestore (document ID breaks ties between emails committed in the same batch)
+        query = db.collection('emails')\
             .where('user_id', '==', user_id)\
             .order_by('created_at', direction=firestore.Query.DESCENDING)\
-            .limit(limit)\
-            .stream()
+            .order_by('__name__', direction=firestore.Query.DESCENDING)
+        
+        if field_list is not None:
+            # created_at is always needed to build the next cursor
+            query = query.select(sorted(set(field_list) | {'created_at'}))
+        
+        if cursor:
+            try:
+                created_at, doc_id = decode_summaries_cursor(cursor)
+            except Exception:
+                raise HTTPException(status_code=400, detail="Invalid cursor")
+            query = query.start_after({
+                'created_at': created_at,
+                '__name__': db.collection('emails').document(doc_id)
+            })
+        
+        docs = await run_in_threadpool(lambda: list(query.limit(limit).stream()))
         
         results = []
-        for doc in summaries:
+        for doc in docs:
             data = doc.to_dict()
             data['id'] = doc.id
             # Convert timestamp to ISO format
             if 'created_at' in data and data['created_at']:
                 data['created_at'] = data['created_at'].isoformat()
+            if field_list is not None and 'created_at' not in field_list:
+                data.pop('created_at', None)
+            if compact:
+                data = {key: value for key, value in data.items()
+                        if key != 'user_id' and value not in (None, '', [])}
             results.append(data)
         
+        # A full page means there may be more
+        next_cursor = None
+        if len(docs) == limit:
+            last = docs[-1]
+            next_cursor = encode_summaries_cursor(last.get('created_at'), last.id)
+        
         return {
             "success": True,
             "count": len(results),
-            "summaries": results
+            "summaries": results,
+            "next_cursor": next_cursor
         }
         
     except HTTPException:
@@ -496,6 +912,17 @@ async def get_user_summaries(
         print(f"Error in get_user_summaries: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Error fetching summaries: {str(e)}")
 
+def encode_summaries_cursor(created_at: datetime, doc_id: str) -> str:
+    """Opaque pagination cursor holding the last document's sort key"""
+    raw = json.dumps([created_at.isoformat(), doc_id], separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii').rstrip('=')
+
+def decode_summaries_cursor(cursor: str):
+    """Inverse of encode_summaries_cursor - returns (created_at, doc_id)"""
+    raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+    created_at, doc_id = json.loads(raw)
+    return datetime.fromisoformat(created_at), doc_id
+
 @app.get("/api/analytics/{user_id}")
 async def get_user_analytics(
     user_id: str,
@@ -509,26 +936,16 @@ async def get_user_analytics(
         if user_data['uid'] != user_id:
             raise HTTPException(status_code=403, detail="Access denied")
         
-        # Query all emails
-        emails = db.collection('emails')\
-            .where('user_id', '==', user_id)\
-            .stream()
+        # Read the maintained aggregate (built once from stored emails if it never has been)
+        stats = await run_in_threadpool(ensure_user_stats, db, user_id)
         
-        total = 0
-        urgency_counts = {"High": 0, "Medium": 0, "Low": 0}
-        category_counts = {"Work": 0, "Personal": 0, "Promotion": 0, "Other": 0}
-        
-        for doc in emails:
-            data = doc.to_dict()
-            total += 1
-            urgency_counts[data.get('urgency', 'Medium')] += 1
-            category_counts[data.get('category', 'Other')] += 1
+        total = stats['total']
         
         return {
             "success": True,
             "total_emails": total,
-            "urgency_breakdown": urgency_counts,
-            "category_breakdown": category_counts,
+            "urgency_breakdown": stats['urgency'],
+            "category_breakdown": stats['category'],
             "estimated_time_saved_hours": round(total * 0.015, 1)  # 54 seconds per email
         }
         
@@ -538,6 +955,53 @@ async def get_user_analytics(
         print(f"Error in get_user_analytics: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Error fetching analytics: {str(e)}")
 
+@app.get("/api/analytics/{user_id}/trends")
+async def get_user_analytics_trends(
+    user_id: str,
+    start: Optional[date] = None,
+    end: Optional[date] = None,
+    granularity: str = "day",
+    user_data: dict = Depends(verify_firebase_token)
+):
+    """
+    Get urgency and category trends for a user over a date range (default: last 30 days)
+    Served from daily rollups; returns one zero-filled point per day, week or month
+    """
+    try:
+        # Verify user is accessing their own data
+        if user_data['uid'] != user_id:
+            raise HTTPException(status_code=403, detail="Access denied")
+        
+        if granularity not in GRANULARITIES:
+            raise HTTPException(status_code=400, detail=f"granularity must be one of: {', '.join(GRANULARITIES)}")
+        
+        end = end or datetime.utcnow().date()
+        start = start or end - timedelta(days=29)
+        if start > end:
+            raise HTTPException(status_code=400, detail="start must be on or before end")
+        if (end - start).days > MAX_TREND_DAYS:
+            raise HTTPException(status_code=400, detail=f"Date range is limited to {MAX_TREND_DAYS} days")
+        
+        # Daily rollups are built by the same one-time rebuild as the totals
+        await run_in_threadpool(ensure_user_stats, db, user_id)
+        series = await run_in_threadpool(read_trends, db, user_id, start, end, granularity)
+        
+        return {
+            "success": True,
+            "start": start.isoformat(),
+            "end": end.isoformat(),
+            "granularity": granularity,
+            "urgency_levels": URGENCY_LEVELS,
+            "categories": CATEGORIES,
+            "series": series
+        }
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"Error in get_user_analytics_trends: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Error fetching analytics trends: {str(e)}")
+
 @app.post("/api/user/preferences")
 async def update_user_preferences(
     preferences: UserPreferences,
@@ -571,24 +1035,35 @@ async def clear_user_summaries(
 ):
     """
     Clear all summaries for a user
+    Users with more than one page of emails are cleared by a background job - poll /api/jobs/{job_id}
     """
     try:
         # Verify user is accessing their own data
         if user_data['uid'] != user_id:
             raise HTTPException(status_code=403, detail="Access denied")
         
-        # Delete all emails for user
-        emails = db.collection('emails').where('user_id', '==', user_id).stream()
-        deleted_count = 0
+        query = db.collection('emails').where('user_id', '==', user_id)
+        first_page = await run_in_threadpool(fetch_key_page, query)
         
-        for doc in emails:
-            doc.reference.delete()
-            deleted_count += 1
+        # Small users are cleared inline
+        if len(first_page) < DELETE_PAGE_SIZE:
+            deleted_count = await delete_query_results(db, query, first_page)
+            await run_in_threadpool(reset_user_stats, db, user_id)
+            return {
+                "success": True,
+                "deleted_count": deleted_count,
+                "message": f"Cleared {deleted_count} summaries"
+            }
+        
+        job = job_queue.submit(user_id, "clear_summaries", run_clear_job, user_id, query, first_page)
+        print(f"🗑️  Queued clear job {job.id} for user {user_id}")
         
         return {
             "success": True,
-            "deleted_count": deleted_count,
-            "message": f"Cleared {deleted_count} summaries"
+            "job_id": job.id,
+            "status": job.status,
+            "deleted_count": 0,
+            "message": "Clearing summaries in the background"
         }
         
     except HTTPException:
@@ -596,6 +1071,12 @@ async def clear_user_summaries(
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error clearing summaries: {str(e)}")
 
+async def run_clear_job(job, user_id: str, query, first_page):
+    """Background job: delete all of a user's emails, reporting progress as it goes"""
+    deleted_count = await delete_query_results(db, query, first_page, job=job)
+    await run_in_threadpool(reset_user_stats, db, user_id)
+    job.message = f"Cleared {deleted_count} summaries"
+
 @app.get("/api/test-cors")
 async def test_cors():
     """Test endpoint to verify CORS is working"""
@@ -0,0 +1,232 @@
+import re
+import time
+import base64
+import codecs
+import argparse
+from html.parser import HTMLParser
+
+# Base64 characters decoded per step (a multiple of 4, so every chunk decodes on its own)
+DECODE_CHUNK_CHARS = 8192
+
+# Elements whose text is never part of the readable body
+SKIPPED_TAGS = {'script', 'style', 'head', 'title', 'noscript', 'template'}
+
+# Elements that separate words when rendered
+BLOCK_TAGS = {
+    'br', 'p', 'div', 'li', 'ul', 'ol', 'tr', 'td', 'th', 'table', 'h1', 'h2', 'h3',
+    'h4', 'h5', 'h6', 'blockquote', 'hr', 'section', 'article', 'header', 'footer'
+}
+
+CHARSET_RE = re.compile(r'charset="?([\w.:-]+)"?', re.IGNORECASE)
+
+class TextBudget:
+    """Accumulates text with runs of spaces collapsed (line breaks kept), until a character budget is reached"""
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.length = 0
+        self._parts = []
+        self._pending_space = False
+        self._pending_breaks = 0
+
+    @property
+    def full(self):
+        return self.length >= self.limit
+
+    def add(self, text):
+        if self.full or not text:
+            return
+
+        for idx, line in enumerate(text.replace('\r', '').split('\n')):
+            if idx:
+                self.separate()
+
+            words = line.split()
+            if not words:
+                self._pending_space = self._pending_space or bool(line)
+                continue
+
+            if line[0].isspace():
+                self._pending_space = True
+            self._append(' '.join(words))
+            self._pending_space = line[-1].isspace()
+
+    def _append(self, text):
+        if self.length:
+            if self._pending_breaks:
+                text = '\n' * min(self._pending_breaks, 2) + text
+            elif self._pending_space:
+                text = ' ' + text
+        self._parts.append(text)
+        self.length += len(text)
+        self._pending_space = False
+        self._pending_breaks = 0
+
+    def separate(self):
+        """Mark a line break (e.g. between block elements) - consecutive breaks keep one blank line"""
+        self._pending_breaks += 1
+
+    def text(self):
+        return ''.join(self._parts)[:self.limit]
+
+class HTMLTextExtractor(HTMLParser):
+    """Streaming HTML-to-text stripper that stops collecting once the budget is full"""
+
+    def __init__(self, budget):
+        super().__init__(convert_charrefs=True)
+        self.budget = budget
+        self._skip_depth = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag in SKIPPED_TAGS:
+            self._skip_depth += 1
+        elif tag in BLOCK_TAGS:
+            self.budget.separate()
+
+    def handle_endtag(self, tag):
+        if tag in SKIPPED_TAGS:
+            self._skip_depth = max(0, self._skip_depth - 1)
+        elif tag in BLOCK_TAGS:
+            self.budget.separate()
+
+    def handle_data(self, data):
+        # Line breaks in HTML source are just whitespace; only block elements break lines
+        if not self._skip_depth:
+            self.budget.add(data.replace('\n', ' '))
+
+def walk_parts(payload):
+    """Yield every MIME part in the Gmail payload tree, depth-first in document order"""
+    stack = [payload]
+    while stack:
+        part = stack.pop()
+        yield part
+        stack.extend(reversed(part.get('parts', [])))
+
+def part_charset(part):
+    """The charset declared in a part's Content-Type header (defaults to UTF-8)"""
+    for header in part.get('headers', []):
+        if header.get('name', '').lower() == 'content-type':
+            match = CHARSET_RE.search(header.get('value', ''))
+            if match:
+                return match.group(1)
+    return 'utf-8'
+
+def iter_decoded(part):
+    """Decode a part's base64url body in chunks, so callers can stop early"""
+    data = part['body']['data']
+    try:
+        decoder = codecs.getincrementaldecoder(part_charset(part))(errors='replace')
+    except LookupError:
+        decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+
+    for start in range(0, len(data), DECODE_CHUNK_CHARS):
+        chunk = data[start:start + DECODE_CHUNK_CHARS]
+        final = start + DECODE_CHUNK_CHARS >= len(data)
+        if final:
+            chunk += '=' * (-len(chunk) % 4)
+        yield decoder.decode(base64.urlsafe_b64decode(chunk), final=final)
+
+def extract_text(payload, limit=2000):
+    """
+    Extract up to `limit` characters of readable body text from a Gmail message payload
+    Prefers text/plain anywhere in the MIME tree, falling back to stripped text/html
+    """
+    plain_part = html_part = None
+    for part in walk_parts(payload):
+        if not part.get('body', {}).get('data') or part.get('filename'):
+            continue  # Containers and attachments
+        mime_type = part.get('mimeType', '')
+        if mime_type == 'text/html':
+            html_part = html_part or part
+        elif mime_type == 'text/plain' or part is payload:
+            plain_part = part
+            break
+
+    budget = TextBudget(limit)
+
+    if plain_part is not None:
+        for text in iter_decoded(plain_part):
+            budget.add(text)
+            if budget.full:
+                break
+    elif html_part is not None:
+        parser = HTMLTextExtractor(budget)
+        for text in iter_decoded(html_part):
+            parser.feed(text)
+            if budget.full:
+                break
+        else:
+            parser.close()
+
+    return budget.text()
+
+def soup_extract_text(payload, limit=2000):
+    """The previous HTML path: decode the whole part, strip it with BeautifulSoup, then truncate"""
+    from bs4 import BeautifulSoup
+
+    html_part = next(part for part in walk_parts(payload) if part.get('mimeType') == 'text/html')
+    html = base64.urlsafe_b64decode(html_part['body']['data']).decode('utf-8')
+    return ' '.join(BeautifulSoup(html, 'html.parser').get_text().split())[:limit]
+
+def newsletter_payload(stories=300):
+    """A large HTML-only newsletter (styles, tracking script, table layout) with an attachment, as Gmail returns it"""
+    story = (
+        '<tr><td class="story"><h2>Story {idx}: What changed this week</h2>'
+        '<p>Our team shipped <b>new features</b> and fixed &amp; polished many small things. '
+        '<a href="https://example.com/story/{idx}?utm_source=newsletter">Read more</a></p>'
+        '<img src="https://example.com/pixel/{idx}.gif" width="1" height="1"></td></tr>\n'
+    )
+    html = (
+        '<html><head><title>Weekly digest</title><style>' + 'td.story { padding: 8px; }\n' * 50 + '</style>'
+        '<script>' + 'window.track && track("open");\n' * 50 + '</script></head><body><table>'
+        + ''.join(story.format(idx=idx) for idx in range(stories)) + '</table></body></html>'
+    )
+
+    def encode(data):
+        return base64.urlsafe_b64encode(data).decode()
+
+    return {
+        'mimeType': 'multipart/mixed',
+        'parts': [
+            {'mimeType': 'multipart/alternative', 'parts': [{
+                'mimeType': 'text/html',
+                'headers': [{'name': 'Content-Type', 'value': 'text/html; charset="UTF-8"'}],
+                'body': {'data': encode(html.encode('utf-8'))}
+            }]},
+            {'mimeType': 'application/pdf', 'filename': 'digest.pdf', 'body': {'attachmentId': 'att-1'}}
+        ]
+    }
+
+def benchmark(payload, rounds=50, limit=2000):
+    """Mean seconds per extraction for extract_text and (when bs4 is installed) the BeautifulSoup path"""
+    def timed(extract):
+        started = time.perf_counter()
+        for _ in range(rounds):
+            extract(payload, limit)
+        return (time.perf_counter() - started) / rounds
+
+    results = {'streaming': timed(extract_text), 'beautifulsoup': None}
+    try:
+        import bs4  # noqa: F401
+    except ImportError:
+        return results
+    results['beautifulsoup'] = timed(soup_extract_text)
+    return results
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark body extraction on a synthetic newsletter")
+    parser.add_argument('--stories', type=int, default=300, help="Stories in the newsletter HTML")
+    parser.add_argument('--rounds', type=int, default=50)
+    args = parser.parse_args()
+
+    payload = newsletter_payload(args.stories)
+    size = len(payload['parts'][0]['parts'][0]['body']['data'])
+    results = benchmark(payload, args.rounds)
+
+    print(f"📈 Newsletter body extraction ({size / 1024:.0f} KB base64, {args.rounds} rounds)")
+    print(f"  streaming:     {results['streaming'] * 1000:8.3f} ms")
+    if results['beautifulsoup'] is None:
+        print("  beautifulsoup: not installed (pip install -r requirements-dev.txt)")
+    else:
+        print(f"  beautifulsoup: {results['beautifulsoup'] * 1000:8.3f} ms")
+        print(f"  Speedup: {results['beautifulsoup'] / results['streaming']:.1f}x")
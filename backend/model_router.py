@@ -0,0 +1,208 @@
+import os
+import time
+import asyncio
+import threading
+from collections import deque
+
+class ModelUnavailable(Exception):
+    """The model does not exist or is not enabled for this API key (e.g. a 404)"""
+
+class ModelThrottled(Exception):
+    """The model asked us to wait longer than is worth spending on it - try the next one (not a health failure)"""
+
+class ModelHealth:
+    """Circuit breaker state and recent latencies for one model"""
+
+    def __init__(self, priority, window):
+        self.priority = priority
+        self.latencies = deque(maxlen=window)
+        self.consecutive_failures = 0
+        self.open_until = 0.0
+        self.probing = False
+        self.successes = 0
+        self.failures = 0
+
+    def percentile(self, fraction):
+        if not self.latencies:
+            return None
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+    def state(self, now):
+        if self.open_until <= 0:
+            return "closed"
+        return "open" if now < self.open_until else "half_open"
+
+class ModelRouter:
+    """
+    Orders models by recent latency, skips models whose circuit breaker is open,
+    and optionally hedges a slow request by racing it against the next model
+    """
+
+    def __init__(self, models, failure_threshold=None, cooldown=None, unavailable_cooldown=None,
+                 window=None, min_samples=None, hedge_delay=None, paused_for=None):
+        self.models = list(models)
+        # Seconds a model is paused for by the rate limiter (throttled models are tried last)
+        self.paused_for = paused_for or (lambda model: 0.0)
+        self.failure_threshold = int(failure_threshold or os.getenv('GEMINI_BREAKER_FAILURES', 3))
+        self.cooldown = float(cooldown or os.getenv('GEMINI_BREAKER_COOLDOWN', 30))
+        self.unavailable_cooldown = float(unavailable_cooldown or os.getenv('GEMINI_UNAVAILABLE_COOLDOWN', 3600))
+        self.min_samples = int(min_samples or os.getenv('GEMINI_LATENCY_MIN_SAMPLES', 5))
+        # 0 disables hedging; otherwise seconds to wait before racing the next model
+        self.hedge_delay = float(hedge_delay if hedge_delay is not None else os.getenv('GEMINI_HEDGE_DELAY', 0))
+
+        window = int(window or os.getenv('GEMINI_LATENCY_WINDOW', 50))
+        self._health = {model: ModelHealth(idx, window) for idx, model in enumerate(self.models)}
+        self._lock = threading.Lock()
+
+    def ordered(self):
+        """
+        Models worth trying now, fastest first by recent p50 (models without enough samples keep
+        their preference order after the measured ones). A half-open model gets a single probe,
+        and models paused by the rate limiter go last, soonest-resuming first.
+        """
+        now = time.monotonic()
+        with self._lock:
+            available = []
+            for model, health in self._health.items():
+                state = health.state(now)
+                if state == "open" or (state == "half_open" and health.probing):
+                    continue
+                available.append(model)
+
+            if not available:
+                # Everything is open - probe the model that will recover soonest rather than fail outright
+                available = [min(self._health, key=lambda m: self._health[m].open_until)]
+
+        paused = {model: self.paused_for(model) for model in available}
+        with self._lock:
+            available.sort(key=lambda model: (paused[model],) + self._sort_key(model))
+        return available
+
+    def _sort_key(self, model):
+        health = self._health[model]
+        p50 = health.percentile(0.5) if len(health.latencies) >= self.min_samples else None
+        return (p50 is None, p50 or 0.0, health.priority)
+
+    @property
+    def preferred(self):
+        """The model requests are currently routed to first"""
+        return self.ordered()[0]
+
+    def begin(self, model):
+        """Mark the start of an attempt (claims the probe slot of a half-open model)"""
+        with self._lock:
+            health = self._health[model]
+            if health.state(time.monotonic()) == "half_open":
+                health.probing = True
+
+    def record_success(self, model, latency=None):
+        with self._lock:
+            health = self._health[model]
+            health.successes += 1
+            health.consecutive_failures = 0
+            health.open_until = 0.0
+            health.probing = False
+            if latency is not None:
+                health.latencies.append(latency)
+
+    def record_failure(self, model, unavailable=False):
+        with self._lock:
+            health = self._health[model]
+            health.failures += 1
+            health.consecutive_failures += 1
+            health.probing = False
+            if unavailable:
+                health.open_until = time.monotonic() + self.unavailable_cooldown
+            elif health.consecutive_failures >= self.failure_threshold or health.open_until > 0:
+                # Trip the breaker (or re-open it after a failed half-open probe)
+                health.open_until = time.monotonic() + self.cooldown
+                print(f"  ⛔ Circuit open for {model} for {self.cooldown:.0f}s")
+
+    def release(self, model):
+        """An attempt was cancelled (lost a hedge race) - free its probe slot without judging it"""
+        with self._lock:
+            self._health[model].probing = False
+
+    async def _attempt(self, model, request):
+        self.begin(model)
+        started = time.monotonic()
+        try:
+            result = await request(model)
+        except asyncio.CancelledError:
+            self.release(model)
+            raise
+        except ModelUnavailable:
+            self.record_failure(model, unavailable=True)
+            raise
+        except ModelThrottled:
+            self.release(model)
+            raise
+        except Exception:
+            self.record_failure(model)
+            raise
+        self.record_success(model, time.monotonic() - started)
+        return result
+
+    async def call(self, request):
+        """
+        Run request(model) against the routed models until one succeeds - returns its result, or None
+        With hedging on, a second model is started if the first hasn't answered within hedge_delay
+        """
+        candidates = self.ordered()
+        attempts = {}
+        next_idx = 0
+
+        def launch():
+            nonlocal next_idx
+            model = candidates[next_idx]
+            next_idx += 1
+            print(f"  Trying model: {model}...")
+            attempts[asyncio.ensure_future(self._attempt(model, request))] = model
+
+        launch()
+        try:
+            while attempts:
+                can_hedge = self.hedge_delay > 0 and len(attempts) < 2 and next_idx < len(candidates)
+                done, _ = await asyncio.wait(
+                    attempts,
+                    timeout=self.hedge_delay if can_hedge else None,
+                    return_when=asyncio.FIRST_COMPLETED
+                )
+
+                if not done:
+                    print(f"  ⏱️  No answer from {next(iter(attempts.values()))} after {self.hedge_delay}s, hedging...")
+                    launch()
+                    continue
+
+                for task in done:
+                    model = attempts.pop(task)
+                    try:
+                        return task.result()
+                    except Exception as e:
+                        print(f"  Error with {model}: {type(e).__name__}: {str(e)[:50]}")
+
+                if not attempts and next_idx < len(candidates):
+                    launch()
+            return None
+        finally:
+            # Cancel whichever hedged attempt lost the race
+            for task in attempts:
+                task.cancel()
+
+    def stats(self):
+        now = time.monotonic()
+        with self._lock:
+            return {
+                model: {
+                    "state": health.state(now),
+                    "p50_ms": _ms(health.percentile(0.5)),
+                    "p95_ms": _ms(health.percentile(0.95)),
+                    "successes": health.successes,
+                    "failures": health.failures
+                }
+                for model, health in self._health.items()
+            }
+
+def _ms(seconds):
+    return round(seconds * 1000) if seconds is not None else None
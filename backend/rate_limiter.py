@@ -0,0 +1,228 @@
+import os
+import time
+import random
+import asyncio
+import threading
+import contextvars
+from collections import deque
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+
+# The user a Gemini call is made on behalf of (set per request/email by the API layer)
+current_user = contextvars.ContextVar('gemini_user', default=None)
+
+class TokenBucket:
+    """Refills continuously at a per-minute rate, holding at most one minute's budget"""
+
+    def __init__(self, per_minute):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.level = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount, now):
+        """Seconds until amount is available (oversized requests only wait for a full bucket)"""
+        self._refill(now)
+        amount = min(amount, self.capacity)
+        return 0.0 if self.level >= amount else (amount - self.level) / self.rate
+
+    def consume(self, amount, now):
+        """Take amount from the bucket - may go negative, which delays later callers"""
+        self._refill(now)
+        self.level -= amount
+
+class Ticket:
+    """One caller waiting for a request slot - woken (on its own event loop) when it reaches the head of the queue"""
+
+    def __init__(self):
+        self.loop = asyncio.get_running_loop()
+        self.ready = asyncio.Event()
+
+    def wake(self):
+        self.loop.call_soon_threadsafe(self.ready.set)
+
+class ModelQuota:
+    """Request and token buckets for one model, plus per-user queues served round-robin"""
+
+    def __init__(self, rpm, tpm):
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self.blocked_until = 0.0
+        self.waiting = {}  # user_id -> deque of tickets
+        self.turns = deque()  # users with waiting tickets, next to be served first
+
+    def enqueue(self, user_id, ticket):
+        if user_id not in self.waiting:
+            self.waiting[user_id] = deque()
+            self.turns.append(user_id)
+        self.waiting[user_id].append(ticket)
+
+    def head(self):
+        """The ticket served next, or None"""
+        return self.waiting[self.turns[0]][0] if self.turns else None
+
+    def discard(self, user_id, ticket):
+        tickets = self.waiting.get(user_id)
+        if tickets is None or ticket not in tickets:
+            return
+        was_head = self.head() is ticket
+        tickets.remove(ticket)
+        if not tickets:
+            del self.waiting[user_id]
+            self.turns.remove(user_id)
+        if was_head:
+            self._wake_head()
+
+    def _wake_head(self):
+        head = self.head()
+        if head is not None:
+            head.wake()
+
+    def try_take(self, user_id, ticket, tokens, now):
+        """
+        Take a request slot if it's this ticket's turn and the budget allows
+        Returns None when it isn't this ticket's turn (it is woken once it is), otherwise seconds to wait (0 = taken)
+        """
+        if self.head() is not ticket:
+            return None
+        if now < self.blocked_until:
+            return self.blocked_until - now
+
+        wait = max(self.requests.wait_time(1, now), self.tokens.wait_time(tokens, now))
+        if wait > 0:
+            return wait
+
+        self.requests.consume(1, now)
+        self.tokens.consume(tokens, now)
+
+        # Serve the next user's oldest request before this user's next one
+        self.waiting[user_id].popleft()
+        self.turns.popleft()
+        if self.waiting[user_id]:
+            self.turns.append(user_id)
+        else:
+            del self.waiting[user_id]
+        self._wake_head()
+        return 0.0
+
+class RateLimiter:
+    """
+    Shared per-model requests-per-minute and tokens-per-minute budgets for Gemini calls,
+    with fair per-user queuing and jittered exponential backoff for throttled retries
+    """
+
+    def __init__(self, rpm=None, tpm=None, base_backoff=None, max_backoff=None, max_retry_after=None, max_retry_wait=None):
+        self.rpm = int(rpm or os.getenv('GEMINI_RPM', 1000))
+        self.tpm = int(tpm or os.getenv('GEMINI_TPM', 1000000))
+        self.base_backoff = float(base_backoff or os.getenv('GEMINI_BACKOFF_BASE', 1.0))
+        self.max_backoff = float(max_backoff or os.getenv('GEMINI_BACKOFF_MAX', 30.0))
+        # Server-sent Retry-After is honored as-is up to its own (much higher) bound
+        self.max_retry_after = float(max_retry_after or os.getenv('GEMINI_RETRY_AFTER_MAX', 300.0))
+        # Longer waits than this aren't spent retrying the same model - callers move on to the next one
+        self.max_retry_wait = float(max_retry_wait or os.getenv('GEMINI_MAX_RETRY_WAIT', 2.0))
+        self._quotas = {}
+        self._lock = threading.Lock()
+        self.throttled = 0
+        self.queued = 0
+
+    def _quota(self, model):
+        quota = self._quotas.get(model)
+        if quota is None:
+            quota = self._quotas[model] = ModelQuota(self.rpm, self.tpm)
+        return quota
+
+    async def acquire(self, model, tokens, user_id=None):
+        """Wait for this user's turn and for one request plus `tokens` of budget on the model"""
+        user_id = user_id or current_user.get() or 'anonymous'
+        ticket = Ticket()
+        with self._lock:
+            quota = self._quota(model)
+            quota.enqueue(user_id, ticket)
+
+        waited = False
+        try:
+            while True:
+                with self._lock:
+                    wait = quota.try_take(user_id, ticket, tokens, time.monotonic())
+                if wait == 0:
+                    return
+                if not waited:
+                    waited = True
+                    self.queued += 1
+                if wait is None:
+                    # Not our turn - sleep until the ticket ahead is served (or gives up)
+                    await ticket.ready.wait()
+                    ticket.ready.clear()
+                else:
+                    await asyncio.sleep(wait)
+        except BaseException:
+            with self._lock:
+                quota.discard(user_id, ticket)
+            raise
+
+    def settle(self, model, estimated, actual):
+        """Correct the token budget once the real usage of a request is known"""
+        if actual is None:
+            return
+        with self._lock:
+            self._quota(model).tokens.consume(actual - estimated, time.monotonic())
+
+    def backoff(self, model, attempt, retry_after=None, throttled=False):
+        """
+        Seconds to wait before retrying: Retry-After when the server sent one (capped at max_retry_after),
+        otherwise exponential backoff with jitter (capped at max_backoff). A 429 pauses the model for every caller.
+        """
+        delay = parse_retry_after(retry_after)
+        if delay is None:
+            delay = min(self.max_backoff, self.base_backoff * 2 ** attempt)
+            delay = delay / 2 + random.uniform(0, delay / 2)
+        else:
+            delay = min(delay, self.max_retry_after)
+
+        if throttled:
+            with self._lock:
+                self.throttled += 1
+                quota = self._quota(model)
+                quota.blocked_until = max(quota.blocked_until, time.monotonic() + delay)
+        return delay
+
+    def paused_for(self, model):
+        """Seconds until a throttled model accepts requests again (0 when it isn't paused)"""
+        with self._lock:
+            quota = self._quotas.get(model)
+            return max(0.0, quota.blocked_until - time.monotonic()) if quota else 0.0
+
+    def stats(self):
+        now = time.monotonic()
+        with self._lock:
+            return {
+                "throttled": self.throttled,
+                "queued": self.queued,
+                "models": {
+                    model: {
+                        "waiting": sum(len(tickets) for tickets in quota.waiting.values()),
+                        "paused_seconds": round(max(0.0, quota.blocked_until - now), 1)
+                    }
+                    for model, quota in self._quotas.items()
+                }
+            }
+
+def parse_retry_after(value):
+    """Seconds from a Retry-After header (delta-seconds or HTTP-date), or None"""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if retry_at.tzinfo is None:
+        retry_at = retry_at.replace(tzinfo=timezone.utc)
+    return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
@@ -0,0 +1,188 @@
+import re
+import json
+import threading
+
+URGENCY_VALUES = ["low", "medium", "high"]
+CATEGORY_VALUES = ["work", "personal", "newsletter", "promotional"]
+SENTIMENT_VALUES = ["positive", "neutral", "negative"]
+
+# Gemini responseSchema (OpenAPI subset) for one email's analysis - mirrors EmailSummaryResponse
+ANALYSIS_PROPERTIES = {
+    "summary": {"type": "STRING"},
+    "key_points": {"type": "ARRAY", "items": {"type": "STRING"}},
+    "action_items": {"type": "ARRAY", "items": {"type": "STRING"}},
+    "urgency": {"type": "STRING", "enum": URGENCY_VALUES},
+    "category": {"type": "STRING", "enum": CATEGORY_VALUES},
+    "sentiment": {"type": "STRING", "enum": SENTIMENT_VALUES},
+}
+ANALYSIS_REQUIRED = ["summary", "key_points", "action_items", "urgency", "category", "sentiment"]
+
+SUMMARY_SCHEMA = {
+    "type": "OBJECT",
+    "properties": ANALYSIS_PROPERTIES,
+    "required": ANALYSIS_REQUIRED,
+}
+
+COMBINED_SCHEMA = {
+    "type": "OBJECT",
+    "properties": {**ANALYSIS_PROPERTIES, "draft_reply": {"type": "STRING"}},
+    "required": ANALYSIS_REQUIRED + ["draft_reply"],
+}
+
+BULK_SCHEMA = {
+    "type": "ARRAY",
+    "items": {
+        "type": "OBJECT",
+        "properties": {"id": {"type": "STRING"}, **ANALYSIS_PROPERTIES},
+        "required": ["id"] + ANALYSIS_REQUIRED,
+    },
+}
+
+# Enum fields and the value used when the model returns something outside the enum
+ENUM_FIELDS = {
+    "urgency": (URGENCY_VALUES, "medium"),
+    "category": (CATEGORY_VALUES, "unknown"),
+    "sentiment": (SENTIMENT_VALUES, "neutral"),
+}
+
+CODE_FENCE_RE = re.compile(r'```(?:json)?\s*', re.IGNORECASE)
+TRAILING_COMMA_RE = re.compile(r',\s*([}\]])')
+SMART_QUOTES = str.maketrans({'“': '"', '”': '"'})
+
+class ResponseParser:
+    """Parses and validates model JSON output, repairing near-valid JSON instead of failing"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.parsed = 0
+        self.repaired = 0
+        self.parse_failures = 0
+        self.validation_failures = 0
+
+    def _count(self, counter):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def parse(self, text):
+        """Decode a JSON response - the raw text first (JSON mode), then a repair pass"""
+        try:
+            value = json.loads(text)
+            self._count('parsed')
+            return value
+        except (TypeError, ValueError):
+            pass
+
+        try:
+            value = repair_json(text)
+        except ValueError:
+            self._count('parse_failures')
+            raise
+        self._count('repaired')
+        return value
+
+    def parse_analysis(self, text):
+        """Parse a single email analysis object"""
+        data = self.parse(text)
+        return self.validate_analysis(data)
+
+    def parse_analyses(self, text):
+        """Parse a bulk response - a list of analyses, each keeping its 'id'"""
+        data = self.parse(text)
+        if isinstance(data, dict):
+            data = next((value for value in data.values() if isinstance(value, list)), [data])
+        if not isinstance(data, list):
+            self._count('validation_failures')
+            raise ValueError("Expected a JSON array of analyses")
+
+        analyses = []
+        for item in data:
+            try:
+                analysis = self.validate_analysis(item)
+            except ValueError:
+                continue
+            analysis['id'] = str(item.get('id', ''))
+            analyses.append(analysis)
+        return analyses
+
+    def validate_analysis(self, data):
+        """Check an analysis against the schema, normalizing lists and enum values"""
+        summary = data.get('summary') if isinstance(data, dict) else None
+        if not isinstance(summary, str) or not summary.strip():
+            self._count('validation_failures')
+            raise ValueError("Analysis has no summary")
+
+        analysis = {'summary': summary.strip()}
+        for field in ('key_points', 'action_items'):
+            value = data.get(field) or []
+            if isinstance(value, str):
+                value = [value]
+            analysis[field] = [str(item).strip() for item in value if str(item).strip()] if isinstance(value, list) else []
+
+        for field, (allowed, default) in ENUM_FIELDS.items():
+            value = str(data.get(field) or '').strip().lower()
+            analysis[field] = value if value in allowed else default
+
+        for field, value in data.items():
+            analysis.setdefault(field, value)
+        return analysis
+
+    def stats(self):
+        with self._lock:
+            return {
+                "parsed": self.parsed,
+                "repaired": self.repaired,
+                "parse_failures": self.parse_failures,
+                "validation_failures": self.validation_failures
+            }
+
+def repair_json(text):
+    """
+    Recover JSON from near-valid model output: markdown fences, prose around the JSON,
+    smart quotes, trailing commas and output truncated mid-object
+    """
+    if not isinstance(text, str):
+        raise ValueError("No JSON found in response")
+
+    text = CODE_FENCE_RE.sub('', text)
+    starts = [idx for idx in (text.find('{'), text.find('[')) if idx != -1]
+    if not starts:
+        raise ValueError("No JSON found in response")
+    text = text[min(starts):]
+
+    decoder = json.JSONDecoder(strict=False)
+    for candidate in (text, text.translate(SMART_QUOTES)):
+        candidate = TRAILING_COMMA_RE.sub(r'\1', candidate)
+        for attempt in (candidate, _close_truncated(candidate)):
+            try:
+                # raw_decode ignores anything after the JSON value (e.g. trailing prose)
+                return decoder.raw_decode(attempt)[0]
+            except ValueError:
+                continue
+    raise ValueError("Could not repair JSON response")
+
+def _close_truncated(text):
+    """Close an unterminated string and any brackets left open by a cut-off response"""
+    closers = []
+    in_string = escaped = False
+    for char in text:
+        if in_string:
+            if escaped:
+                escaped = False
+            elif char == '\\':
+                escaped = True
+            elif char == '"':
+                in_string = False
+        elif char == '"':
+            in_string = True
+        elif char in '{[':
+            closers.append('}' if char == '{' else ']')
+        elif char in '}]' and closers:
+            closers.pop()
+
+    if in_string:
+        text += '"'
+    text = text.rstrip()
+    if closers and closers[-1] == '}':
+        # Inside an object: drop a key left without a value ("key" or "key":)
+        text = re.sub(r'([{,])\s*"[^"]*"\s*:?$', r'\1', text)
+    return text.rstrip().rstrip(',') + ''.join(reversed(closers))
@@ -0,0 +1,216 @@
+import os
+import json
+import time
+import queue
+import asyncio
+import sqlite3
+import hashlib
+import threading
+from collections import OrderedDict
+
+# The disk tier is trimmed every this many inserts (and whenever it grows this far past its bound)
+DISK_EVICT_INTERVAL = 500
+
+# Most disk writes committed in one transaction by the writer thread
+DISK_WRITE_BATCH = 200
+
+class SummaryCache:
+    """
+    Content-addressed cache for Gemini results: in-process LRU plus an optional SQLite tier
+    Disk writes go through a background writer thread; use aget() from async code so disk reads stay off the event loop
+    """
+
+    def __init__(self, max_entries=None, ttl_seconds=None, db_path=None, max_disk_entries=None):
+        self.max_entries = int(max_entries or os.getenv('SUMMARY_CACHE_SIZE', 1000))
+        self.ttl_seconds = int(ttl_seconds or os.getenv('SUMMARY_CACHE_TTL', 7 * 24 * 3600))
+        self.max_disk_entries = int(max_disk_entries or os.getenv('SUMMARY_CACHE_DISK_SIZE', 50000))
+        self.db_path = db_path or os.getenv('SUMMARY_CACHE_PATH')
+
+        # key -> (expires_at, json value)
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+        self._db = None
+        self._db_lock = threading.Lock()
+        self._writes = queue.Queue()
+        self._writer = None
+        self._disk_rows = 0
+        self._inserts_since_evict = 0
+        if self.db_path:
+            self._db = sqlite3.connect(self.db_path, check_same_thread=False)
+            self._db.execute("""
+                CREATE TABLE IF NOT EXISTS cache (
+                    key TEXT PRIMARY KEY,
+                    value TEXT NOT NULL,
+                    expires_at REAL NOT NULL,
+                    accessed_at REAL NOT NULL
+                )
+            """)
+            self._db.execute("CREATE INDEX IF NOT EXISTS cache_accessed ON cache (accessed_at)")
+            self._db.commit()
+            self._disk_rows = self._db.execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+
+            self._writer = threading.Thread(target=self._write_loop, name="summary-cache-writer", daemon=True)
+            self._writer.start()
+
+    @staticmethod
+    def make_key(kind, email_data, prompt_version, model, **params):
+        """Hash the normalized email content together with everything that shapes the prompt"""
+        body = ' '.join(str(email_data.get('body', '')).split())
+        payload = json.dumps([
+            kind,
+            body,
+            email_data.get('subject', ''),
+            email_data.get('sender', ''),
+            prompt_version,
+            model,
+            params
+        ], sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def get(self, key):
+        """Return the cached value for key, or None on a miss (reads the disk tier inline - for sync callers)"""
+        found, value = self._get_memory(key)
+        if found:
+            return value
+        return self._get_disk(key)
+
+    async def aget(self, key):
+        """Return the cached value for key, or None on a miss - disk reads run in a worker thread"""
+        found, value = self._get_memory(key)
+        if found:
+            return value
+        if self._db is None:
+            return self._get_disk(key)
+        return await asyncio.get_running_loop().run_in_executor(None, self._get_disk, key)
+
+    def _get_memory(self, key):
+        """(True, value) on a memory hit, otherwise (False, None)"""
+        now = time.time()
+
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                expires_at, value = entry
+                if expires_at > now:
+                    self._memory.move_to_end(key)
+                    self.hits += 1
+                    return True, json.loads(value)
+                del self._memory[key]
+        return False, None
+
+    def _get_disk(self, key):
+        """Look key up in the disk tier (counts the miss when it isn't there)"""
+        now = time.time()
+
+        if self._db is not None:
+            with self._db_lock:
+                row = self._db.execute(
+                    "SELECT value, expires_at FROM cache WHERE key = ?", (key,)
+                ).fetchone()
+            if row and row[1] > now:
+                # Recency is recorded by the writer thread, not on the caller's thread
+                self._writes.put(("touch", key, now))
+                with self._lock:
+                    self._remember(key, row[1], row[0])
+                    self.hits += 1
+                    self.disk_hits += 1
+                return json.loads(row[0])
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def set(self, key, value):
+        """Store a value under key for the configured TTL (the disk write happens in the background)"""
+        now = time.time()
+        expires_at = now + self.ttl_seconds
+        serialized = json.dumps(value, ensure_ascii=False)
+
+        with self._lock:
+            self._remember(key, expires_at, serialized)
+
+        if self._db is not None:
+            self._writes.put(("set", key, serialized, expires_at, now))
+
+    def _write_loop(self):
+        """Writer thread: commit queued disk writes in batches, trimming the table every few hundred inserts"""
+        while True:
+            operations = [self._writes.get()]
+            while len(operations) < DISK_WRITE_BATCH:
+                try:
+                    operations.append(self._writes.get_nowait())
+                except queue.Empty:
+                    break
+
+            stop = any(operation is None for operation in operations)
+            try:
+                self._apply_writes([operation for operation in operations if operation is not None])
+            except Exception as e:
+                print(f"⚠️  Summary cache disk write failed: {e}")
+            if stop:
+                return
+
+    def _apply_writes(self, operations):
+        inserts = 0
+        with self._db_lock:
+            for operation in operations:
+                if operation[0] == "set":
+                    _, key, serialized, expires_at, now = operation
+                    self._db.execute(
+                        "INSERT OR REPLACE INTO cache (key, value, expires_at, accessed_at) VALUES (?, ?, ?, ?)",
+                        (key, serialized, expires_at, now)
+                    )
+                    inserts += 1
+                else:
+                    _, key, now = operation
+                    self._db.execute("UPDATE cache SET accessed_at = ? WHERE key = ?", (now, key))
+
+            self._disk_rows += inserts
+            self._inserts_since_evict += inserts
+            if (self._inserts_since_evict >= DISK_EVICT_INTERVAL
+                    or self._disk_rows > self.max_disk_entries + DISK_EVICT_INTERVAL):
+                self._evict(time.time())
+            self._db.commit()
+
+    def _evict(self, now):
+        """Drop expired rows, then the least recently used beyond the size bound (caller holds _db_lock)"""
+        self._db.execute("DELETE FROM cache WHERE expires_at <= ?", (now,))
+        self._db.execute(
+            "DELETE FROM cache WHERE key IN "
+            "(SELECT key FROM cache ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+            (self.max_disk_entries,)
+        )
+        self._disk_rows = self._db.execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+        self._inserts_since_evict = 0
+
+    def close(self):
+        """Commit queued disk writes and stop the writer thread"""
+        if self._writer is not None:
+            self._writes.put(None)
+            self._writer.join()
+            self._writer = None
+
+    def _remember(self, key, expires_at, serialized):
+        """Insert into the memory tier, evicting the least recently used entries"""
+        self._memory[key] = (expires_at, serialized)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def stats(self):
+        """Hit/miss counters for the health endpoint"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+                "memory_entries": len(self._memory),
+                "disk_enabled": self._db is not None
+            }
@@ -0,0 +1,116 @@
+import os
+import sys
+import json
+import base64
+import email
+from urllib.parse import urlparse, parse_qs
+
+import httplib2
+import pytest
+from google.oauth2.credentials import Credentials
+
+# Tests import the backend modules the same way main.py does
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import email_fetcher
+from email_fetcher import EmailFetcher
+
+class FakeGmail:
+    """
+    Local stand-in for the Gmail HTTP API (batch endpoint included) that counts round-trips
+    Pass it as the fetcher's transport; it answers like the real service would
+    """
+
+    def __init__(self):
+        self.messages = {}
+        self.fail_once = {}    # message ID -> HTTP status returned on its first request only
+        self.round_trips = 0
+        self.batches = []      # message IDs requested by each batch call, in order
+
+    def add_message(self, msg_id, subject="Hello", sender="alice@example.com", body="Hi there"):
+        self.messages[msg_id] = {
+            'id': msg_id,
+            'threadId': f"t-{msg_id}",
+            'labelIds': ['INBOX', 'UNREAD'],
+            'snippet': body[:50],
+            'payload': {
+                'mimeType': 'text/plain',
+                'headers': [
+                    {'name': 'Subject', 'value': subject},
+                    {'name': 'From', 'value': sender},
+                    {'name': 'Date', 'value': 'Mon, 1 Jan 2024 10:00:00 +0000'},
+                ],
+                'body': {'data': base64.urlsafe_b64encode(body.encode('utf-8')).decode('ascii')}
+            }
+        }
+
+    # httplib2.Http interface
+    def request(self, uri, method='GET', body=None, headers=None, **kwargs):
+        self.round_trips += 1
+        path = urlparse(uri).path
+        if path.startswith('/batch'):
+            return self._batch(body, headers)
+        status, payload = self._single(method, uri)
+        return httplib2.Response({'status': status, 'content-type': 'application/json'}), json.dumps(payload).encode('utf-8')
+
+    def _single(self, method, uri):
+        parsed = urlparse(uri)
+        parts = parsed.path.rstrip('/').split('/')
+        query = parse_qs(parsed.query)
+
+        if parts[-1] == 'messages' and method == 'GET':
+            ids = list(self.messages)[:int(query.get('maxResults', [100])[0])]
+            return 200, {'messages': [{'id': msg_id} for msg_id in ids]}
+
+        msg_id = parts[-1]
+        if msg_id in self.fail_once:
+            return self.fail_once.pop(msg_id), {'error': {'code': 503, 'message': 'Backend Error'}}
+        if msg_id not in self.messages:
+            return 404, {'error': {'code': 404, 'message': 'Not Found'}}
+        return 200, self.messages[msg_id]
+
+    def _batch(self, body, headers):
+        if isinstance(body, bytes):
+            body = body.decode('utf-8')
+        request = email.message_from_string(f"Content-Type: {headers['content-type']}\r\n\r\n{body}")
+
+        requested = []
+        parts = []
+        for part in request.get_payload():
+            content_id = part['Content-ID']
+            request_line = part.get_payload().lstrip().split('\n', 1)[0]
+            method, uri = request_line.split(' ')[:2]
+            requested.append(urlparse(uri).path.rsplit('/', 1)[-1])
+
+            status, payload = self._single(method, f"https://gmail.googleapis.com{uri}")
+            parts.append(
+                "--batch_boundary\r\n"
+                "Content-Type: application/http\r\n"
+                f"Content-ID: <response-{content_id.strip('<>')}>\r\n\r\n"
+                f"HTTP/1.1 {status} {'OK' if status == 200 else 'Error'}\r\n"
+                "Content-Type: application/json\r\n\r\n"
+                f"{json.dumps(payload)}\r\n"
+            )
+        self.batches.append(requested)
+
+        content = ''.join(parts) + "--batch_boundary--\r\n"
+        response = httplib2.Response({'status': 200, 'content-type': 'multipart/mixed; boundary=batch_boundary'})
+        return response, content.encode('utf-8')
+
+class StaticCredentialStore:
+    """Credential store holding one always-valid access token"""
+
+    def load(self, user_id):
+        return Credentials(token='test-token')
+
+@pytest.fixture
+def fake_gmail():
+    return FakeGmail()
+
+@pytest.fixture
+def fetcher(fake_gmail, monkeypatch):
+    # Retries back off with time.sleep - don't actually wait in tests
+    monkeypatch.setattr(email_fetcher.time, 'sleep', lambda seconds: None)
+    gmail_fetcher = EmailFetcher('user-1', StaticCredentialStore())
+    gmail_fetcher._local.http = fake_gmail
+    return gmail_fetcher
@@ -0,0 +1,37 @@
+import os
+
+from bench_gemini import bench_bulk, bench_summarize, load_emails
+
+CORPUS_PATH = os.path.join(os.path.dirname(__file__), 'fixtures', 'classifier_corpus.json')
+
+
+def test_pooled_client_reuses_connections_and_outpaces_per_call_path(monkeypatch):
+    for name in ('GEMINI_API_BASE', 'GEMINI_RPM', 'GEMINI_TPM'):
+        monkeypatch.setenv(name, 'placeholder')
+    monkeypatch.setenv('GOOGLE_API_KEY', 'test-key')
+    monkeypatch.delenv('SUMMARY_CACHE_PATH', raising=False)
+
+    results = bench_summarize(total=20, concurrency=10, latency=0.01, connect_latency=0.01)
+
+    per_call, pooled = results['per-call'], results['pooled']
+    assert per_call['failures'] == pooled['failures'] == 0
+    assert per_call['gemini_requests'] == pooled['gemini_requests'] == 20
+    assert per_call['connections'] == 20
+    assert pooled['connections'] <= 10
+    assert pooled['rps'] > per_call['rps']
+
+
+def test_bulk_benchmark_packs_the_fixture_corpus_into_fewer_requests(monkeypatch):
+    for name in ('GEMINI_API_BASE', 'GEMINI_RPM', 'GEMINI_TPM'):
+        monkeypatch.setenv(name, 'placeholder')
+    monkeypatch.setenv('GOOGLE_API_KEY', 'test-key')
+    monkeypatch.delenv('SUMMARY_CACHE_PATH', raising=False)
+    emails = load_emails(CORPUS_PATH, repeat=2)
+
+    results = bench_bulk(emails, token_budget=2000, latency=0.01, connect_latency=0.01)
+
+    per_email, bulk = results['per-email'], results['bulk']
+    assert per_email['failures'] == bulk['failures'] == 0
+    assert per_email['gemini_requests'] == len(emails)
+    assert 1 < bulk['gemini_requests'] < len(emails) // 4
+    assert bulk['seconds'] < per_email['seconds']
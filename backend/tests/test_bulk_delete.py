@@ -0,0 +1,195 @@
+import asyncio
+import os
+import time
+import uuid
+
+import pytest
+
+from bulk_delete import DELETE_BATCH_SIZE, delete_query_results, fetch_key_page
+from job_queue import Job
+
+requires_emulator = pytest.mark.skipif(
+    not os.getenv('FIRESTORE_EMULATOR_HOST'), reason="needs the Firestore emulator (set FIRESTORE_EMULATOR_HOST)"
+)
+
+
+class CountingBatch:
+    def __init__(self, batch, sizes):
+        self.batch = batch
+        self.sizes = sizes
+
+    def delete(self, doc_ref):
+        self.batch.delete(doc_ref)
+
+    def commit(self):
+        self.sizes.append(len(self.batch))
+        return self.batch.commit()
+
+
+class CountingDB:
+    """Wraps a Firestore client to record how many writes each batch commit carried"""
+
+    def __init__(self, db):
+        self.db = db
+        self.batch_sizes = []
+
+    def batch(self):
+        return CountingBatch(self.db.batch(), self.batch_sizes)
+
+
+# Fake Firestore query over in-memory documents (always runs)
+
+class FakeSnapshot:
+    def __init__(self, store, doc_id, fields):
+        self.id = doc_id
+        self.reference = (store, doc_id)
+        self._fields = fields
+
+    def to_dict(self):
+        return dict(self._fields)
+
+
+class FakeQuery:
+    def __init__(self, store, projection=None, limit=None, after=None):
+        self.store = store
+        self.projection = projection
+        self._limit = limit
+        self._after = after
+
+    def select(self, fields):
+        return FakeQuery(self.store, fields, self._limit, self._after)
+
+    def limit(self, count):
+        return FakeQuery(self.store, self.projection, count, self._after)
+
+    def start_after(self, snapshot):
+        return FakeQuery(self.store, self.projection, self._limit, snapshot.id)
+
+    def stream(self):
+        ids = sorted(doc_id for doc_id in self.store.docs if self._after is None or doc_id > self._after)
+        self.store.reads.append(self.projection)
+        for doc_id in ids[:self._limit]:
+            fields = {} if self.projection == ['__name__'] else self.store.docs[doc_id]
+            yield FakeSnapshot(self.store, doc_id, fields)
+
+
+class FakeBatch:
+    def __init__(self, store):
+        self.store = store
+        self.deletes = []
+
+    def delete(self, doc_ref):
+        self.deletes.append(doc_ref)
+
+    def __len__(self):
+        return len(self.deletes)
+
+    def commit(self):
+        for _, doc_id in self.deletes:
+            del self.store.docs[doc_id]
+
+
+class FakeStore:
+    def __init__(self, count):
+        self.docs = {f'doc-{idx:05d}': {'user_id': 'user-1', 'summary': 'x' * 100} for idx in range(count)}
+        self.reads = []
+
+    def batch(self):
+        return FakeBatch(self)
+
+
+def test_pages_of_keys_are_deleted_in_chunks_with_job_progress():
+    store = FakeStore(2300)
+    db = CountingDB(store)
+    job = Job('user-1', 'clear_summaries')
+    query = FakeQuery(store)
+
+    async def scenario():
+        first_page = fetch_key_page(query, page_size=1000)
+        return await delete_query_results(db, query, first_page, job=job, page_size=1000)
+
+    assert asyncio.run(scenario()) == 2300
+    assert not store.docs
+    assert store.reads == [['__name__']] * 3
+    assert sorted(db.batch_sizes) == [300, 500, 500, 500, 500]
+    assert job.processed == 2300
+
+
+# Firestore emulator (FIRESTORE_EMULATOR_HOST=localhost:8080 python -m pytest tests/test_bulk_delete.py -s)
+
+@pytest.fixture
+def emulator_db():
+    from google.cloud import firestore
+    return firestore.Client(project=os.getenv('GCLOUD_PROJECT', 'demo-inbox-ai'))
+
+
+def seed(db, count, user_id='user-1'):
+    """Store `count` email-like documents in a fresh collection - returns the user's query"""
+    collection = db.collection(f'emails-test-{uuid.uuid4().hex[:8]}')
+    for start in range(0, count, DELETE_BATCH_SIZE):
+        batch = db.batch()
+        for idx in range(start, min(start + DELETE_BATCH_SIZE, count)):
+            batch.set(collection.document(f'msg-{idx:05d}'), {
+                'user_id': user_id, 'subject': f'Subject {idx}', 'summary': 'x' * 500, 'key_points': ['a', 'b']
+            })
+        batch.commit()
+    return collection.where('user_id', '==', user_id)
+
+
+@requires_emulator
+def test_key_pages_carry_no_fields_and_cover_every_document(emulator_db):
+    query = seed(emulator_db, 25)
+
+    pages, last = [], None
+    while True:
+        page = fetch_key_page(query, last, page_size=10)
+        if not page:
+            break
+        pages.append(page)
+        last = page[-1]
+
+    assert [len(page) for page in pages] == [10, 10, 5]
+    assert len({snapshot.id for page in pages for snapshot in page}) == 25
+    assert all(snapshot.to_dict() == {} for page in pages for snapshot in page)
+
+
+@requires_emulator
+def test_deletes_commit_in_batches_of_500_and_report_progress(emulator_db):
+    query = seed(emulator_db, 1200)
+    db = CountingDB(emulator_db)
+    job = Job('user-1', 'clear_summaries')
+
+    async def scenario():
+        first_page = fetch_key_page(query, page_size=1000)
+        return await delete_query_results(db, query, first_page, job=job, page_size=1000)
+
+    assert asyncio.run(scenario()) == 1200
+    assert sorted(db.batch_sizes) == [200, 500, 500]
+    assert job.processed == 1200
+    assert list(query.limit(1).stream()) == []
+
+
+@requires_emulator
+def test_bulk_delete_of_10k_documents_beats_one_by_one_deletes(emulator_db):
+    count = int(os.getenv('BULK_DELETE_BENCH_DOCS', 10000))
+
+    # The previous implementation: stream full documents and delete them one at a time
+    query = seed(emulator_db, count)
+    started = time.perf_counter()
+    for snapshot in query.stream():
+        snapshot.reference.delete()
+    one_by_one = time.perf_counter() - started
+
+    query = seed(emulator_db, count)
+
+    async def bulk():
+        first_page = fetch_key_page(query)
+        return await delete_query_results(emulator_db, query, first_page)
+
+    started = time.perf_counter()
+    assert asyncio.run(bulk()) == count
+    bulk_seconds = time.perf_counter() - started
+
+    print(f"\n📈 Deleting {count} documents: one by one {one_by_one:.2f}s, "
+          f"key pages + parallel batches {bulk_seconds:.2f}s ({one_by_one / bulk_seconds:.1f}x)")
+    assert bulk_seconds < one_by_one
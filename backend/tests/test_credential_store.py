@@ -0,0 +1,78 @@
+import pickle
+import time
+from datetime import datetime, timedelta
+
+import pytest
+from google.oauth2.credentials import Credentials
+
+from credential_store import FileCredentialStore, GmailNotAuthorized, migrate_legacy_token
+from email_fetcher import EmailFetcher
+from gmail_clients import GmailClientRegistry, _ClientEntry
+
+
+def test_missing_credentials_raise_instead_of_prompting(tmp_path):
+    store = FileCredentialStore(directory=str(tmp_path))
+    with pytest.raises(GmailNotAuthorized):
+        EmailFetcher('user-without-token', store)
+
+
+def test_expired_credentials_without_refresh_token_raise(tmp_path):
+    store = FileCredentialStore(directory=str(tmp_path))
+    store.save('user-1', Credentials(token=None))
+    with pytest.raises(GmailNotAuthorized):
+        EmailFetcher('user-1', store)
+
+
+def test_legacy_token_is_migrated_once(tmp_path):
+    legacy = tmp_path / 'token.pickle'
+    with open(legacy, 'wb') as token:
+        pickle.dump(Credentials(token='legacy-token', refresh_token='refresh', client_id='id', client_secret='secret'), token)
+    store = FileCredentialStore(directory=str(tmp_path / 'tokens'))
+
+    assert migrate_legacy_token(store, 'user-1', str(legacy))
+    assert not legacy.exists()
+    assert (tmp_path / 'token.pickle.migrated').exists()
+    assert FileCredentialStore(directory=str(tmp_path / 'tokens')).load('user-1').token == 'legacy-token'
+    assert not migrate_legacy_token(store, 'user-1', str(legacy))
+
+
+def expiring_credentials():
+    return Credentials(
+        token='token', refresh_token='refresh', client_id='id', client_secret='secret',
+        expiry=datetime.utcnow() + timedelta(seconds=30)
+    )
+
+
+def test_idle_client_eviction_stops_background_refreshes(tmp_path, monkeypatch):
+    store = FileCredentialStore(directory=str(tmp_path))
+    store.save('idle-user', expiring_credentials())
+    store.save('active-user', expiring_credentials())
+    registry = GmailClientRegistry(store, idle_timeout=60)
+    for user_id, last_used in (('idle-user', time.monotonic() - 120), ('active-user', time.monotonic())):
+        entry = _ClientEntry()
+        entry.fetcher, entry.last_used = object(), last_used
+        registry._clients[user_id] = entry
+
+    refreshed = []
+    monkeypatch.setattr(store, 'refresh', lambda user_id, force=False: refreshed.append(user_id))
+
+    registry.evict_idle()
+
+    assert len(registry) == 1
+    assert 'idle-user' not in store._cache
+    assert store.refresh_due() == ['active-user']
+    assert refreshed == ['active-user']
+    # Evicted credentials are still stored and reload on the user's next request
+    assert store.load('idle-user').refresh_token == 'refresh'
+
+
+def test_failed_client_build_evicts_cached_credentials(tmp_path):
+    store = FileCredentialStore(directory=str(tmp_path))
+    store.save('user-1', Credentials(token=None))
+    registry = GmailClientRegistry(store)
+
+    with pytest.raises(GmailNotAuthorized):
+        registry.get('user-1')
+
+    assert len(registry) == 0
+    assert 'user-1' not in store._cache
@@ -0,0 +1,155 @@
+import asyncio
+import json
+
+import httpx
+import pytest
+
+from email_agent import EmailAgent
+
+
+def run_with_responses(monkeypatch, responses):
+    """Call _generate_content once against a scripted Gemini - returns (agent, result or exception, requests)"""
+    monkeypatch.setenv('GOOGLE_API_KEY', 'test-key')
+    monkeypatch.delenv('SUMMARY_CACHE_PATH', raising=False)
+    agent = EmailAgent()
+    requests = []
+
+    def handler(request):
+        requests.append(request)
+        return responses.pop(0)
+
+    async def scenario():
+        client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        agent._loop_resources[asyncio.get_running_loop()] = (client, asyncio.Semaphore(1))
+        data = {'contents': [], 'generationConfig': {'responseMimeType': 'application/json'}}
+        try:
+            return await agent._generate_content('gemini-test', data, 10)
+        except httpx.HTTPStatusError as e:
+            return e
+        finally:
+            await client.aclose()
+
+    return agent, asyncio.run(scenario()), requests
+
+
+def ok(text):
+    return httpx.Response(200, json={'candidates': [{'content': {'parts': [{'text': text}]}}]})
+
+
+def test_schema_rejection_falls_back_to_plain_text(monkeypatch):
+    rejection = httpx.Response(400, json={'error': {'message': 'Invalid JSON payload: Unknown name "responseSchema"'}})
+    agent, result, requests = run_with_responses(monkeypatch, [rejection, ok('plain')])
+
+    assert result == 'plain'
+    assert 'gemini-test' in agent._plain_text_models
+    assert b'generationConfig' not in requests[1].content
+
+
+@pytest.mark.parametrize('message', ['API key not valid', 'Request contains an invalid argument: contents'])
+def test_other_bad_requests_are_normal_failures(monkeypatch, message):
+    agent, result, requests = run_with_responses(monkeypatch, [httpx.Response(400, json={'error': {'message': message}})])
+
+    assert isinstance(result, httpx.HTTPStatusError)
+    assert len(requests) == 1
+    assert not agent._plain_text_models
+
+
+def test_throttled_model_is_skipped_instead_of_waited_out(monkeypatch):
+    monkeypatch.setenv('GOOGLE_API_KEY', 'test-key')
+    monkeypatch.delenv('SUMMARY_CACHE_PATH', raising=False)
+    agent = EmailAgent()
+    throttled, healthy = agent.models[0], agent.models[1]
+    calls = []
+
+    def handler(request):
+        model = request.url.path.rsplit('/', 1)[-1].split(':')[0]
+        calls.append(model)
+        if model == throttled:
+            return httpx.Response(429, headers={'Retry-After': '3'})
+        return ok(f"from {model}")
+
+    async def scenario():
+        client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        agent._loop_resources[asyncio.get_running_loop()] = (client, asyncio.Semaphore(4))
+        try:
+            started = asyncio.get_running_loop().time()
+            first = await agent._call_gemini_async('hello')
+            second = await agent._call_gemini_async('hello again')
+            return first, second, asyncio.get_running_loop().time() - started
+        finally:
+            await client.aclose()
+
+    first, second, elapsed = asyncio.run(scenario())
+    assert first == second == f"from {healthy}"
+    assert elapsed < 1
+    # One 429, then the paused model is demoted behind the healthy one
+    assert calls == [throttled, healthy, healthy]
+    assert agent.router.ordered()[-1] == throttled
+
+
+def make_agent(monkeypatch):
+    monkeypatch.setenv('GOOGLE_API_KEY', 'test-key')
+    monkeypatch.delenv('SUMMARY_CACHE_PATH', raising=False)
+    return EmailAgent()
+
+
+def email(idx, body_chars=400):
+    return {'id': f'm{idx}', 'sender': 'a@example.com', 'subject': f'Subject {idx}', 'date': '2024-01-01', 'body': 'x' * body_chars}
+
+
+def test_pack_emails_keeps_every_group_within_the_token_budget(monkeypatch):
+    agent = make_agent(monkeypatch)
+    emails = [email(idx) for idx in range(12)] + [email('big', body_chars=20000)] + [email(99)]
+    budget = agent._estimate_tokens(agent._bulk_prompt([])) + 400
+
+    groups = agent._pack_emails(emails, budget)
+
+    assert [e for group in groups for e in group] == emails
+    assert len(groups) > 1
+    for group in groups:
+        blocks = [agent._bulk_email_block(f"E{idx}", e) for idx, e in enumerate(group, 1)]
+        # Only an email too large for any group may exceed the budget, and then it is packed alone
+        assert agent._estimate_tokens(agent._bulk_prompt(blocks)) <= budget or len(group) == 1
+    assert [email('big', body_chars=20000)] in groups
+
+
+def test_pack_emails_fits_everything_in_one_group_under_a_large_budget(monkeypatch):
+    agent = make_agent(monkeypatch)
+    emails = [email(idx) for idx in range(5)]
+
+    assert agent._pack_emails(emails, 100000) == [emails]
+    assert agent._pack_emails([], 100000) == []
+
+
+def test_emails_missing_from_a_packed_response_are_requeued_individually(monkeypatch):
+    agent = make_agent(monkeypatch)
+    emails = [email(idx) for idx in range(4)]
+    packed, single = [], []
+    analysis = {'summary': 'ok', 'key_points': [], 'action_items': [], 'urgency': 'low',
+                'category': 'work', 'sentiment': 'neutral'}
+
+    def handler(request):
+        body = json.loads(request.content)
+        prompt = body['contents'][0]['parts'][0]['text']
+        if body['generationConfig']['responseSchema']['type'] == 'ARRAY':
+            packed.append(prompt)
+            # The model drops E3 from its answer
+            return ok(json.dumps([dict(analysis, id=label) for label in ('E1', 'E2', 'E4')]))
+        single.append(prompt)
+        return ok(json.dumps(dict(analysis, summary='single')))
+
+    async def scenario():
+        client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        agent._loop_resources[asyncio.get_running_loop()] = (client, asyncio.Semaphore(4))
+        try:
+            return await agent.summarize_emails_bulk_async(emails, token_budget=100000)
+        finally:
+            await client.aclose()
+
+    results = asyncio.run(scenario())
+
+    assert len(packed) == 1 and len(single) == 1
+    assert 'Subject 2' in single[0]
+    assert results['m2']['summary'] == 'single'
+    assert all(results[f'm{idx}']['summary'] == 'ok' for idx in (0, 1, 3))
+    assert asyncio.run(agent.cache.aget(agent.cache.make_key('summary', emails[0], 1, agent.models[0]))) == results['m0']
@@ -0,0 +1,79 @@
+import os
+
+import pytest
+
+from email_classifier import EmailClassifier, benchmark, load_corpus as load_corpus_file
+
+BULK_CATEGORIES = {'promotional', 'newsletter'}
+CORPUS_PATH = os.path.join(os.path.dirname(__file__), 'fixtures', 'classifier_corpus.json')
+
+
+def load_corpus():
+    return load_corpus_file(CORPUS_PATH)
+
+
+@pytest.fixture
+def classifier(monkeypatch):
+    monkeypatch.setenv('LOCAL_CLASSIFIER', 'true')
+    classifier = EmailClassifier(model_path='no-such-model.pickle', min_confidence=0.9)
+    assert classifier.model is None
+    return classifier
+
+
+def has_promotional_signal(email):
+    precedence = {name.lower(): value for name, value in email['headers'].items()}.get('precedence', '').lower()
+    return 'CATEGORY_PROMOTIONS' in email['labels'] or precedence in ('bulk', 'junk')
+
+
+def test_rules_on_labeled_corpus(classifier):
+    corpus = load_corpus()
+    report = benchmark(classifier, corpus)
+    promotional = [email for email in corpus if email['category'] in BULK_CATEGORIES and has_promotional_signal(email)]
+
+    print(f"rules cover {report['rules']['covered']}/{report['total']}, {report['rules']['correct']} correct")
+    assert report['mistakes'] == []
+    assert report['rules']['covered'] == len(promotional)
+    assert report['model']['covered'] == 0
+
+
+def test_personal_and_work_mail_always_reaches_the_llm(classifier):
+    for email in load_corpus():
+        if email['category'] not in BULK_CATEGORIES:
+            assert classifier.classify(email) is None, email['id']
+
+
+@pytest.mark.parametrize('email_id', ['notification-github-review', 'transactional-shipping', 'transactional-bank-statement'])
+def test_notifications_and_receipts_reach_the_llm(classifier, email_id):
+    email = next(email for email in load_corpus() if email['id'] == email_id)
+    assert classifier.classify(email) is None
+
+
+def test_out_of_office_with_bulk_precedence_is_not_promotional(classifier):
+    email = {
+        'sender': 'Tom Becker <tom.becker@partner.example>',
+        'subject': 'Out of Office: Re: Integration timeline',
+        'body': "I'm out of the office until Monday.",
+        'headers': {'Auto-Submitted': 'auto-replied', 'Precedence': 'bulk'},
+    }
+    assert classifier.classify(email) is None
+
+
+class StubModel:
+    """Always predicts promotional/low with the given confidence"""
+
+    def __init__(self, confidence):
+        self.confidence = confidence
+
+    def predict_proba(self, email):
+        return {'promotional': self.confidence, 'work': 1 - self.confidence}, {'low': self.confidence, 'high': 1 - self.confidence}
+
+
+def test_model_coverage_and_accuracy_are_reported(classifier):
+    classifier.model = StubModel(0.95)
+    corpus = load_corpus()
+    report = benchmark(classifier, corpus)
+
+    assert report['rules']['covered'] + report['model']['covered'] + report['llm_routed'] == report['total']
+    assert report['model']['covered'] > 0
+    assert report['model']['correct'] < report['model']['covered']
+    assert len(report['mistakes']) == report['model']['covered'] - report['model']['correct']
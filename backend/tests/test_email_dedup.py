@@ -0,0 +1,30 @@
+from email_dedup import cluster_emails, fingerprint, shares_analysis
+
+BODY = "Thanks for shopping with us. Your order total of ${amount} will be charged to the card on file today."
+
+
+def order(amount, order_id='A1'):
+    return {
+        'id': f"{order_id}-{amount}",
+        'sender': 'Shop <orders@shop.example>',
+        'subject': f"Order {order_id} confirmed",
+        'body': BODY.replace('{amount}', amount),
+    }
+
+
+def test_exact_key_keeps_numbers():
+    assert fingerprint(order('12.50')).exact != fingerprint(order('9800.00')).exact
+    assert fingerprint(order('12.50')).exact == fingerprint(order('12.50')).exact
+
+
+def test_near_duplicates_differing_in_figures_still_cluster():
+    clusters = cluster_emails([order('12.50'), order('9800.00')])
+    assert [len(cluster) for cluster in clusters] == [2]
+
+
+def test_analysis_quoting_figures_is_not_shared_across_different_figures():
+    first, other = order('12.50'), order('9800.00')
+    assert not shares_analysis(first, other, {'summary': 'Order total is $12.50.'})
+    assert not shares_analysis(first, other, {'summary': 'Order confirmed.', 'key_points': ['Charged $12.50']})
+    assert shares_analysis(first, other, {'summary': 'An order was confirmed and charged.'})
+    assert shares_analysis(first, order('12.50'), {'summary': 'Order total is $12.50.'})
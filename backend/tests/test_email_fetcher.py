@@ -0,0 +1,55 @@
+from email_fetcher import BATCH_SIZE
+
+def test_details_for_many_emails_take_one_round_trip(fetcher, fake_gmail):
+    for idx in range(10):
+        fake_gmail.add_message(f"m{idx}", subject=f"Subject {idx}")
+
+    emails = fetcher.get_emails_details([f"m{idx}" for idx in range(10)])
+
+    assert fake_gmail.round_trips == 1
+    assert [email['id'] for email in emails] == [f"m{idx}" for idx in range(10)]
+    assert emails[3]['subject'] == "Subject 3"
+    assert emails[3]['body'] == "Hi there"
+
+def test_batches_are_split_at_gmail_limit(fetcher, fake_gmail):
+    msg_ids = [f"m{idx}" for idx in range(BATCH_SIZE * 2 + 5)]
+    for msg_id in msg_ids:
+        fake_gmail.add_message(msg_id)
+
+    emails = fetcher.get_emails_details(msg_ids)
+
+    assert [len(batch) for batch in fake_gmail.batches] == [BATCH_SIZE, BATCH_SIZE, 5]
+    assert len(emails) == len(msg_ids)
+
+def test_only_failed_messages_are_retried(fetcher, fake_gmail):
+    for idx in range(5):
+        fake_gmail.add_message(f"m{idx}")
+    fake_gmail.fail_once = {'m1': 503, 'm3': 429}
+
+    emails = fetcher.get_emails_details([f"m{idx}" for idx in range(5)])
+
+    assert fake_gmail.batches == [['m0', 'm1', 'm2', 'm3', 'm4'], ['m1', 'm3']]
+    assert [email['id'] for email in emails] == ['m0', 'm1', 'm2', 'm3', 'm4']
+
+def test_missing_messages_are_dropped_without_retry(fetcher, fake_gmail):
+    fake_gmail.add_message('m0')
+
+    emails = fetcher.get_emails_details(['m0', 'gone'])
+
+    assert fake_gmail.round_trips == 1
+    assert [email['id'] for email in emails] == ['m0']
+
+def test_metadata_mode_returns_listing_entries(fetcher, fake_gmail):
+    fake_gmail.add_message('m0', subject="Invoice", sender="billing@example.com")
+
+    entries = fetcher.get_emails_details(['m0'], metadata_only=True)
+
+    assert entries == [{
+        'id': 'm0',
+        'thread_id': 't-m0',
+        'subject': "Invoice",
+        'sender': "billing@example.com",
+        'date': 'Mon, 1 Jan 2024 10:00:00 +0000',
+        'snippet': "Hi there",
+        'unread': True
+    }]
@@ -0,0 +1,65 @@
+from email_preprocess import clean_body
+
+
+def test_request_mentioning_unsubscribe_is_kept():
+    body = "Hi,\n\nPlease unsubscribe me from the billing list and refund my last charge.\n\nThanks,\nBob"
+    assert clean_body(body) == body
+
+
+def test_trailing_footers_are_dropped():
+    body = (
+        "Big sale this week on shoes.\n\n"
+        "You are receiving this email because you signed up. Unsubscribe here.\n\n"
+        "© 2024 Shoes Inc. All rights reserved."
+    )
+    assert clean_body(body) == "Big sale this week on shoes."
+
+
+def test_footer_wording_before_content_is_kept():
+    body = (
+        "Confidentiality notice: the attached contract is privileged and confidential.\n\n"
+        "Please sign page 3 by Friday."
+    )
+    assert clean_body(body) == body
+
+
+def test_first_paragraph_is_never_dropped():
+    body = "Unsubscribe confirmation: you have been removed from the list."
+    assert clean_body(body) == body
+
+
+def test_forwarded_message_is_kept():
+    body = (
+        "FYI - can you handle this one?\n\n"
+        "---------- Forwarded message ---------\n"
+        "From: Jane Doe <jane@vendor.example>\n"
+        "Date: Mon, 3 Mar 2025 at 09:12\n"
+        "Subject: Contract renewal\n"
+        "To: Bob <bob@acme.example>\n\n"
+        "Hi Bob, our contract expires on March 31. Shall we renew on the same terms?"
+    )
+    cleaned = clean_body(body)
+    assert "our contract expires on March 31" in cleaned
+    assert cleaned.startswith("FYI - can you handle this one?")
+
+
+def test_apple_mail_forward_is_kept():
+    body = (
+        "See below.\n\n"
+        "Begin forwarded message:\n\n"
+        "From: Jane Doe <jane@vendor.example>\n"
+        "Subject: Contract renewal\n"
+        "Date: March 3, 2025\n"
+        "To: Bob <bob@acme.example>\n\n"
+        "The new price list is attached."
+    )
+    assert "The new price list is attached." in clean_body(body)
+
+
+def test_reply_history_is_still_cut():
+    body = (
+        "Sounds good, see you then.\n\n"
+        "On Mon, 3 Mar 2025 at 09:12, Jane Doe <jane@vendor.example> wrote:\n"
+        "> Shall we meet at 3?"
+    )
+    assert clean_body(body) == "Sounds good, see you then."
@@ -0,0 +1,16 @@
+from email_stats import _carry_over, empty_stats
+
+
+def stats(total, high=0, work=0):
+    result = empty_stats()
+    result['total'] = total
+    result['urgency']['High'] = high
+    result['category']['Work'] = work
+    return result
+
+
+def test_increments_made_during_a_rebuild_are_carried_over():
+    recount = stats(10, high=2, work=5)   # emails in the snapshot
+    counted = stats(3, high=1, work=1)    # counters in the same snapshot (history never counted)
+    current = stats(5, high=2, work=1)    # two emails stored while the scan ran
+    assert _carry_over(recount, current, counted) == stats(12, high=3, work=5)
@@ -0,0 +1,81 @@
+import asyncio
+
+import pytest
+from google.api_core.exceptions import AlreadyExists
+
+from firestore_writer import BatchWriter
+
+
+class FakeBatch:
+    def __init__(self, db):
+        self.db = db
+        self.operations = []
+
+    def create(self, doc_ref, data):
+        self.operations.append(('create', doc_ref, data))
+
+    def set(self, doc_ref, data, merge=False):
+        self.operations.append(('set', doc_ref, data))
+
+    def commit(self):
+        # Atomic like Firestore: one create of an existing document fails the whole batch
+        if any(kind == 'create' and doc_ref in self.db.docs for kind, doc_ref, _ in self.operations):
+            raise AlreadyExists("Document already exists")
+        for kind, doc_ref, data in self.operations:
+            self.db.docs.setdefault(doc_ref, []).append(data)
+        self.db.commits.append(self.operations)
+
+
+class FakeDB:
+    def __init__(self, docs=()):
+        self.docs = {doc_ref: [] for doc_ref in docs}
+        self.commits = []
+
+    def batch(self):
+        return FakeBatch(self)
+
+
+def test_size_triggered_flush_is_tracked_until_done():
+    db = FakeDB()
+
+    async def scenario():
+        writer = BatchWriter(db, max_batch_size=2, flush_interval=60)
+        await writer.set('doc-1', {'n': 1}, wait=False)
+        await writer.set('doc-2', {'n': 2}, wait=False)
+        assert len(writer._flush_tasks) == 1
+        await asyncio.gather(*writer._flush_tasks)
+        assert not writer._flush_tasks
+
+    asyncio.run(scenario())
+    assert db.commits == [[('set', 'doc-1', {'n': 1}), ('set', 'doc-2', {'n': 2})]]
+
+
+def test_create_applies_merges_only_for_new_documents():
+    db = FakeDB(docs=['email-old'])
+
+    async def scenario():
+        writer = BatchWriter(db, max_batch_size=500, flush_interval=60)
+        new = asyncio.ensure_future(writer.create('email-new', {'n': 1}, merges=[('stats', {'total': 1})]))
+        old = asyncio.ensure_future(writer.create('email-old', {'n': 2}, merges=[('stats', {'total': 1})]))
+        await asyncio.sleep(0)
+        await writer.flush()
+        await new
+        with pytest.raises(AlreadyExists):
+            await old
+
+    asyncio.run(scenario())
+    assert db.docs['stats'] == [{'total': 1}]
+    assert db.docs['email-new'] == [{'n': 1}]
+
+
+def test_chunks_count_every_write_of_a_create():
+    db = FakeDB()
+
+    async def scenario():
+        writer = BatchWriter(db, max_batch_size=5, flush_interval=60)
+        for idx in range(3):
+            await writer.create(f'email-{idx}', {}, merges=[('stats', {}), ('daily', {})], wait=False)
+        await writer.flush()
+
+    asyncio.run(scenario())
+    assert [len(operations) for operations in db.commits] == [3, 3, 3]
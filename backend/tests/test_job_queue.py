@@ -0,0 +1,31 @@
+import asyncio
+
+from credential_store import GmailNotAuthorized
+from job_queue import JobQueue
+
+
+async def _run(handler):
+    queue = JobQueue(workers=1)
+    await queue.start()
+    job = queue.submit('user-1', 'fetch', handler)
+    await queue._queue.join()
+    await queue.stop()
+    return job.to_dict()
+
+
+def test_failed_job_reports_error_code():
+    async def handler(job):
+        raise GmailNotAuthorized("No Gmail credentials stored for user user-1")
+
+    result = asyncio.run(_run(handler))
+    assert result['status'] == 'failed'
+    assert result['error_code'] == 'gmail_not_authorized'
+
+
+def test_other_failures_have_no_error_code():
+    async def handler(job):
+        raise RuntimeError("boom")
+
+    result = asyncio.run(_run(handler))
+    assert result['status'] == 'failed'
+    assert result['error_code'] is None
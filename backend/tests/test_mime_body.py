@@ -0,0 +1,91 @@
+import base64
+
+import pytest
+
+import mime_body
+from mime_body import benchmark, extract_text, newsletter_payload
+
+
+def part(mime_type, text, charset='utf-8', filename=None):
+    data = base64.urlsafe_b64encode(text.encode(charset)).decode().rstrip('=')
+    result = {
+        'mimeType': mime_type,
+        'headers': [{'name': 'Content-Type', 'value': f'{mime_type}; charset="{charset}"'}],
+        'body': {'data': data}
+    }
+    if filename:
+        result['filename'] = filename
+    return result
+
+
+def test_plain_text_nested_in_alternative_inside_mixed_is_found():
+    payload = {'mimeType': 'multipart/mixed', 'body': {'size': 0}, 'parts': [
+        {'mimeType': 'multipart/alternative', 'body': {'size': 0}, 'parts': [
+            part('text/html', '<p>HTML version</p>'),
+            part('text/plain', 'Plain version'),
+        ]},
+        part('application/pdf', 'binary', filename='invoice.pdf'),
+    ]}
+
+    assert extract_text(payload) == 'Plain version'
+
+
+def test_attachments_are_skipped():
+    payload = {'mimeType': 'multipart/mixed', 'parts': [
+        part('text/plain', 'Attached notes', filename='notes.txt'),
+        part('text/html', '<p>The actual <b>message</b></p>'),
+    ]}
+
+    assert extract_text(payload) == 'The actual message'
+
+
+@pytest.mark.parametrize('charset', ['iso-8859-1', 'windows-1252', 'utf-8'])
+def test_declared_charset_is_decoded(charset):
+    payload = part('text/plain', 'Café crème à bientôt', charset)
+
+    assert extract_text(payload) == 'Café crème à bientôt'
+
+
+def test_unknown_charset_falls_back_to_utf8():
+    payload = part('text/plain', 'naïve text')
+    payload['headers'] = [{'name': 'Content-Type', 'value': 'text/plain; charset="x-unknown"'}]
+
+    assert extract_text(payload) == 'naïve text'
+
+
+def test_decoding_stops_once_the_budget_is_full(monkeypatch):
+    chunk_chars = mime_body.DECODE_CHUNK_CHARS
+    payload = part('text/plain', 'word ' * (chunk_chars * 4))
+    decoded = []
+    original = mime_body.iter_decoded
+
+    def counting(part):
+        for text in original(part):
+            decoded.append(text)
+            yield text
+
+    monkeypatch.setattr(mime_body, 'iter_decoded', counting)
+
+    text = extract_text(payload, limit=100)
+
+    assert len(text) == 100
+    assert len(decoded) == 1
+    assert len(payload['body']['data']) > chunk_chars * 4
+
+
+def test_html_script_and_style_are_stripped_and_blocks_break_lines():
+    html = (
+        '<html><head><title>Digest</title><style>p { color: red; }</style></head>'
+        '<body><script>track("open")</script><h1>Hello</h1><p>First&nbsp;line</p>'
+        '<div>Second <span>line</span></div><noscript>Enable JS</noscript></body></html>'
+    )
+
+    assert extract_text(part('text/html', html)) == 'Hello\n\nFirst line\n\nSecond line'
+
+
+def test_streaming_extraction_beats_beautifulsoup_on_a_newsletter():
+    pytest.importorskip('bs4')
+
+    results = benchmark(newsletter_payload(300), rounds=5)
+
+    assert results['streaming'] < results['beautifulsoup']
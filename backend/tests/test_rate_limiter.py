@@ -0,0 +1,51 @@
+import asyncio
+
+from rate_limiter import RateLimiter
+
+
+def test_retry_after_is_not_cut_to_max_backoff():
+    limiter = RateLimiter(max_backoff=30, max_retry_after=300)
+    assert limiter.backoff('gemini-test', 0, retry_after='120') == 120
+
+
+def test_retry_after_has_its_own_cap():
+    limiter = RateLimiter(max_backoff=30, max_retry_after=300)
+    assert limiter.backoff('gemini-test', 0, retry_after='3600') == 300
+
+
+def test_exponential_backoff_is_capped():
+    limiter = RateLimiter(base_backoff=1, max_backoff=30)
+    assert 15 <= limiter.backoff('gemini-test', 10) <= 30
+
+
+def test_throttle_pauses_model_for_retry_after():
+    limiter = RateLimiter(max_backoff=30, max_retry_after=300)
+    limiter.backoff('gemini-test', 0, retry_after='120', throttled=True)
+    assert limiter.stats()['models']['gemini-test']['paused_seconds'] > 100
+
+
+def test_waiting_callers_are_woken_in_turn_not_polled():
+    limiter = RateLimiter()
+    limiter.backoff('gemini-test', 0, retry_after='0.2', throttled=True)
+    quota = limiter._quota('gemini-test')
+    checks = []
+    try_take = quota.try_take
+
+    def counting_try_take(*args):
+        checks.append(args[0])
+        return try_take(*args)
+
+    quota.try_take = counting_try_take
+    served = []
+
+    async def call(user_id):
+        await limiter.acquire('gemini-test', 10, user_id)
+        served.append(user_id)
+
+    async def scenario():
+        await asyncio.gather(*(call(user_id) for user_id in ['a', 'a', 'a', 'b', 'b', 'c']))
+
+    asyncio.run(scenario())
+    # Round-robin across users, and each caller is checked a handful of times rather than every 20ms
+    assert served == ['a', 'b', 'c', 'a', 'b', 'a']
+    assert len(checks) <= 3 * 6
@@ -0,0 +1,36 @@
+import asyncio
+import sqlite3
+
+import summary_cache
+from summary_cache import SummaryCache
+
+
+def test_disk_tier_survives_restart(tmp_path):
+    path = str(tmp_path / 'cache.db')
+    cache = SummaryCache(max_entries=10, ttl_seconds=60, db_path=path, max_disk_entries=100)
+    cache.set('k1', {'summary': 'hello'})
+    cache.close()
+
+    reopened = SummaryCache(max_entries=10, ttl_seconds=60, db_path=path, max_disk_entries=100)
+    assert asyncio.run(reopened.aget('k1')) == {'summary': 'hello'}
+    assert reopened.disk_hits == 1
+    assert asyncio.run(reopened.aget('missing')) is None
+    reopened.close()
+
+
+def test_eviction_is_batched(tmp_path, monkeypatch):
+    monkeypatch.setattr(summary_cache, 'DISK_EVICT_INTERVAL', 5)
+    path = str(tmp_path / 'cache.db')
+    cache = SummaryCache(max_entries=100, ttl_seconds=60, db_path=path, max_disk_entries=3)
+    for idx in range(4):
+        cache.set(f'k{idx}', idx)
+    cache.close()
+
+    # Below the eviction interval nothing is trimmed yet
+    assert sqlite3.connect(path).execute("SELECT COUNT(*) FROM cache").fetchone()[0] == 4
+
+    cache = SummaryCache(max_entries=100, ttl_seconds=60, db_path=path, max_disk_entries=3)
+    for idx in range(4, 9):
+        cache.set(f'k{idx}', idx)
+    cache.close()
+    assert sqlite3.connect(path).execute("SELECT COUNT(*) FROM cache").fetchone()[0] == 3
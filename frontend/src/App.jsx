@@ -305,8 +305,8 @@ function InboxPage() {
       
       if (err.code === 'ECONNABORTED') {
         setError('Request timeout. Gmail authentication may be needed. Check backend terminal.');
-      } else if (err.response?.status === 401) {
-        setError('Gmail not authorized. Please complete OAuth flow in backend terminal.');
+      } else if (err.response?.status === 401 || err.code === 'gmail_not_authorized') {
+        setError('Gmail not authorized. Run "python credential_store.py authorize <your uid>" in the backend.');
       } else {
         setError('Unable to fetch emails. Using demo data.');
       }
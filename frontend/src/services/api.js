@@ -2,6 +2,8 @@ import axios from 'axios';
 import { auth } from '../firebase';
 
 const API_BASE_URL = import.meta.env.VITE_API_BASE_URL || 'http://localhost:8000';
+const JOB_POLL_INTERVAL = 1500; // ms between background job status checks
+const JOB_MAX_WAIT = 300000; // give up polling a job after 5 minutes
 
 const apiClient = axios.create({
   baseURL: API_BASE_URL,
@@ -71,18 +73,56 @@ export const emailAPI = {
   },
 
   fetchEmails: async (userId, maxResults = 10) => {
+    // The backend queues a job and returns its ID; poll until it finishes
     const response = await apiClient.post('/api/gmail/fetch', {
       user_id: userId,
       max_results: maxResults
-    }, {
-      timeout: 180000 // 3 minutes for fetching multiple emails
     });
+
+    let job = response.data;
+    const deadline = Date.now() + JOB_MAX_WAIT;
+    while (job.status === 'queued' || job.status === 'running') {
+      if (Date.now() > deadline) {
+        const error = new Error('Email processing is taking too long');
+        error.code = 'ECONNABORTED';
+        throw error;
+      }
+      await new Promise((resolve) => setTimeout(resolve, JOB_POLL_INTERVAL));
+      job = await emailAPI.getJob(job.job_id);
+    }
+
+    if (job.status === 'failed') {
+      // Job failures have no HTTP status - error_code says why (e.g. 'gmail_not_authorized')
+      const error = new Error(job.error || 'Email processing failed');
+      error.code = job.error_code;
+      throw error;
+    }
+
+    return {
+      success: true,
+      emails_processed: job.processed,
+      emails: job.results,
+      message: job.message
+    };
+  },
+
+  listInbox: async ({ maxResults = 20, unreadOnly = false } = {}) => {
+    // Headers and snippets only - cheap enough to call on every inbox view
+    const response = await apiClient.get('/api/gmail/inbox', {
+      params: { max_results: maxResults, unread_only: unreadOnly }
+    });
+    return response.data;
+  },
+
+  getJob: async (jobId) => {
+    const response = await apiClient.get(`/api/jobs/${jobId}`);
     return response.data;
   },
 
-  getSummaries: async (userId, limit = 50) => {
+  getSummaries: async (userId, limit = 50, { cursor, fields, compact } = {}) => {
+    // Pass the previous page's next_cursor to load the following page
     const response = await apiClient.get(`/api/summaries/${userId}`, {
-      params: { limit }
+      params: { limit, cursor, fields, compact }
     });
     return response.data;
   },
@@ -92,6 +132,13 @@ export const emailAPI = {
     return response.data;
   },
 
+  getAnalyticsTrends: async (userId, { start, end, granularity = 'day' } = {}) => {
+    const response = await apiClient.get(`/api/analytics/${userId}/trends`, {
+      params: { start, end, granularity }
+    });
+    return response.data;
+  },
+
   updatePreferences: async (preferences) => {
     const response = await apiClient.post('/api/user/preferences', preferences);
     return response.data;